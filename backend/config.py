@@ -0,0 +1,200 @@
+"""
+Настройки приложения (переопределяются переменными окружения)
+"""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# --- База данных ---
+
+DATABASE_PATH = os.environ.get('DATABASE_PATH')
+
+# Количество соединений SQLite в пуле
+DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 8)
+
+# Максимальное время ожидания свободного соединения (секунды)
+DB_POOL_TIMEOUT = _env_float('DB_POOL_TIMEOUT', 5.0)
+
+# Размер кэша подготовленных выражений на одно соединение
+DB_STATEMENT_CACHE_SIZE = _env_int('DB_STATEMENT_CACHE_SIZE', 128)
+
+# Запись через единственный поток-писатель с групповой фиксацией
+DB_WRITE_QUEUE_ENABLED = os.environ.get('DB_WRITE_QUEUE_ENABLED', '1') not in ('0', 'false', 'no')
+
+# Максимальная длина очереди записи; при заполнении вызывающий ждет
+# не дольше DB_WRITE_QUEUE_TIMEOUT секунд
+DB_WRITE_QUEUE_SIZE = _env_int('DB_WRITE_QUEUE_SIZE', 10000)
+DB_WRITE_QUEUE_TIMEOUT = _env_float('DB_WRITE_QUEUE_TIMEOUT', 5.0)
+
+# Максимум операций в одной транзакции и время ожидания новых операций (секунды)
+DB_WRITE_BATCH_SIZE = _env_int('DB_WRITE_BATCH_SIZE', 256)
+DB_WRITE_FLUSH_INTERVAL = _env_float('DB_WRITE_FLUSH_INTERVAL', 0.002)
+
+# Максимальное ожидание результата операции записи (секунды)
+DB_WRITE_RESULT_TIMEOUT = _env_float('DB_WRITE_RESULT_TIMEOUT', 30.0)
+
+# Профиль хранилища SQLite: 'durable' или 'throughput'
+# (см. infrastructure/sqlite_profile.py); throughput включается явно
+DB_STORAGE_PROFILE = os.environ.get('DB_STORAGE_PROFILE', 'durable')
+
+# Количество потоков для блокирующих операций (SQLite, файлы),
+# вызываемых из асинхронных обработчиков
+BLOCKING_EXECUTOR_WORKERS = _env_int('BLOCKING_EXECUTOR_WORKERS', DB_POOL_SIZE)
+
+
+# --- Каталог продуктов ---
+
+# Размер страницы каталога по умолчанию и максимальный размер
+CATALOG_PAGE_SIZE = _env_int('CATALOG_PAGE_SIZE', 50)
+CATALOG_MAX_PAGE_SIZE = _env_int('CATALOG_MAX_PAGE_SIZE', 500)
+
+
+# --- Загрузка моделей ---
+
+# Максимальный размер файла модели (байты)
+MODEL_UPLOAD_MAX_BYTES = _env_int('MODEL_UPLOAD_MAX_BYTES', 1024 * 1024 * 1024)
+
+# Размер блока при копировании загружаемого файла на диск (байты)
+MODEL_UPLOAD_CHUNK_SIZE = _env_int('MODEL_UPLOAD_CHUNK_SIZE', 1024 * 1024)
+
+
+# --- Журнал взаимодействий ---
+
+# Каталог сегментов журнала (по умолчанию backend/interaction_log)
+INTERACTION_LOG_DIR = os.environ.get(
+    'INTERACTION_LOG_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interaction_log'))
+
+# Длительность временного окна одного сегмента (секунды)
+INTERACTION_LOG_SEGMENT_SECONDS = _env_int('INTERACTION_LOG_SEGMENT_SECONDS', 3600)
+
+# Сброс буфера на диск: по количеству записей и по времени (секунды)
+INTERACTION_LOG_FLUSH_EVERY = _env_int('INTERACTION_LOG_FLUSH_EVERY', 256)
+INTERACTION_LOG_FLUSH_INTERVAL = _env_float('INTERACTION_LOG_FLUSH_INTERVAL', 1.0)
+
+# Запись взаимодействий на диск (fsync) до ответа клиенту; по умолчанию - при профиле durable
+INTERACTION_LOG_FSYNC = os.environ.get(
+    'INTERACTION_LOG_FSYNC', '1' if DB_STORAGE_PROFILE == 'durable' else '0'
+) not in ('0', 'false', 'no')
+
+# Период фонового уплотнения закрытых сегментов (секунды)
+INTERACTION_LOG_COMPACTION_INTERVAL = _env_float('INTERACTION_LOG_COMPACTION_INTERVAL', 300.0)
+
+
+# --- Кэш движков симуляции ---
+
+# Максимальное число движков в памяти (0 - кэш отключен)
+ENGINE_CACHE_SIZE = _env_int('ENGINE_CACHE_SIZE', 1024)
+
+# Время жизни неиспользуемого движка (секунды)
+ENGINE_CACHE_TTL = _env_float('ENGINE_CACHE_TTL', 600.0)
+
+# Период отложенной записи измененных состояний (секунды)
+ENGINE_CACHE_FLUSH_INTERVAL = _env_float('ENGINE_CACHE_FLUSH_INTERVAL', 5.0)
+
+
+# --- Кэш скомпилированных сценариев ---
+
+# Максимальное число сценариев в памяти (0 - кэш отключен)
+SCENARIO_CACHE_SIZE = _env_int('SCENARIO_CACHE_SIZE', 4096)
+
+
+# --- Агрегаты взаимодействий ---
+
+# Длительность временного интервала агрегатов (секунды)
+ROLLUP_BUCKET_SECONDS = _env_int('ROLLUP_BUCKET_SECONDS', 3600)
+
+# Период догоняющей агрегации (секунды)
+ROLLUP_INTERVAL = _env_float('ROLLUP_INTERVAL', 10.0)
+
+
+# Число интервалов тепловой карты кликов по каждой оси (по умолчанию и максимум)
+ANALYTICS_HEATMAP_BINS = _env_int('ANALYTICS_HEATMAP_BINS', 32)
+ANALYTICS_MAX_HEATMAP_BINS = _env_int('ANALYTICS_MAX_HEATMAP_BINS', 512)
+
+# Число продуктов, столбцы событий и распределения которых хранятся в памяти,
+# и общий предел событий в памяти (давно запрошенные продукты вытесняются)
+ANALYTICS_CACHE_SIZE = _env_int('ANALYTICS_CACHE_SIZE', 128)
+ANALYTICS_MAX_EVENTS = _env_int('ANALYTICS_MAX_EVENTS', 2000000)
+
+
+# --- Выгрузка данных ---
+
+# Число строк в одной части столбцов выгрузки (ограничивает используемую память)
+EXPORT_CHUNK_ROWS = _env_int('EXPORT_CHUNK_ROWS', 65536)
+
+
+# --- Завершение брошенных сеансов ---
+
+# Активный сеанс без взаимодействий дольше указанного времени завершается (секунды; 0 - не завершать)
+SESSION_IDLE_TTL = _env_float('SESSION_IDLE_TTL', 3600.0)
+
+# Период проверки (секунды) и число сеансов в одной транзакции
+SESSION_REAPER_INTERVAL = _env_float('SESSION_REAPER_INTERVAL', 60.0)
+SESSION_REAPER_BATCH_SIZE = _env_int('SESSION_REAPER_BATCH_SIZE', 100)
+
+
+# --- Несколько рабочих процессов ---
+
+# Число рабочих процессов сервера (python main.py); 1 - один процесс
+WORKERS = _env_int('WORKERS', 1)
+
+# Рабочий процесс i дополнительно слушает 127.0.0.1:WORKER_INTERNAL_PORT + i
+# (на этот порт пересылаются запросы сеансов, закрепленных за процессом)
+WORKER_INTERNAL_PORT = _env_int('WORKER_INTERNAL_PORT', 9100)
+
+# Номер рабочего процесса и их число - задаются запускающим процессом
+WORKER_INDEX = _env_int('WORKER_INDEX', 0)
+WORKER_COUNT = _env_int('WORKER_COUNT', 1)
+
+# Период опроса изменений для сброса кэшей других процессов (секунды)
+CACHE_SYNC_INTERVAL = _env_float('CACHE_SYNC_INTERVAL', 0.5)
+
+# Время хранения записей об изменениях (секунды)
+CACHE_CHANGES_RETENTION = _env_float('CACHE_CHANGES_RETENTION', 3600.0)
+
+
+# --- Серверный прогон сценариев ---
+
+# Исполнитель прогонов: 'process' (пул процессов, все ядра) или 'thread'
+SCENARIO_RUNNER_MODE = os.environ.get('SCENARIO_RUNNER_MODE', 'process')
+
+# Число рабочих процессов (потоков) прогона
+SCENARIO_RUNNER_WORKERS = _env_int('SCENARIO_RUNNER_WORKERS', os.cpu_count() or 1)
+
+# Максимум виртуальных сеансов в одном прогоне и одновременных прогонов
+SCENARIO_RUNNER_MAX_SESSIONS = _env_int('SCENARIO_RUNNER_MAX_SESSIONS', 10000)
+SCENARIO_RUNNER_MAX_ACTIVE = _env_int('SCENARIO_RUNNER_MAX_ACTIVE', 2)
+
+# Число сеансов в одной задаче рабочего (отмена вступает в силу между задачами)
+SCENARIO_RUNNER_CHUNK_SIZE = _env_int('SCENARIO_RUNNER_CHUNK_SIZE', 25)
+
+# Период выдачи прогресса в потоке событий прогона (секунды)
+SCENARIO_RUNNER_PROGRESS_INTERVAL = _env_float('SCENARIO_RUNNER_PROGRESS_INTERVAL', 0.5)
+
+# Число завершенных прогонов, результаты которых хранятся в памяти
+SCENARIO_RUNNER_HISTORY = _env_int('SCENARIO_RUNNER_HISTORY', 100)
+
+
+# Число последних взаимодействий, хранимых в состоянии сеанса
+# (полная история - в журнале взаимодействий)
+SESSION_RECENT_INTERACTIONS = _env_int('SESSION_RECENT_INTERACTIONS', 32)
+
+# Снимок состояния сеанса в базу - раз в указанное число событий журнала
+# (а также при инициализации и завершении); остальное восстанавливается из журнала
+SESSION_SNAPSHOT_EVERY = _env_int('SESSION_SNAPSHOT_EVERY', 50)
+
+# Повторы операции сеанса при конфликте версий состояния (запись другим процессом)
+SESSION_CONFLICT_RETRIES = _env_int('SESSION_CONFLICT_RETRIES', 3)
+
+# Максимальное число взаимодействий в одном пакете /interact/batch
+SIMULATION_BATCH_MAX_SIZE = _env_int('SIMULATION_BATCH_MAX_SIZE', 1000)
@@ -4,6 +4,7 @@
 from .auth_controller import AuthController
 from .product_controller import ProductController
 from .simulation_controller import SimulationController
+from .run_controller import ScenarioRunController
 
-__all__ = ['AuthController', 'ProductController', 'SimulationController']
+__all__ = ['AuthController', 'ProductController', 'SimulationController', 'ScenarioRunController']
 
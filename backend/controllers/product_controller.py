@@ -1,17 +1,28 @@
 import json
 import os
 from fastapi import HTTPException, UploadFile, File, Form
-from typing import Optional
-from services.product_service import ProductService
-from infrastructure.database_repository import DatabaseRepository
+from fastapi.responses import StreamingResponse
+from typing import Optional, AsyncIterator
+import config
+from infrastructure.async_repository import AsyncProxy, AsyncDatabaseRepository
+from infrastructure.file_storage import FileTooLargeError
 
 
 class ProductController:
     """Контроллер для обработки запросов продуктов"""
     
-    def __init__(self, product_service: ProductService, db_repository: DatabaseRepository):
+    def __init__(self, product_service: AsyncProxy, db_repository: AsyncDatabaseRepository,
+                 interaction_rollups: Optional[AsyncProxy] = None,
+                 interaction_analytics: Optional[AsyncProxy] = None,
+                 columnar_exporter=None):
+        # product_service, interaction_rollups и interaction_analytics -
+        # асинхронные обертки над сервисами; columnar_exporter - синхронный
+        # генератор выгрузки, StreamingResponse выполняет его в пуле потоков
         self.product_service = product_service
         self.db = db_repository
+        self.interaction_rollups = interaction_rollups
+        self.interaction_analytics = interaction_analytics
+        self.columnar_exporter = columnar_exporter
     
     async def upload_product(self, name: str, description: Optional[str], owner_id: int,
                            model_file: Optional[UploadFile], characteristics: Optional[str],
@@ -24,78 +35,150 @@ class ProductController:
             'scenarios': json.loads(scenarios) if scenarios else []
         }
         
-        model_file_content = None
-        model_filename = None
-        if model_file:
-            model_file_content = await model_file.read()
-            model_filename = model_file.filename
-        
-        result = self.product_service.upload_product(
-            owner_id=owner_id,
-            product_data=product_data,
-            model_file=model_file_content,
-            model_filename=model_filename
-        )
+        # Файл модели не читается в память: сервис копирует его на диск
+        # блоками в пуле потоков, считая размер и хеш в том же проходе
+        try:
+            result = await self.product_service.upload_product(
+                owner_id=owner_id,
+                product_data=product_data,
+                model_filename=model_file.filename if model_file else None,
+                model_stream=model_file.file if model_file else None
+            )
+        except FileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         if not result['success']:
             raise HTTPException(status_code=400, detail=result.get('message'))
         
         return result
     
-    def get_products(self, owner_id: Optional[int] = None) -> list:
+    async def get_products(self, owner_id: Optional[int] = None,
+                           include_scenarios: bool = True) -> list:
         """Получение списка всех доступных продуктов или продуктов владельца"""
         if owner_id:
-            products = self.db.get_products_by_owner(owner_id)
-            result = []
-            for product in products:
-                product_dict = dict(product)
-                product_dict['scenarios'] = self.db.get_scenarios_by_product(product['id'])
-                product_dict['characteristics'] = self.db.get_product_characteristics(product['id'])
-                result.append(product_dict)
-            return result
+            return await self.product_service.get_owner_products(owner_id)
         else:
-            products = self.product_service.get_all_available_products()
+            products = await self.product_service.get_all_available_products(include_scenarios)
             return products
     
-    def get_product(self, product_id: int) -> dict:
+    @staticmethod
+    def _page_limit(limit: Optional[int]) -> int:
+        """Проверка размера страницы каталога"""
+        if limit is None:
+            return config.CATALOG_PAGE_SIZE
+        if limit < 1:
+            raise HTTPException(status_code=400, detail="limit должен быть положительным")
+        return min(limit, config.CATALOG_MAX_PAGE_SIZE)
+    
+    async def get_products_page(self, limit: Optional[int], cursor: Optional[str],
+                                include_scenarios: bool) -> dict:
+        """Страница каталога: {items, next_cursor}"""
+        try:
+            return await self.product_service.get_available_products_page(
+                self._page_limit(limit), cursor, include_scenarios)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    async def stream_products(self, limit: Optional[int], cursor: Optional[str],
+                              include_scenarios: bool) -> StreamingResponse:
+        """Потоковая выдача каталога в формате NDJSON (страницами по limit продуктов)"""
+        page_limit = self._page_limit(limit)
+        # Первая страница читается до начала ответа, чтобы ошибки курсора вернулись как 400
+        first_page = await self.get_products_page(page_limit, cursor, include_scenarios)
+        
+        async def lines() -> AsyncIterator[str]:
+            page = first_page
+            while True:
+                for product in page['items']:
+                    yield json.dumps(product, ensure_ascii=False, default=str) + '\n'
+                if not page['next_cursor']:
+                    break
+                page = await self.product_service.get_available_products_page(
+                    page_limit, page['next_cursor'], include_scenarios)
+        
+        return StreamingResponse(lines(), media_type='application/x-ndjson')
+    
+    async def get_product(self, product_id: int) -> dict:
         """Получение детальной информации о продукте"""
-        product = self.product_service.get_product_with_details(product_id)
+        product = await self.product_service.get_product_with_details(product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Продукт не найден")
         return product
     
-    def get_product_scenarios(self, product_id: int) -> list:
+    async def get_product_scenarios(self, product_id: int) -> list:
         """Получение сценариев для продукта"""
-        scenarios = self.db.get_scenarios_by_product(product_id)
+        scenarios = await self.db.get_scenarios_by_product(product_id)
         return scenarios
     
-    def update_product(self, product_id: int, name: Optional[str], description: Optional[str],
-                      owner_id: int) -> dict:
+    async def _check_analytics_access(self, product_id: int, owner_id: int):
+        """Аналитика продукта доступна только его владельцу"""
+        product = await self.db.get_product(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Продукт не найден")
+        
+        if product['owner_id'] != owner_id:
+            raise HTTPException(status_code=403, detail="Нет доступа к аналитике этого продукта")
+    
+    async def get_product_analytics(self, product_id: int, owner_id: int,
+                                    start: Optional[float], end: Optional[float]) -> dict:
+        """Сводка взаимодействий продукта"""
+        await self._check_analytics_access(product_id, owner_id)
+        return await self.interaction_rollups.get_product_analytics(product_id, start, end)
+    
+    async def get_product_distributions(self, product_id: int, owner_id: int,
+                                        bins: Optional[int]) -> dict:
+        """Распределения взаимодействий продукта (требуется numpy)"""
+        if bins is not None and not 1 <= bins <= config.ANALYTICS_MAX_HEATMAP_BINS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"bins должен быть от 1 до {config.ANALYTICS_MAX_HEATMAP_BINS}")
+        await self._check_analytics_access(product_id, owner_id)
+        try:
+            return await self.interaction_analytics.get_product_distributions(product_id, bins)
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    
+    async def export_product(self, product_id: int, owner_id: int, start: Optional[float],
+                             end: Optional[float]) -> StreamingResponse:
+        """Потоковая выгрузка сеансов и взаимодействий продукта в столбцы .npy (tar)"""
+        if start is not None and end is not None and start >= end:
+            raise HTTPException(status_code=400, detail="start должен быть меньше end")
+        await self._check_analytics_access(product_id, owner_id)
+        return StreamingResponse(
+            self.columnar_exporter.export(product_id, start, end),
+            media_type='application/x-tar',
+            headers={'Content-Disposition':
+                     f'attachment; filename="product-{product_id}-export.tar"'})
+    
+    async def update_product(self, product_id: int, name: Optional[str], description: Optional[str],
+                            owner_id: int) -> dict:
         """Обновление продукта"""
-        product = self.db.get_product(product_id)
+        product = await self.db.get_product(product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Продукт не найден")
         
         if product['owner_id'] != owner_id:
             raise HTTPException(status_code=403, detail="Нет доступа к редактированию этого продукта")
         
-        self.db.update_product(product_id, name=name, description=description)
+        await self.product_service.update_product(product_id, name=name, description=description)
         return {"success": True, "message": "Продукт обновлен"}
     
-    def delete_product(self, product_id: int, owner_id: int) -> dict:
+    async def delete_product(self, product_id: int, owner_id: int) -> dict:
         """Удаление продукта"""
-        product = self.db.get_product(product_id)
+        product = await self.db.get_product(product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Продукт не найден")
         
         if product['owner_id'] != owner_id:
             raise HTTPException(status_code=403, detail="Нет доступа к удалению этого продукта")
         
-        self.db.delete_product(product_id)
+        await self.product_service.delete_product(product_id)
         return {"success": True, "message": "Продукт удален"}
     
-    def get_scenario_templates(self) -> list:
+    async def get_scenario_templates(self) -> list:
         """Получение шаблонов сценариев"""
-        templates = self.product_service.get_scenario_templates()
+        templates = await self.product_service.get_scenario_templates()
         return templates
 
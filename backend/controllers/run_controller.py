@@ -0,0 +1,82 @@
+import asyncio
+import json
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator
+from pydantic import BaseModel
+import config
+from infrastructure.async_repository import AsyncProxy, AsyncDatabaseRepository
+from services.scenario_runner import ScenarioRunnerBusyError
+
+
+class ScenarioRunRequest(BaseModel):
+    user_id: int
+    product_id: int
+    scenario_id: int
+    sessions: int
+
+
+class ScenarioRunController:
+    """Контроллер серверных прогонов сценариев"""
+
+    def __init__(self, scenario_runner: AsyncProxy, product_service: AsyncProxy,
+                 db_repository: AsyncDatabaseRepository):
+        # scenario_runner и product_service - асинхронные обертки над сервисами
+        self.scenario_runner = scenario_runner
+        self.product_service = product_service
+        self.db = db_repository
+
+    async def start_run(self, request: ScenarioRunRequest) -> dict:
+        """Запуск прогона сценария продукта на request.sessions виртуальных сеансах"""
+        product = await self.db.get_product(request.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Продукт не найден")
+        if product['owner_id'] != request.user_id:
+            raise HTTPException(status_code=403, detail="Нет доступа к прогону сценариев этого продукта")
+
+        try:
+            scenario = await self.product_service.get_compiled_scenario(request.scenario_id)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Некорректный сценарий: {e}")
+        if not scenario or scenario.product_id != request.product_id:
+            raise HTTPException(status_code=404, detail="Сценарий не найден")
+
+        try:
+            return await self.scenario_runner.start_run(
+                request.user_id, product, scenario, request.sessions)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ScenarioRunnerBusyError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+
+    async def get_run(self, run_id: int) -> dict:
+        """Прогресс и результаты прогона"""
+        run = await self.scenario_runner.get_run(run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Прогон не найден")
+        return run
+
+    async def cancel_run(self, run_id: int) -> dict:
+        """Отмена прогона"""
+        run = await self.scenario_runner.cancel_run(run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Прогон не найден")
+        return run
+
+    async def stream_run(self, run_id: int) -> StreamingResponse:
+        """Поток прогресса прогона в формате NDJSON: строка при каждом изменении до завершения"""
+        first = await self.get_run(run_id)
+
+        async def lines() -> AsyncIterator[str]:
+            run = first
+            version = None
+            while run is not None:
+                if run['version'] != version:
+                    version = run['version']
+                    yield json.dumps(run, ensure_ascii=False) + '\n'
+                if run['status'] in ('completed', 'cancelled', 'failed'):
+                    break
+                await asyncio.sleep(config.SCENARIO_RUNNER_PROGRESS_INTERVAL)
+                run = await self.scenario_runner.get_run(run_id)
+
+        return StreamingResponse(lines(), media_type='application/x-ndjson')
@@ -1,11 +1,11 @@
 import json
 import os
-from fastapi import HTTPException
-from typing import Optional
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from typing import Optional, List
 from pydantic import BaseModel
-from services.simulation_service import SimulationService
-from services.product_service import ProductService
-from infrastructure.database_repository import DatabaseRepository
+import config
+from infrastructure.async_repository import AsyncProxy, AsyncDatabaseRepository
+from services.simulation_service import SessionConflictError
 
 
 class CreateSessionRequest(BaseModel):
@@ -19,31 +19,36 @@ class InteractionRequest(BaseModel):
     interaction_data: dict
 
 
+class InteractionBatchRequest(BaseModel):
+    interactions: List[InteractionRequest]
+
+
 class SimulationController:
     """Контроллер для обработки запросов симуляции"""
     
-    def __init__(self, simulation_service: SimulationService, 
-                 product_service: ProductService, db_repository: DatabaseRepository):
+    def __init__(self, simulation_service: AsyncProxy,
+                 product_service: AsyncProxy, db_repository: AsyncDatabaseRepository):
+        # simulation_service и product_service - асинхронные обертки над сервисами
         self.simulation_service = simulation_service
         self.product_service = product_service
         self.db = db_repository
     
-    def create_simulation_session(self, request: CreateSessionRequest) -> dict:
+    async def create_simulation_session(self, request: CreateSessionRequest) -> dict:
         """Создание сеанса тестирования"""
-        result = self.simulation_service.create_simulation_session(
+        result = await self.simulation_service.create_simulation_session(
             user_id=request.user_id,
             product_id=request.product_id,
             scenario_id=request.scenario_id
         )
         return result
     
-    def initialize_simulation(self, session_id: int) -> dict:
+    async def initialize_simulation(self, session_id: int) -> dict:
         """Инициализация виртуальной среды"""
-        session = self.db.get_test_session(session_id)
+        session = await self.db.get_test_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Сеанс не найден")
         
-        product = self.product_service.get_product_with_details(session['product_id'])
+        product = await self.product_service.get_product_with_details(session['product_id'])
         if not product:
             raise HTTPException(status_code=404, detail="Продукт не найден")
         
@@ -54,29 +59,117 @@ class SimulationController:
         
         scenario_data = None
         if session.get('scenario_id'):
-            scenarios = self.db.get_scenarios_by_product(session['product_id'])
-            scenario = next((s for s in scenarios if s['id'] == session['scenario_id']), None)
-            if scenario and scenario.get('scenario_data'):
-                scenario_data = json.loads(scenario['scenario_data'])
+            try:
+                scenario = await self.product_service.get_compiled_scenario(session['scenario_id'])
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=f"Некорректный сценарий: {e}")
+            if scenario and scenario.product_id == session['product_id']:
+                scenario_data = scenario.data
         
-        engine = self.simulation_service.get_simulation_engine(session_id)
-        result = engine.initialize_environment(product, scenario_data)
-        return result
+        try:
+            return await self.simulation_service.initialize_simulation(
+                session_id, product, scenario_data)
+        except SessionConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
     
-    def process_interaction(self, session_id: int, request: InteractionRequest) -> dict:
-        """Обработка взаимодействия пользователя"""
-        engine = self.simulation_service.get_simulation_engine(session_id)
-        result = engine.process_interaction(request.interaction_type, request.interaction_data)
-        return result
+    async def process_interaction(self, session_id: int, request: InteractionRequest,
+                                  mode: str = 'full') -> dict:
+        """Обработка взаимодействия пользователя (mode: 'full' или 'delta')"""
+        if mode not in ('full', 'delta'):
+            raise HTTPException(status_code=400, detail="Неверный режим ответа: ожидается full или delta")
+        try:
+            return await self.simulation_service.process_interaction(
+                session_id, request.interaction_type, request.interaction_data,
+                mode == 'delta')
+        except SessionConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    
+    async def get_simulation_state(self, session_id: int, step: Optional[int] = None) -> dict:
+        """Получение текущего состояния симуляции или состояния на шаге step"""
+        if step is None:
+            return await self.simulation_service.get_simulation_state(session_id)
+        try:
+            return await self.simulation_service.get_simulation_state_at(session_id, step)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    async def process_interactions(self, session_id: int, request: InteractionBatchRequest,
+                                   mode: str = 'delta') -> dict:
+        """Обработка пакета взаимодействий (mode: 'delta' или 'full' - с итоговым состоянием)"""
+        if mode not in ('full', 'delta'):
+            raise HTTPException(status_code=400, detail="Неверный режим ответа: ожидается full или delta")
+        if len(request.interactions) > config.SIMULATION_BATCH_MAX_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Слишком много взаимодействий в пакете (максимум {config.SIMULATION_BATCH_MAX_SIZE})")
+        try:
+            return await self.simulation_service.process_interactions(
+                session_id,
+                [(item.interaction_type, item.interaction_data) for item in request.interactions],
+                mode == 'delta')
+        except SessionConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
     
-    def get_simulation_state(self, session_id: int) -> dict:
-        """Получение текущего состояния симуляции"""
-        engine = self.simulation_service.get_simulation_engine(session_id)
-        return engine.get_current_state()
+    async def handle_websocket(self, websocket: WebSocket, session_id: int):
+        """
+        Поток взаимодействий по WebSocket.
+        Движок сеанса закрепляется за соединением на все время его жизни;
+        каждое сообщение - {"interaction_type", "interaction_data"} или
+        {"action": "snapshot"}, ответ - delta или полный снимок.
+        Поле "id" сообщения возвращается в ответе без изменений
+        """
+        await websocket.accept()
+        engine = await self.simulation_service.bind_engine(session_id)
+        if engine is None:
+            await websocket.close(code=4404, reason="Сеанс не найден")
+            return
+        try:
+            while True:
+                text = await websocket.receive_text()
+                await websocket.send_json(await self._handle_ws_message(engine, text))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await self.simulation_service.release_engine(engine)
     
-    def finalize_simulation(self, session_id: int) -> dict:
+    async def _handle_ws_message(self, engine, text: str) -> dict:
+        """Обработка одного сообщения WebSocket"""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return {'success': False, 'error': 'Некорректный JSON'}
+        if not isinstance(message, dict):
+            return {'success': False, 'error': 'Ожидается JSON-объект'}
+        
+        if message.get('action') == 'snapshot':
+            response = await self.simulation_service.get_bound_snapshot(engine)
+        else:
+            interaction_type = message.get('interaction_type')
+            interaction_data = message.get('interaction_data', {})
+            if not isinstance(interaction_type, str) or not isinstance(interaction_data, dict):
+                response = {'success': False,
+                            'error': 'Ожидаются interaction_type (строка) и interaction_data (объект)'}
+            else:
+                try:
+                    response = await self.simulation_service.process_bound_interaction(
+                        engine, interaction_type, interaction_data)
+                except SessionConflictError as e:
+                    response = {'success': False, 'error': str(e)}
+        if 'id' in message:
+            response = dict(response, id=message['id'])
+        return response
+    
+    async def get_simulation_snapshot(self, session_id: int) -> dict:
+        """Полный снимок состояния симуляции"""
+        return await self.simulation_service.get_simulation_snapshot(session_id)
+    
+    async def finalize_simulation(self, session_id: int) -> dict:
         """Завершение сеанса симуляции"""
-        engine = self.simulation_service.get_simulation_engine(session_id)
-        result = engine.finalize_session()
-        return result
-
+        try:
+            return await self.simulation_service.finalize_simulation(session_id)
+        except SessionConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    
+    async def get_session_interactions(self, session_id: int) -> list:
+        """История взаимодействий сеанса"""
+        return await self.simulation_service.get_session_interactions(session_id)
@@ -3,6 +3,10 @@
 """
 from .database_repository import DatabaseRepository
 from .file_storage import FileStorage
+from .connection_pool import ConnectionPool
+from .write_queue import WriteQueue
+from .async_repository import BlockingExecutor, AsyncProxy, AsyncDatabaseRepository
 
-__all__ = ['DatabaseRepository', 'FileStorage']
+__all__ = ['DatabaseRepository', 'FileStorage', 'ConnectionPool', 'WriteQueue',
+           'BlockingExecutor', 'AsyncProxy', 'AsyncDatabaseRepository']
 
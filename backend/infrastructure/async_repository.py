@@ -0,0 +1,59 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from infrastructure.database_repository import DatabaseRepository
+
+
+class BlockingExecutor:
+    """Ограниченный пул потоков для блокирующих операций (SQLite, файлы)"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='blocking')
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение функции в пуле без блокировки цикла событий"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncProxy:
+    """
+    Асинхронная обертка над синхронным объектом.
+    Повторяет его методы: каждый вызов выполняется в BlockingExecutor и возвращает корутину
+    """
+
+    def __init__(self, target: Any, executor: BlockingExecutor):
+        self._target = target
+        self._executor = executor
+
+    @property
+    def sync(self) -> Any:
+        """Исходный синхронный объект"""
+        return self._target
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self._executor.run(attr, *args, **kwargs)
+
+        # Кэшируем обертку, чтобы не создавать ее при каждом обращении
+        self.__dict__[name] = wrapper
+        return wrapper
+
+
+class AsyncDatabaseRepository(AsyncProxy):
+    """Асинхронный репозиторий: API DatabaseRepository, выполняемый в пуле потоков"""
+
+    def __init__(self, executor: BlockingExecutor, repository: DatabaseRepository = None):
+        super().__init__(repository or DatabaseRepository(), executor)
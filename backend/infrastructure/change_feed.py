@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from infrastructure.database_repository import DatabaseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed:
+    """
+    Сброс кэшей между рабочими процессами через таблицу cache_changes.
+
+    Процесс, изменивший объект, сбрасывает свой кэш сам и публикует запись
+    (scope, key). Остальные процессы раз в interval секунд читают новые записи
+    по возрастанию id (один запрос по первичному ключу) и вызывают обработчики
+    scope; свои записи процесс пропускает. Записи старше retention удаляются
+    """
+
+    def __init__(self, db_repository: DatabaseRepository, interval: float,
+                 retention: float, batch_size: int = 1000):
+        self.db = db_repository
+        self.interval = interval
+        self.retention = retention
+        self.batch_size = batch_size
+        self.origin = os.getpid()
+        self._handlers: Dict[str, List[Callable[[int], None]]] = {}
+        self._position: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._last_trim = 0.0
+        self._stats = {
+            'published': 0,
+            'applied': 0,
+            'polls': 0,
+            'errors': 0
+        }
+
+    def subscribe(self, scope: str, handler: Callable[[int], None]):
+        """Обработчик изменений scope: вызывается с ключом измененного объекта"""
+        self._handlers.setdefault(scope, []).append(handler)
+
+    def publish(self, scope: str, key: int):
+        """Публикация изменения объекта для остальных процессов"""
+        self.db.add_cache_change(scope, key, self.origin)
+        with self._lock:
+            self._stats['published'] += 1
+
+    def poll(self) -> int:
+        """Применение новых изменений других процессов. Возвращает их число"""
+        with self._lock:
+            if self._position is None:
+                self._position = self.db.get_last_cache_change_id()
+            position = self._position
+        applied = 0
+        while True:
+            changes = self.db.get_cache_changes(position, self.batch_size)
+            for change in changes:
+                if change['origin'] == self.origin:
+                    continue
+                for handler in self._handlers.get(change['scope'], ()):
+                    handler(change['key'])
+                applied += 1
+            if changes:
+                position = changes[-1]['id']
+            if len(changes) < self.batch_size:
+                break
+        with self._lock:
+            self._position = position
+            self._stats['polls'] += 1
+            self._stats['applied'] += applied
+        return applied
+
+    def start(self):
+        """Запуск фонового опроса (изменения, внесенные до запуска, не применяются)"""
+        if self._worker is not None:
+            return
+        with self._lock:
+            self._position = self.db.get_last_cache_change_id()
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+                if time.monotonic() - self._last_trim > 60.0:
+                    self._last_trim = time.monotonic()
+                    self.db.delete_cache_changes(time.time() - self.retention)
+            except Exception:
+                logger.exception("Ошибка опроса изменений для сброса кэшей")
+                with self._lock:
+                    self._stats['errors'] += 1
+
+    def close(self):
+        """Остановка фонового опроса"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика синхронизации кэшей"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['position'] = self._position
+        stats['origin'] = self.origin
+        return stats
@@ -0,0 +1,158 @@
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Ограниченный пул долгоживущих соединений SQLite"""
+
+    def __init__(self, database_path: str, size: int, timeout: float,
+                 cached_statements: int = 128,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.database_path = database_path
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.on_connect = on_connect
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {
+            'acquired': 0,
+            'released': 0,
+            'created': 0,
+            'discarded': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие нового соединения"""
+        # Соединение переходит между потоками пула FastAPI,
+        # но в каждый момент времени используется только одним из них
+        conn = sqlite3.connect(
+            self.database_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        if self.on_connect:
+            try:
+                self.on_connect(conn)
+            except Exception:
+                conn.close()
+                raise
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def connect(self) -> sqlite3.Connection:
+        """Отдельное соединение с настройками пула (не учитывается в размере пула)"""
+        return self._connect()
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        """Проверка работоспособности соединения"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._stats['discarded'] += 1
+
+    def acquire(self) -> sqlite3.Connection:
+        """Получение соединения из пула"""
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений в пуле за {self.timeout} с")
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += waited
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+        if not self._is_healthy(conn):
+            self._discard(conn)
+            with self._lock:
+                self._created += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        with self._lock:
+            self._stats['acquired'] += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Возврат соединения в пул"""
+        with self._lock:
+            self._stats['released'] += 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def close(self):
+        """Закрытие всех свободных соединений"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика использования пула"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        return stats
@@ -1,13 +1,75 @@
 import sqlite3
 import os
-from typing import Optional, List, Dict, Any
+import logging
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple, Callable, Iterable
 from contextlib import contextmanager
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import config
+from infrastructure.connection_pool import ConnectionPool
+from infrastructure.write_queue import WriteQueue, WriteTimeoutError
+from infrastructure import sqlite_profile
+from infrastructure import migrations
 
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), '..', 'database.db')
 
 if not os.path.exists(DATABASE_PATH):
     DATABASE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'backend', 'database.db')
 
+if config.DATABASE_PATH:
+    DATABASE_PATH = config.DATABASE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Ограничение SQLite на число параметров в одном запросе
+_MAX_QUERY_PARAMS = 900
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+_write_queue: Optional[WriteQueue] = None
+_write_queue_path: Optional[str] = None
+
+
+def get_pool() -> ConnectionPool:
+    """Пул соединений для текущего файла базы данных"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.database_path != DATABASE_PATH:
+            if _pool is not None:
+                _pool.close()
+            profile = sqlite_profile.get_profile(config.DB_STORAGE_PROFILE)
+            _pool = ConnectionPool(
+                DATABASE_PATH,
+                size=config.DB_POOL_SIZE,
+                timeout=config.DB_POOL_TIMEOUT,
+                cached_statements=config.DB_STATEMENT_CACHE_SIZE,
+                on_connect=lambda conn: sqlite_profile.apply_profile(conn, profile)
+            )
+        return _pool
+
+
+def get_write_queue() -> Optional[WriteQueue]:
+    """Очередь потока-писателя для текущего файла базы данных (None, если отключена)"""
+    global _write_queue, _write_queue_path
+    if not config.DB_WRITE_QUEUE_ENABLED:
+        return None
+    pool = get_pool()
+    with _pool_lock:
+        if _write_queue is None or _write_queue_path != DATABASE_PATH:
+            if _write_queue is not None:
+                _write_queue.close()
+            _write_queue = WriteQueue(
+                pool.connect,
+                max_size=config.DB_WRITE_QUEUE_SIZE,
+                batch_size=config.DB_WRITE_BATCH_SIZE,
+                flush_interval=config.DB_WRITE_FLUSH_INTERVAL,
+                put_timeout=config.DB_WRITE_QUEUE_TIMEOUT
+            )
+            _write_queue_path = DATABASE_PATH
+        return _write_queue
+
 
 class DatabaseRepository:
     """Репозиторий для работы с базой данных"""
@@ -15,9 +77,9 @@ class DatabaseRepository:
     @staticmethod
     @contextmanager
     def get_connection():
-        """Контекстный менеджер для работы с БД"""
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
+        """Контекстный менеджер для работы с БД (соединение берется из пула)"""
+        pool = get_pool()
+        conn = pool.acquire()
         try:
             yield conn
             conn.commit()
@@ -25,101 +87,89 @@ class DatabaseRepository:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            pool.release(conn)
+    
+    @staticmethod
+    def _write(operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Выполнение операции записи через поток-писатель (или напрямую, если он отключен)"""
+        write_queue = get_write_queue()
+        if write_queue is None:
+            with DatabaseRepository.get_connection() as conn:
+                return operation(conn)
+        future = write_queue.submit(operation)
+        try:
+            return future.result(timeout=config.DB_WRITE_RESULT_TIMEOUT)
+        except FutureTimeoutError:
+            # Еще не начатая операция отменяется; начатая может быть зафиксирована позже
+            future.cancel()
+            raise WriteTimeoutError(
+                f"Запись не выполнена за {config.DB_WRITE_RESULT_TIMEOUT} с") from None
+    
+    @staticmethod
+    def submit_write(operation: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Постановка операции записи в очередь без ожидания; результат - через Future"""
+        write_queue = get_write_queue()
+        if write_queue is None:
+            future: Future = Future()
+            try:
+                future.set_result(DatabaseRepository._write(operation))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return write_queue.submit(operation)
     
     @staticmethod
-    def init_database():
-        """Инициализация базы данных - создание таблиц"""
+    def close_write_queue():
+        """Выполнение оставшихся записей и остановка потока-писателя"""
+        global _write_queue
+        with _pool_lock:
+            write_queue, _write_queue = _write_queue, None
+        if write_queue is not None:
+            write_queue.close()
+    
+    @staticmethod
+    def get_pool_stats() -> Dict[str, Any]:
+        """Статистика пула соединений"""
+        return get_pool().get_stats()
+    
+    @staticmethod
+    def get_write_queue_stats() -> Optional[Dict[str, Any]]:
+        """Статистика очереди записи (None, если она отключена)"""
+        write_queue = get_write_queue()
+        return write_queue.get_stats() if write_queue else None
+    
+    @staticmethod
+    def get_storage_settings() -> Dict[str, Any]:
+        """Активные настройки хранилища SQLite"""
         with DatabaseRepository.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    user_type TEXT NOT NULL CHECK(user_type IN ('owner', 'end_user')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    owner_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    model_file_path TEXT,
-                    status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'verified', 'failed')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (owner_id) REFERENCES users(id)
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS scenarios (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    scenario_data TEXT,
-                    is_template BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (product_id) REFERENCES products(id)
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS product_characteristics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER NOT NULL,
-                    characteristic_name TEXT NOT NULL,
-                    characteristic_value TEXT NOT NULL,
-                    FOREIGN KEY (product_id) REFERENCES products(id)
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS test_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
-                    scenario_id INTEGER,
-                    session_data TEXT,
-                    status TEXT DEFAULT 'active' CHECK(status IN ('active', 'completed')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    FOREIGN KEY (product_id) REFERENCES products(id),
-                    FOREIGN KEY (scenario_id) REFERENCES scenarios(id)
-                )
-            """)
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id INTEGER NOT NULL,
-                    interaction_type TEXT NOT NULL,
-                    interaction_data TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (session_id) REFERENCES test_sessions(id)
-                )
-            """)
-            
-            conn.commit()
+            settings = sqlite_profile.read_settings(conn)
+            settings['schema_version'] = migrations.get_schema_version(conn)
+        settings['profile'] = config.DB_STORAGE_PROFILE
+        return settings
+    
+    @staticmethod
+    def init_database() -> Dict[str, Any]:
+        """Инициализация базы данных - применение миграций схемы.
+        Возвращает активные настройки хранилища"""
+        with DatabaseRepository.get_connection() as conn:
+            applied = migrations.migrate(conn)
+            if applied:
+                logger.info("Применены миграции схемы: %s", applied)
+        
+        return DatabaseRepository.get_storage_settings()
     
 
     @staticmethod
     def create_user(username: str, email: str, password_hash: str, user_type: str) -> int:
         """Создание нового пользователя"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO users (username, email, password_hash, user_type)
                 VALUES (?, ?, ?, ?)
             """, (username, email, password_hash, user_type))
             return cursor.lastrowid
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
@@ -134,22 +184,71 @@ class DatabaseRepository:
     def create_product(owner_id: int, name: str, description: str = None, 
                        model_file_path: str = None) -> int:
         """Создание нового продукта"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO products (owner_id, name, description, model_file_path, status)
                 VALUES (?, ?, ?, ?, 'pending')
             """, (owner_id, name, description, model_file_path))
             return cursor.lastrowid
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def _insert_product_bundle(cursor: sqlite3.Cursor, product: Dict[str, Any]) -> int:
+        """Вставка продукта вместе с характеристиками и сценариями в текущей транзакции"""
+        cursor.execute("""
+            INSERT INTO products (owner_id, name, description, model_file_path,
+                                  model_file_size, model_file_sha256, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (product['owner_id'], product['name'], product.get('description'),
+              product.get('model_file_path'), product.get('model_file_size'),
+              product.get('model_file_sha256'), product.get('status', 'pending')))
+        product_id = cursor.lastrowid
+        
+        cursor.executemany("""
+            INSERT INTO product_characteristics (product_id, characteristic_name, characteristic_value)
+            VALUES (?, ?, ?)
+        """, [(product_id, char['name'], char['value'])
+              for char in product.get('characteristics', [])])
+        
+        cursor.executemany("""
+            INSERT INTO scenarios (product_id, name, description, scenario_data, is_template)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(product_id, scenario['name'], scenario.get('description'),
+               scenario.get('scenario_data'), 1 if scenario.get('is_template') else 0)
+              for scenario in product.get('scenarios', [])])
+        return product_id
+    
+    @staticmethod
+    def create_product_with_details(product: Dict[str, Any]) -> int:
+        """
+        Создание продукта с характеристиками и сценариями в одной транзакции.
+        product: owner_id, name, description, model_file_path, model_file_size,
+        model_file_sha256, status,
+        characteristics [{name, value}], scenarios [{name, description, scenario_data, is_template}]
+        """
+        def write(conn: sqlite3.Connection):
+            return DatabaseRepository._insert_product_bundle(conn.cursor(), product)
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def bulk_create_products(products: List[Dict[str, Any]]) -> List[int]:
+        """Массовое создание продуктов в одной транзакции (формат как в create_product_with_details)"""
+        def write(conn: sqlite3.Connection):
+            cursor = conn.cursor()
+            return [DatabaseRepository._insert_product_bundle(cursor, product)
+                    for product in products]
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def update_product_status(product_id: int, status: str):
         """Обновление статуса продукта"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE products SET status = ? WHERE id = ?
             """, (status, product_id))
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def get_product(product_id: int) -> Optional[Dict[str, Any]]:
@@ -168,6 +267,25 @@ class DatabaseRepository:
             cursor.execute("SELECT * FROM products WHERE status = 'verified'")
             return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def get_products_page(limit: int, after: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+        """Страница проверенных продуктов по ключу (created_at, id).
+        after - ключ последнего продукта предыдущей страницы"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            if after is None:
+                cursor.execute("""
+                    SELECT * FROM products WHERE status = 'verified'
+                    ORDER BY created_at, id LIMIT ?
+                """, (limit,))
+            else:
+                cursor.execute("""
+                    SELECT * FROM products
+                    WHERE status = 'verified' AND (created_at, id) > (?, ?)
+                    ORDER BY created_at, id LIMIT ?
+                """, (after[0], after[1], limit))
+            return [dict(row) for row in cursor.fetchall()]
+    
     @staticmethod
     def get_products_by_owner(owner_id: int) -> List[Dict[str, Any]]:
         """Получение всех продуктов владельца"""
@@ -180,7 +298,7 @@ class DatabaseRepository:
     def update_product(product_id: int, name: str = None, description: str = None, 
                        model_file_path: str = None):
         """Обновление продукта"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             updates = []
             params = []
@@ -198,28 +316,33 @@ class DatabaseRepository:
             if updates:
                 params.append(product_id)
                 cursor.execute(f"UPDATE products SET {', '.join(updates)} WHERE id = ?", params)
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def delete_product(product_id: int):
         """Удаление продукта и связанных данных"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("DELETE FROM product_characteristics WHERE product_id = ?", (product_id,))
             cursor.execute("DELETE FROM scenarios WHERE product_id = ?", (product_id,))
+            for table in ('interaction_rollups', 'session_rollups', 'scenario_rollups'):
+                cursor.execute(f"DELETE FROM {table} WHERE product_id = ?", (product_id,))
             cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        return DatabaseRepository._write(write)
     
 
     @staticmethod
     def create_scenario(product_id: int, name: str, description: str = None,
                        scenario_data: str = None, is_template: bool = False) -> int:
         """Создание сценария использования"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO scenarios (product_id, name, description, scenario_data, is_template)
                 VALUES (?, ?, ?, ?, ?)
             """, (product_id, name, description, scenario_data, 1 if is_template else 0))
             return cursor.lastrowid
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def get_scenarios_by_product(product_id: int) -> List[Dict[str, Any]]:
@@ -229,6 +352,41 @@ class DatabaseRepository:
             cursor.execute("SELECT * FROM scenarios WHERE product_id = ?", (product_id,))
             return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def get_scenario(scenario_id: int) -> Optional[Dict[str, Any]]:
+        """Получение сценария по ID"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM scenarios WHERE id = ?", (scenario_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    @staticmethod
+    def _fetch_grouped_by_product(query: str, product_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Выборка строк для набора продуктов с группировкой по product_id.
+        query должен содержать плейсхолдер {placeholders} для списка IN"""
+        grouped: Dict[int, List[Dict[str, Any]]] = {product_id: [] for product_id in product_ids}
+        ids = list(grouped)
+        if not ids:
+            return grouped
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), _MAX_QUERY_PARAMS):
+                chunk = ids[start:start + _MAX_QUERY_PARAMS]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(query.format(placeholders=placeholders), chunk)
+                for row in cursor.fetchall():
+                    grouped[row['product_id']].append(dict(row))
+        return grouped
+    
+    @staticmethod
+    def get_scenarios_by_products(product_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Получение сценариев для набора продуктов одним запросом"""
+        return DatabaseRepository._fetch_grouped_by_product(
+            "SELECT * FROM scenarios WHERE product_id IN ({placeholders}) ORDER BY id",
+            product_ids
+        )
+    
     @staticmethod
     def get_scenario_templates() -> List[Dict[str, Any]]:
         """Получение всех шаблонов сценариев"""
@@ -240,12 +398,13 @@ class DatabaseRepository:
     @staticmethod
     def add_product_characteristic(product_id: int, name: str, value: str):
         """Добавление характеристики продукта"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO product_characteristics (product_id, characteristic_name, characteristic_value)
                 VALUES (?, ?, ?)
             """, (product_id, name, value))
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def get_product_characteristics(product_id: int) -> List[Dict[str, Any]]:
@@ -257,17 +416,46 @@ class DatabaseRepository:
             """, (product_id,))
             return [dict(row) for row in cursor.fetchall()]
     
+    @staticmethod
+    def get_characteristics_by_products(product_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Получение характеристик для набора продуктов одним запросом"""
+        return DatabaseRepository._fetch_grouped_by_product(
+            "SELECT * FROM product_characteristics WHERE product_id IN ({placeholders}) ORDER BY id",
+            product_ids
+        )
+    
     @staticmethod
     def create_test_session(user_id: int, product_id: int, scenario_id: int = None,
                            session_data: str = None) -> int:
         """Создание сеанса тестирования"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO test_sessions (user_id, product_id, scenario_id, session_data, status)
-                VALUES (?, ?, ?, ?, 'active')
-            """, (user_id, product_id, scenario_id, session_data))
+                INSERT INTO test_sessions (user_id, product_id, scenario_id, session_data, status,
+                                           last_active_at)
+                VALUES (?, ?, ?, ?, 'active', ?)
+            """, (user_id, product_id, scenario_id, session_data, time.time()))
             return cursor.lastrowid
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def create_test_sessions(user_id: int, product_id: int, scenario_id: Optional[int],
+                             count: int) -> List[int]:
+        """Создание count сеансов тестирования одной транзакцией. Возвращает их ID"""
+        def write(conn: sqlite3.Connection):
+            if count <= 0:
+                return []
+            created_at = time.time()
+            conn.executemany("""
+                INSERT INTO test_sessions (user_id, product_id, scenario_id, status,
+                                           last_active_at)
+                VALUES (?, ?, ?, 'active', ?)
+            """, [(user_id, product_id, scenario_id, created_at)] * count)
+            # Строки вставлены одной транзакцией единственного писателя -
+            # id AUTOINCREMENT идут подряд
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            return list(range(last_id - count + 1, last_id + 1))
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def get_test_session(session_id: int) -> Optional[Dict[str, Any]]:
@@ -281,7 +469,7 @@ class DatabaseRepository:
     @staticmethod
     def update_test_session_status(session_id: int, status: str):
         """Обновление статуса сеанса"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             if status == 'completed':
                 cursor.execute("""
@@ -293,23 +481,433 @@ class DatabaseRepository:
                 cursor.execute("""
                     UPDATE test_sessions SET status = ? WHERE id = ?
                 """, (status, session_id))
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def complete_test_sessions(session_ids: List[int]):
+        """Завершение набора сеансов одной транзакцией"""
+        def write(conn: sqlite3.Connection):
+            conn.executemany("""
+                UPDATE test_sessions
+                SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'active'
+            """, [(session_id,) for session_id in session_ids])
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def update_test_session_data(session_id: int, session_data: str,
+                                 last_active_at: Optional[float] = None,
+                                 expected_version: Optional[int] = None,
+                                 interactions: List[Tuple[str, str]] = (),
+                                 state_version: Optional[int] = None) -> bool:
+        """
+        Обновление данных сеанса с увеличением row_version.
+        last_active_at - время последней активности (по умолчанию сейчас);
+        expected_version - запись только при совпадении row_version (иначе False);
+        interactions - строки [(interaction_type, interaction_data)] той же транзакцией;
+        state_version - версия записываемого состояния
+        """
+        def write(conn: sqlite3.Connection):
+            query = """
+                UPDATE test_sessions
+                SET session_data = ?, last_active_at = ?, row_version = row_version + 1
+            """
+            params = [session_data, last_active_at or time.time()]
+            if state_version is not None:
+                query += ", state_version = ?"
+                params.append(state_version)
+            query += " WHERE id = ?"
+            params.append(session_id)
+            if expected_version is not None:
+                query += " AND row_version = ?"
+                params.append(expected_version)
+            if not conn.execute(query, params).rowcount:
+                return False
+            DatabaseRepository._insert_interactions(conn, session_id, interactions)
+            return True
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def claim_test_session_version(session_id: int, expected_version: int, state_version: int,
+                                   last_active_at: Optional[float] = None,
+                                   interactions: List[Tuple[str, str]] = ()) -> bool:
+        """
+        Изменение состояния сеанса без записи снимка: увеличение row_version
+        при совпадении с expected_version (иначе False) и отметка версии состояния.
+        interactions - строки [(interaction_type, interaction_data)] той же транзакцией
+        """
+        def write(conn: sqlite3.Connection):
+            if not conn.execute("""
+                UPDATE test_sessions
+                SET row_version = row_version + 1, state_version = ?, last_active_at = ?
+                WHERE id = ? AND row_version = ?
+            """, (state_version, last_active_at or time.time(), session_id,
+                  expected_version)).rowcount:
+                return False
+            DatabaseRepository._insert_interactions(conn, session_id, interactions)
+            return True
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def _insert_interactions(conn: sqlite3.Connection, session_id: int,
+                             interactions: List[Tuple[str, str]]):
+        """Вставка строк interactions сеанса в текущей транзакции"""
+        if interactions:
+            conn.executemany("""
+                INSERT INTO interactions (session_id, interaction_type, interaction_data)
+                VALUES (?, ?, ?)
+            """, [(session_id, interaction_type, interaction_data)
+                  for interaction_type, interaction_data in interactions])
     
     @staticmethod
-    def update_test_session_data(session_id: int, session_data: str):
-        """Обновление данных сеанса"""
+    def get_idle_session_ids(cutoff: float, after_id: int, limit: int,
+                             shard: int = 0, shards: int = 1) -> List[int]:
+        """
+        ID активных сеансов без активности с момента cutoff (unix-время), по возрастанию id.
+        shard/shards - только сеансы с id % shards == shard
+        """
         with DatabaseRepository.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                UPDATE test_sessions SET session_data = ? WHERE id = ?
-            """, (session_data, session_id))
+                SELECT id FROM test_sessions
+                WHERE status = 'active' AND id > ? AND last_active_at < ? AND id % ? = ?
+                ORDER BY id LIMIT ?
+            """, (after_id, cutoff, shards, shard, limit))
+            return [row['id'] for row in cursor.fetchall()]
+    
+    @staticmethod
+    def touch_test_sessions(last_active: Dict[int, float]):
+        """Обновление времени последней активности сеансов: {session_id: unix-время}"""
+        def write(conn: sqlite3.Connection):
+            conn.executemany("""
+                UPDATE test_sessions SET last_active_at = MAX(COALESCE(last_active_at, 0), ?)
+                WHERE id = ?
+            """, [(last_active_at, session_id) for session_id, last_active_at in last_active.items()])
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def expire_test_sessions(session_ids: List[int], cutoff: float) -> List[int]:
+        """
+        Завершение сеансов, по-прежнему неактивных с момента cutoff, одной транзакцией.
+        Возвращает ID завершенных сеансов
+        """
+        ids = list(session_ids)
+
+        def write(conn: sqlite3.Connection):
+            expired = []
+            for start in range(0, len(ids), _MAX_QUERY_PARAMS - 1):
+                chunk = ids[start:start + _MAX_QUERY_PARAMS - 1]
+                condition = f"""
+                    id IN ({', '.join('?' * len(chunk))})
+                    AND status = 'active' AND last_active_at < ?
+                """
+                # Выборка и обновление в одной транзакции записи - набор строк совпадает
+                expired.extend(row[0] for row in conn.execute(
+                    f"SELECT id FROM test_sessions WHERE {condition}", chunk + [cutoff]))
+                conn.execute(f"""
+                    UPDATE test_sessions
+                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+                    WHERE {condition}
+                """, chunk + [cutoff])
+            return expired
+        return DatabaseRepository._write(write)
     
     @staticmethod
     def add_interaction(session_id: int, interaction_type: str, interaction_data: str):
         """Добавление взаимодействия"""
-        with DatabaseRepository.get_connection() as conn:
+        def write(conn: sqlite3.Connection):
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO interactions (session_id, interaction_type, interaction_data)
                 VALUES (?, ?, ?)
             """, (session_id, interaction_type, interaction_data))
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def add_interactions(session_id: int, interactions: List[Tuple[str, str]]):
+        """Добавление пакета взаимодействий сеанса одной транзакцией.
+        interactions: [(interaction_type, interaction_data)]"""
+        def write(conn: sqlite3.Connection):
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO interactions (session_id, interaction_type, interaction_data)
+                VALUES (?, ?, ?)
+            """, [(session_id, interaction_type, interaction_data)
+                  for interaction_type, interaction_data in interactions])
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def get_interactions_by_session(session_id: int) -> List[Dict[str, Any]]:
+        """Получение взаимодействий сеанса"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM interactions WHERE session_id = ? ORDER BY id
+            """, (session_id,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_interactions_after(last_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Строки interactions с id больше last_id (по возрастанию id)"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, session_id, interaction_type, timestamp FROM interactions
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_sessions_meta(session_ids: List[int]) -> Dict[int, Tuple[int, Optional[int]]]:
+        """Продукт и сценарий для набора сеансов: {session_id: (product_id, scenario_id)}"""
+        result = {}
+        ids = list(session_ids)
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), _MAX_QUERY_PARAMS):
+                chunk = ids[start:start + _MAX_QUERY_PARAMS]
+                cursor.execute(f"""
+                    SELECT id, product_id, scenario_id FROM test_sessions
+                    WHERE id IN ({', '.join('?' * len(chunk))})
+                """, chunk)
+                for row in cursor.fetchall():
+                    result[row['id']] = (row['product_id'], row['scenario_id'])
+        return result
+    
+    @staticmethod
+    def get_session_ids_by_product(product_id: int) -> List[int]:
+        """ID всех сеансов продукта"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM test_sessions WHERE product_id = ?", (product_id,))
+            return [row[0] for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_product_interactions(product_id: int) -> List[Dict[str, Any]]:
+        """Взаимодействия всех сеансов продукта из таблицы interactions"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT i.id, i.session_id, i.interaction_type, i.interaction_data, i.timestamp
+                FROM interactions i JOIN test_sessions s ON s.id = i.session_id
+                WHERE s.product_id = ? ORDER BY i.id
+            """, (product_id,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_last_interaction_id() -> int:
+        """Наибольший id в таблице interactions (0, если она пуста)"""
+        with DatabaseRepository.get_connection() as conn:
+            row = conn.execute("SELECT MAX(id) FROM interactions").fetchone()
+            return row[0] or 0
+    
+    @staticmethod
+    def _export_filters(column_prefix: str, time_column: str, product_id: Optional[int],
+                        start: Optional[float], end: Optional[float]) -> Tuple[str, list]:
+        """Условия выборки для выгрузки: продукт и интервал [start, end) в unix-времени"""
+        conditions, params = [], []
+        if product_id is not None:
+            conditions.append(f"{column_prefix}product_id = ?")
+            params.append(product_id)
+        if start is not None:
+            conditions.append(f"{time_column} >= datetime(?, 'unixepoch')")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{time_column} < datetime(?, 'unixepoch')")
+            params.append(end)
+        return ''.join(f" AND {condition}" for condition in conditions), params
+    
+    @staticmethod
+    def get_test_sessions_page(after_id: int, limit: int, product_id: Optional[int] = None,
+                               start: Optional[float] = None,
+                               end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Сеансы с id больше after_id (по возрастанию id), созданные в [start, end)"""
+        filters, params = DatabaseRepository._export_filters(
+            '', 'created_at', product_id, start, end)
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, user_id, product_id, scenario_id, status, created_at, completed_at
+                FROM test_sessions WHERE id > ?{filters} ORDER BY id LIMIT ?
+            """, [after_id] + params + [limit])
+            return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_interactions_page(after_id: int, limit: int, product_id: Optional[int] = None,
+                              start: Optional[float] = None,
+                              end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Строки interactions с id больше after_id (по возрастанию id) за [start, end)"""
+        filters, params = DatabaseRepository._export_filters(
+            's.', 'i.timestamp', product_id, start, end)
+        join = " JOIN test_sessions s ON s.id = i.session_id" if product_id is not None else ""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT i.id, i.session_id, i.interaction_type, i.interaction_data, i.timestamp
+                FROM interactions i{join} WHERE i.id > ?{filters} ORDER BY i.id LIMIT ?
+            """, [after_id] + params + [limit])
+            return [dict(row) for row in cursor.fetchall()]
+    
+    # --- Агрегаты взаимодействий ---
+    
+    @staticmethod
+    def get_rollup_position(source: str) -> float:
+        """Обработанная часть источника агрегатов (0 - ничего не обработано)"""
+        with DatabaseRepository.get_connection() as conn:
+            row = conn.execute("SELECT position FROM rollup_state WHERE source = ?",
+                               (source,)).fetchone()
+            return row['position'] if row else 0
+    
+    @staticmethod
+    def get_rollup_segments(source: str) -> Dict[str, int]:
+        """Обработанная длина сегментов журнала {stem: байт}"""
+        with DatabaseRepository.get_connection() as conn:
+            rows = conn.execute("SELECT stem, position FROM rollup_segments WHERE source = ?",
+                                (source,)).fetchall()
+            return {row['stem']: row['position'] for row in rows}
+    
+    @staticmethod
+    def get_rollup_cutoff(source: str) -> Optional[float]:
+        """Время, до которого записи сегментов без отметки уже учтены (None - нет)"""
+        with DatabaseRepository.get_connection() as conn:
+            row = conn.execute("SELECT log_cutoff FROM rollup_state WHERE source = ?",
+                               (source,)).fetchone()
+            return row['log_cutoff'] if row else None
+    
+    @staticmethod
+    def apply_rollups(source: str, expected_position: float, new_position: float,
+                      buckets: Dict[Tuple[int, int, str, int], int],
+                      sessions: Dict[int, List[Any]],
+                      segments: Optional[Dict[str, int]] = None,
+                      removed_segments: Iterable[str] = ()) -> bool:
+        """
+        Добавление приращений агрегатов одной транзакцией вместе с новой отметкой источника.
+        buckets: {(product_id, scenario_id, interaction_type, bucket_start): число};
+        sessions: {session_id: [product_id, scenario_id, число, first_at, last_at]};
+        segments - новые отметки сегментов журнала {stem: байт}, removed_segments -
+        сегменты, отметки которых удаляются.
+        Если отметку уже сдвинул другой процесс, ничего не записывается и возвращается False
+        """
+        def write(conn: sqlite3.Connection):
+            row = conn.execute("SELECT position FROM rollup_state WHERE source = ?",
+                               (source,)).fetchone()
+            if (row['position'] if row else 0) != expected_position:
+                return False
+            conn.executemany("""
+                INSERT INTO interaction_rollups
+                    (product_id, scenario_id, interaction_type, bucket_start, interactions)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (product_id, scenario_id, interaction_type, bucket_start)
+                DO UPDATE SET interactions = interactions + excluded.interactions
+            """, [key + (count,) for key, count in buckets.items()])
 
+            scenario_deltas: Dict[Tuple[int, int], List[float]] = {}
+            for session_id, (product_id, scenario_id, count, first_at, last_at) in sessions.items():
+                old = conn.execute("""
+                    SELECT first_at, last_at FROM session_rollups WHERE session_id = ?
+                """, (session_id,)).fetchone()
+                if old is None:
+                    new_session, old_duration = 1, 0.0
+                else:
+                    new_session, old_duration = 0, old['last_at'] - old['first_at']
+                    first_at = min(first_at, old['first_at'])
+                    last_at = max(last_at, old['last_at'])
+                conn.execute("""
+                    INSERT INTO session_rollups
+                        (session_id, product_id, scenario_id, interactions, first_at, last_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (session_id) DO UPDATE SET
+                        interactions = interactions + excluded.interactions,
+                        first_at = excluded.first_at,
+                        last_at = excluded.last_at
+                """, (session_id, product_id, scenario_id, count, first_at, last_at))
+                duration = last_at - first_at
+                delta = scenario_deltas.setdefault((product_id, scenario_id), [0, 0, 0.0, 0.0])
+                delta[0] += new_session
+                delta[1] += count
+                delta[2] += duration - old_duration
+                delta[3] = max(delta[3], duration)
+            conn.executemany("""
+                INSERT INTO scenario_rollups
+                    (product_id, scenario_id, sessions, interactions, duration_total, duration_max)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (product_id, scenario_id) DO UPDATE SET
+                    sessions = sessions + excluded.sessions,
+                    interactions = interactions + excluded.interactions,
+                    duration_total = duration_total + excluded.duration_total,
+                    duration_max = MAX(duration_max, excluded.duration_max)
+            """, [key + tuple(delta) for key, delta in scenario_deltas.items()])
+
+            conn.executemany("DELETE FROM rollup_segments WHERE source = ? AND stem = ?",
+                             [(source, stem) for stem in removed_segments])
+            conn.executemany("""
+                INSERT INTO rollup_segments (source, stem, position) VALUES (?, ?, ?)
+                ON CONFLICT (source, stem) DO UPDATE SET position = excluded.position
+            """, [(source, stem, position) for stem, position in (segments or {}).items()])
+            conn.execute("""
+                INSERT INTO rollup_state (source, position) VALUES (?, ?)
+                ON CONFLICT (source) DO UPDATE SET position = excluded.position
+            """, (source, new_position))
+            return True
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def get_product_rollups(product_id: int, start: Optional[int] = None,
+                            end: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Агрегаты продукта: интервалы [start, end) по типам и сценариям
+        и итоги по сценариям (сеансы, взаимодействия, длительность)
+        """
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT scenario_id, interaction_type, bucket_start, interactions
+                FROM interaction_rollups
+                WHERE product_id = ? AND bucket_start >= ? AND bucket_start < ?
+                ORDER BY bucket_start
+            """, (product_id, start if start is not None else 0,
+                  end if end is not None else 2 ** 62))
+            buckets = [dict(row) for row in cursor.fetchall()]
+            cursor.execute("""
+                SELECT scenario_id, sessions, interactions, duration_total, duration_max
+                FROM scenario_rollups WHERE product_id = ? ORDER BY scenario_id
+            """, (product_id,))
+            scenarios = [dict(row) for row in cursor.fetchall()]
+        return {'buckets': buckets, 'scenarios': scenarios}
+    
+    # --- Изменения для сброса кэшей рабочих процессов ---
+    
+    @staticmethod
+    def add_cache_change(scope: str, key: int, origin: int) -> int:
+        """Запись об изменении объекта scope/key, внесенном процессом origin"""
+        def write(conn: sqlite3.Connection):
+            return conn.execute("""
+                INSERT INTO cache_changes (scope, key, origin, created_at) VALUES (?, ?, ?, ?)
+            """, (scope, key, origin, time.time())).lastrowid
+        return DatabaseRepository._write(write)
+    
+    @staticmethod
+    def get_cache_changes(after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Изменения с id больше after_id по возрастанию id"""
+        with DatabaseRepository.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, scope, key, origin FROM cache_changes
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (after_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_last_cache_change_id() -> int:
+        """Последний id изменения (0, если изменений нет)"""
+        with DatabaseRepository.get_connection() as conn:
+            row = conn.execute("SELECT MAX(id) FROM cache_changes").fetchone()
+            return row[0] or 0
+    
+    @staticmethod
+    def delete_cache_changes(before: float) -> int:
+        """Удаление записей об изменениях старше before (unix-время)"""
+        def write(conn: sqlite3.Connection):
+            return conn.execute("DELETE FROM cache_changes WHERE created_at < ?",
+                                (before,)).rowcount
+        return DatabaseRepository._write(write)
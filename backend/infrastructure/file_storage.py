@@ -1,5 +1,13 @@
+import hashlib
+import io
+import os
+import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Any, BinaryIO, Dict, Optional
+
+
+class FileTooLargeError(ValueError):
+    """Размер загружаемого файла превышает допустимый"""
 
 
 class FileStorage:
@@ -15,11 +23,48 @@ class FileStorage:
         self.scenarios_dir.mkdir(exist_ok=True)
     
     def save_model_file(self, file_content: bytes, filename: str) -> str:
-        file_path = self.models_dir / filename
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
-        return str(file_path)
+        return self.save_model_stream(io.BytesIO(file_content), filename)['path']
     
+    def save_model_stream(self, source: BinaryIO, filename: str,
+                          max_bytes: Optional[int] = None,
+                          chunk_size: int = 1024 * 1024) -> Dict[str, Any]:
+        """
+        Потоковая запись файла модели блоками по chunk_size байт.
+        Размер и SHA-256 считаются в том же проходе; при превышении max_bytes
+        запись прерывается (FileTooLargeError). Файл пишется во временный и
+        переименовывается после записи, поэтому недописанная модель не видна.
+        Возвращает {path, size, sha256}; ValueError при недопустимом имени файла
+        """
+        file_path = self.models_dir / self._model_filename(filename)
+        part_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(part_path, 'wb') as f:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise FileTooLargeError(
+                            f"Размер файла модели превышает {max_bytes} байт")
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(part_path, file_path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        return {'path': str(file_path), 'size': size, 'sha256': digest.hexdigest()}
+    
+    @staticmethod
+    def _model_filename(filename: str) -> str:
+        """Имя файла без каталогов (разделители '/' и '\\'); пустые имена, '.' и '..' недопустимы"""
+        name = (filename or '').replace('\\', '/').rsplit('/', 1)[-1]
+        if name in ('', '.', '..') or '\0' in name:
+            raise ValueError(f"Недопустимое имя файла модели: {filename!r}")
+        return name
+
     def get_model_file_path(self, filename: str) -> Optional[Path]:
         file_path = self.models_dir / filename
         if file_path.exists():
@@ -0,0 +1,690 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: уплотнение согласуется только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_LOG_SUFFIX = '.log'
+_INDEX_SUFFIX = '.idx'
+_LOCK_SUFFIX = '.lock'
+# Уплотненная копия сегмента <stem> называется <stem>-c
+_COMPACTED = '-c'
+
+
+class InteractionLog:
+    """
+    Журнал взаимодействий только на дозапись, разбитый на сегменты по временным окнам.
+
+    Сегмент - файл JSON-строк и разреженный индекс: для каждого session_id
+    диапазон байт, в котором лежат его записи. Записи буферизуются и дописываются
+    в конец активного сегмента последовательно. Индекс закрытого сегмента
+    сохраняется рядом с ним; фоновое уплотнение сортирует закрытые сегменты
+    по session_id, после чего диапазон содержит только записи одного сеанса.
+
+    Каждый процесс пишет в свои сегменты (в имени - окно и pid), поэтому
+    несколько рабочих процессов могут использовать один каталог. Файлы сегментов
+    не переписываются на месте: уплотненный сегмент публикуется под новым именем,
+    а исходный затем удаляется.
+    """
+
+    def __init__(self, directory: str, segment_seconds: int = 3600,
+                 flush_every: int = 256, flush_interval: float = 1.0,
+                 compaction_interval: float = 60.0, fsync: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_seconds = segment_seconds
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.compaction_interval = compaction_interval
+        # commit() дожидается записи на диск (os.fsync), а не только в кэш ОС
+        self.fsync = fsync
+
+        # _lock - буфер и активный сегмент; _segments_lock - построение индексов;
+        # _compaction_lock - уплотнение в этом процессе
+        self._lock = threading.Lock()
+        self._segments_lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        # stem -> ((inode, размер, mtime), индекс)
+        self._index_cache: Dict[str, Tuple[tuple, Dict[str, Any]]] = {}
+        self._buffer: List[bytes] = []
+        self._buffer_meta: List[tuple] = []
+        self._active: Optional[Dict[str, Any]] = None
+
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._compaction_enabled = True
+        self._compaction_guard: Optional[Callable[[str, int], bool]] = None
+        self._stats = {
+            'appended': 0,
+            'flushes': 0,
+            'fsyncs': 0,
+            'bytes_written': 0,
+            'segments_compacted': 0
+        }
+
+    # --- Запись ---
+
+    def _window_of(self, timestamp: float) -> int:
+        return int(timestamp // self.segment_seconds) * self.segment_seconds
+
+    def _path(self, stem: str, suffix: str) -> Path:
+        return self.directory / f"{stem}{suffix}"
+
+    def append(self, session_id: int, interaction_type: str,
+               interaction_data: Dict[str, Any], timestamp: float = None,
+               step: int = None, version: int = None):
+        """
+        Добавление взаимодействия в буфер (на диск попадает при сбросе).
+        version - версия состояния сеанса после взаимодействия (для восстановления состояния)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        record = {
+            'session_id': session_id,
+            'interaction_type': interaction_type,
+            'interaction_data': interaction_data,
+            'timestamp': timestamp,
+            'step': step,
+            'version': version
+        }
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            window = self._window_of(timestamp)
+            if self._active is not None and window != self._active['window']:
+                self._flush_locked()
+                self._close_active_locked()
+            if self._active is None:
+                self._open_active_locked(window)
+            self._buffer.append(line)
+            self._buffer_meta.append((session_id, timestamp))
+            self._stats['appended'] += 1
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        """Запись буфера в активный сегмент"""
+        with self._lock:
+            self._flush_locked()
+
+    def commit(self):
+        """
+        Фиксация добавленных записей перед подтверждением клиенту: буфер
+        записывается в файл, при fsync=True - и на диск. Запросы, ожидающие
+        блокировку, пока выполняется fsync, затем не повторяют его для уже
+        записанных на диск данных
+        """
+        with self._lock:
+            self._flush_locked()
+            active = self._active
+            if not self.fsync or active is None or active['synced'] >= active['size']:
+                return
+            os.fsync(active['file'].fileno())
+            active['synced'] = active['size']
+            self._stats['fsyncs'] += 1
+
+    def _open_active_locked(self, window: int):
+        # В имени - начало и длина окна: сегменты вне интервала отбрасываются без индекса
+        base = f"{window:012d}-{self.segment_seconds}s-{os.getpid()}"
+        stem, n = base, 0
+        while self._path(stem, _LOG_SUFFIX).exists() or \
+                self._path(stem + _COMPACTED, _LOG_SUFFIX).exists():
+            n += 1
+            stem = f"{base}-{n}"
+        self._active = {
+            'stem': stem,
+            'window': window,
+            'file': open(self._path(stem, _LOG_SUFFIX), 'ab'),
+            'size': 0,
+            'synced': 0,
+            'min_ts': None,
+            'max_ts': None,
+            'sessions': {}
+        }
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        active = self._active
+        offset = active['size']
+        sessions = active['sessions']
+        for line, (session_id, timestamp) in zip(self._buffer, self._buffer_meta):
+            span = sessions.get(session_id)
+            if span is None:
+                sessions[session_id] = [offset, offset + len(line)]
+            else:
+                span[1] = offset + len(line)
+            offset += len(line)
+            if active['min_ts'] is None or timestamp < active['min_ts']:
+                active['min_ts'] = timestamp
+            if active['max_ts'] is None or timestamp > active['max_ts']:
+                active['max_ts'] = timestamp
+        data = b''.join(self._buffer)
+        active['file'].write(data)
+        active['file'].flush()
+        active['size'] = offset
+        self._stats['flushes'] += 1
+        self._stats['bytes_written'] += len(data)
+        self._buffer.clear()
+        self._buffer_meta.clear()
+
+    def _close_active_locked(self):
+        if self._active is None:
+            return
+        active = self._active
+        if self.fsync and active['synced'] < active['size']:
+            os.fsync(active['file'].fileno())
+        active['file'].close()
+        self._active = None
+        # Сегмент могло удалить уплотнение в другом процессе - индекс без данных не пишется
+        if self._path(active['stem'], _LOG_SUFFIX).exists():
+            self._write_index(active['stem'], self._index_of_active(active))
+
+    @staticmethod
+    def _index_of_active(active: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'size': active['size'],
+            'compacted': False,
+            'min_ts': active['min_ts'],
+            'max_ts': active['max_ts'],
+            'sessions': {str(k): list(v) for k, v in active['sessions'].items()}
+        }
+
+    # --- Индекс сегмента ---
+
+    @staticmethod
+    def _tmp_suffix(suffix: str) -> str:
+        """Имя временного файла уникально для процесса и потока"""
+        return f"{suffix}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+    def _write_index(self, stem: str, index: Dict[str, Any]):
+        index_path = self._path(stem, _INDEX_SUFFIX)
+        tmp_path = self._path(stem, self._tmp_suffix(_INDEX_SUFFIX))
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def _window_end(stem: str) -> Optional[int]:
+        """Конец окна сегмента по имени (None у сегментов без длины окна в имени)"""
+        parts = stem.split('-')
+        if len(parts) > 2 and parts[1].endswith('s') and parts[1][:-1].isdigit():
+            return int(parts[0]) + int(parts[1][:-1])
+        return None
+
+    def _is_stale(self, stem: str) -> bool:
+        """Окно сегмента давно закончилось - в него больше никто не пишет"""
+        end = self._window_end(stem)
+        if end is None:
+            end = int(stem.split('-')[0]) + self.segment_seconds
+        return end + self.segment_seconds <= time.time()
+
+    def _load_index(self, stem: str) -> Optional[Dict[str, Any]]:
+        """
+        Индекс сегмента (вызывается под _segments_lock).
+        Разобранные индексы кэшируются по (inode, размер, mtime) файла. Для сегментов
+        без индекса (активных в других процессах или оставшихся после сбоя) индекс
+        строится по полным строкам файла, а при росте файла дополняется только по
+        новому хвосту; у давно закрытых сегментов недописанный хвост отрезается,
+        а индекс сохраняется
+        """
+        path = self._path(stem, _LOG_SUFFIX)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._index_cache.pop(stem, None)
+            return None
+        fingerprint = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        cached = self._index_cache.get(stem)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        index = None
+        index_path = self._path(stem, _INDEX_SUFFIX)
+        if index_path.exists():
+            try:
+                with open(index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                if index.get('size') != stat.st_size:
+                    index = None
+            except ValueError:
+                index = None
+        if index is None:
+            # Файлы сегментов только дописываются: разобранное ранее начало не меняется
+            base = cached[1] if cached is not None and cached[0][0] == stat.st_ino and \
+                cached[1]['size'] <= stat.st_size else None
+            index = self._extend_index(path, base)
+            if stem.endswith(_COMPACTED):
+                # Индекс уплотненного сегмента пишется до публикации данных
+                index['compacted'] = True
+            if self._is_stale(stem):
+                if index['size'] != stat.st_size:
+                    with open(path, 'r+b') as f:
+                        f.truncate(index['size'])
+                    stat = path.stat()
+                    fingerprint = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                self._write_index(stem, index)
+        self._index_cache[stem] = (fingerprint, index)
+        return index
+
+    @staticmethod
+    def _extend_index(path: Path, base: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Индекс по полным строкам файла, начиная с конца ранее разобранной части base"""
+        if base is None:
+            index = {'size': 0, 'compacted': False, 'min_ts': None, 'max_ts': None,
+                     'sessions': {}}
+        else:
+            index = dict(base, sessions={k: list(v) for k, v in base['sessions'].items()})
+        sessions = index['sessions']
+        offset = index['size']
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                record = json.loads(line)
+                key = str(record['session_id'])
+                span = sessions.get(key)
+                if span is None:
+                    sessions[key] = [offset, offset + len(line)]
+                else:
+                    span[1] = offset + len(line)
+                offset += len(line)
+                timestamp = record['timestamp']
+                if index['min_ts'] is None or timestamp < index['min_ts']:
+                    index['min_ts'] = timestamp
+                if index['max_ts'] is None or timestamp > index['max_ts']:
+                    index['max_ts'] = timestamp
+        index['size'] = offset
+        return index
+
+    def _snapshot(self, stem: str, session_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Индекс сегмента с учетом активного сегмента этого процесса.
+        session_id - у активного сегмента копируется только диапазон этого сеанса
+        """
+        with self._lock:
+            active = self._active
+            if active is not None and active['stem'] == stem:
+                if session_id is None:
+                    return self._index_of_active(active)
+                span = active['sessions'].get(session_id)
+                return dict(size=active['size'], compacted=False, min_ts=active['min_ts'],
+                            max_ts=active['max_ts'],
+                            sessions={str(session_id): list(span)} if span else {})
+        return self._load_index(stem)
+
+    def _stems(self) -> List[str]:
+        """Сегменты каталога; исходный сегмент, уже замененный уплотненным, пропускается"""
+        stems = {p.stem for p in self.directory.glob(f"*{_LOG_SUFFIX}")}
+        with self._segments_lock:
+            for stem in [stem for stem in self._index_cache if stem not in stems]:
+                del self._index_cache[stem]
+        return sorted(stem for stem in stems if stem + _COMPACTED not in stems)
+
+    def _resolve(self, stem: str,
+                 session_id: Optional[int] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        (имя, индекс) сегмента. Если сегмент успели уплотнить после получения
+        списка сегментов - его уплотненная копия
+        """
+        for candidate in (stem, stem + _COMPACTED):
+            with self._segments_lock:
+                index = self._snapshot(candidate, session_id)
+            if index is not None:
+                return candidate, index
+        return None
+
+    # --- Чтение ---
+
+    @staticmethod
+    def _iter_file(f, start: int, end: int) -> Iterator[Dict[str, Any]]:
+        """Потоковое чтение записей открытого файла из диапазона байт [start, end) (построчно)"""
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            line = f.readline(remaining)
+            if not line:
+                break
+            remaining -= len(line)
+            yield json.loads(line)
+
+    @classmethod
+    def _iter_range(cls, path: Path, start: int, end: int) -> Iterator[Dict[str, Any]]:
+        with open(path, 'rb') as f:
+            yield from cls._iter_file(f, start, end)
+
+    @staticmethod
+    def _read_range(path: Path, start: int, end: int) -> List[Dict[str, Any]]:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return [json.loads(line) for line in data.splitlines()]
+
+    def read_session(self, session_id: int, since: float = None) -> Iterator[Dict[str, Any]]:
+        """
+        Взаимодействия сеанса в хронологическом порядке.
+        since - только записи с timestamp >= since: сегменты, окно которых
+        закончилось раньше, отбрасываются по имени, без загрузки индекса
+        """
+        self.flush()
+        records = []
+        for stem in self._stems():
+            if since is not None:
+                window_end = self._window_end(stem)
+                if window_end is not None and window_end <= since:
+                    continue
+            records.extend(self._session_records(stem, session_id, since))
+        records.sort(key=lambda r: r['timestamp'])
+        return iter(records)
+
+    def _session_records(self, stem: str, session_id: int,
+                         since: Optional[float]) -> List[Dict[str, Any]]:
+        for _ in range(2):
+            resolved = self._resolve(stem, session_id)
+            if resolved is None:
+                return []
+            stem, index = resolved
+            span = index['sessions'].get(str(session_id))
+            if not span:
+                return []
+            if since is not None and index['max_ts'] is not None and index['max_ts'] < since:
+                return []
+            try:
+                data = self._read_range(self._path(stem, _LOG_SUFFIX), span[0], span[1])
+            except FileNotFoundError:
+                # Сегмент удален уплотнением между чтением индекса и данных
+                continue
+            return [r for r in data if r['session_id'] == session_id and
+                    (since is None or r['timestamp'] >= since)]
+        return []
+
+    def segment_info(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Сегменты каталога: {stem: {'size', 'source', 'source_size'}}.
+        size - длина полных записей; у уплотненной копии source - имя исходного
+        сегмента и source_size - его длина (записи те же, в другом порядке)
+        """
+        self.flush()
+        result = {}
+        for stem in self._stems():
+            with self._lock:
+                active = self._active
+                if active is not None and active['stem'] == stem:
+                    result[stem] = {'size': active['size'], 'source': None, 'source_size': None}
+                    continue
+            resolved = self._resolve(stem)
+            if resolved is None:
+                continue
+            stem, index = resolved
+            result[stem] = {'size': index['size'], 'source': index.get('source'),
+                            'source_size': index.get('source_size')}
+        return result
+
+    def iter_segment(self, stem: str, start: int, end: int) -> Iterator[Dict[str, Any]]:
+        """
+        Потоковое чтение записей сегмента из диапазона байт [start, end).
+        Границы - длины полных записей из segment_info. FileNotFoundError,
+        если сегмент удален
+        """
+        return self._iter_range(self._path(stem, _LOG_SUFFIX), start, end)
+
+    def read_segment_sessions(self, stem: str, session_ids: Iterable[int],
+                              end: int) -> List[Dict[str, Any]]:
+        """
+        Записи сеансов session_ids из первых end байт сегмента: по индексу
+        читаются только диапазоны этих сеансов. FileNotFoundError, если сегмент удален
+        """
+        with self._segments_lock:
+            index = self._snapshot(stem)
+        if index is None:
+            raise FileNotFoundError(str(self._path(stem, _LOG_SUFFIX)))
+        wanted = set(session_ids)
+        spans = sorted((span[0], min(span[1], end)) for span in
+                       (index['sessions'].get(str(session_id)) for session_id in wanted)
+                       if span and span[0] < end)
+        ranges: List[List[int]] = []
+        for start, stop in spans:
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], stop)
+            else:
+                ranges.append([start, stop])
+        path = self._path(stem, _LOG_SUFFIX)
+        return [record for start, stop in ranges for record in self._iter_range(path, start, stop)
+                if record['session_id'] in wanted]
+
+    def scan(self, start_time: float = None, end_time: float = None) -> Iterator[Dict[str, Any]]:
+        """
+        Последовательный просмотр взаимодействий за интервал [start_time, end_time).
+        Сегменты читаются построчно, в памяти - одна запись; порядок - по сегментам,
+        внутри сегмента - порядок файла
+        """
+        self.flush()
+        for stem in self._stems():
+            f = None
+            for _ in range(2):
+                resolved = self._resolve(stem)
+                if resolved is None:
+                    break
+                stem, index = resolved
+                if index['min_ts'] is None:
+                    break
+                if start_time is not None and index['max_ts'] < start_time:
+                    break
+                if end_time is not None and index['min_ts'] >= end_time:
+                    break
+                try:
+                    # Открытый файл дочитывается, даже если уплотнение удалит сегмент
+                    f = open(self._path(stem, _LOG_SUFFIX), 'rb')
+                    break
+                except FileNotFoundError:
+                    continue
+            if f is None:
+                continue
+            with f:
+                for record in self._iter_file(f, 0, index['size']):
+                    if start_time is not None and record['timestamp'] < start_time:
+                        continue
+                    if end_time is not None and record['timestamp'] >= end_time:
+                        continue
+                    yield record
+
+    # --- Уплотнение ---
+
+    def compact(self) -> int:
+        """
+        Сортировка закрытых сегментов по session_id. Возвращает число уплотненных сегментов.
+
+        Уплотненный сегмент пишется во временный файл, затем публикуется его
+        индекс и сами данные под именем <stem>-c, и только после этого исходный
+        сегмент удаляется. Читатели предпочитают уплотненную копию, а файлы
+        не меняются на месте, поэтому индекс всегда соответствует данным.
+        Процессы, уплотняющие один каталог, согласуются блокировкой <stem>.lock
+        """
+        compacted = 0
+        stems = {path.stem for path in self.directory.glob(f"*{_LOG_SUFFIX}")}
+        for stem in sorted(stems):
+            if stem.endswith(_COMPACTED):
+                continue
+            if stem + _COMPACTED in stems:
+                # Копию опубликовали, но исходный сегмент не успели удалить
+                with self._segment_lock(stem) as locked:
+                    if locked:
+                        self._compact_segment(stem)
+                continue
+            with self._lock:
+                if self._active is not None and self._active['stem'] == stem:
+                    continue
+            if not self._path(stem, _INDEX_SUFFIX).exists() and not self._is_stale(stem):
+                # Сегмент пишет другой процесс
+                continue
+            with self._segments_lock:
+                index = self._load_index(stem)
+            if index is None or index['compacted']:
+                continue
+            if self._compaction_guard is not None and \
+                    not self._compaction_guard(stem, index['size']):
+                # Потребитель, читающий сегменты по смещениям, еще не дочитал сегмент
+                continue
+            with self._segment_lock(stem) as locked:
+                if locked and self._compact_segment(stem):
+                    compacted += 1
+        with self._lock:
+            self._stats['segments_compacted'] += compacted
+        return compacted
+
+    def set_compaction_guard(self, guard: Optional[Callable[[str, int], bool]]):
+        """
+        guard(stem, size) - можно ли уплотнить сегмент. Уплотнение меняет порядок
+        записей, поэтому потребитель, запоминающий смещения в сегментах, разрешает
+        его только для полностью обработанных сегментов
+        """
+        self._compaction_guard = guard
+
+    @contextmanager
+    def _segment_lock(self, stem: str):
+        """Межпроцессная блокировка уплотнения сегмента (без ожидания: занята - False)"""
+        with self._compaction_lock:
+            if fcntl is None:
+                yield True
+                return
+            lock_path = self._path(stem, _LOCK_SUFFIX)
+            with open(lock_path, 'a+b') as f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    if not self._path(stem, _LOG_SUFFIX).exists():
+                        lock_path.unlink(missing_ok=True)
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _compact_segment(self, stem: str) -> bool:
+        """Уплотнение одного сегмента (под блокировкой сегмента)"""
+        target = stem + _COMPACTED
+        if self._path(target, _LOG_SUFFIX).exists():
+            # Копию опубликовал другой процесс, но не успел удалить исходный сегмент
+            self._remove_segment(stem)
+            return False
+        with self._segments_lock:
+            index = self._load_index(stem)
+        if index is None or index['compacted']:
+            return False
+        with open(self._path(stem, _LOG_SUFFIX), 'rb') as f:
+            lines = f.read(index['size']).splitlines(keepends=True)
+        keys = [json.loads(line)['session_id'] for line in lines]
+        # Сортировка устойчивая: порядок записей внутри сеанса сохраняется
+        order = sorted(range(len(lines)), key=keys.__getitem__)
+
+        sessions: Dict[str, List[int]] = {}
+        offset = 0
+        tmp_path = self._path(target, self._tmp_suffix(_LOG_SUFFIX))
+        try:
+            with open(tmp_path, 'wb') as f:
+                for i in order:
+                    span = sessions.setdefault(str(keys[i]), [offset, offset])
+                    offset += len(lines[i])
+                    span[1] = offset
+                    f.write(lines[i])
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_index(target, dict(index, size=offset, compacted=True,
+                                           sessions=sessions, source=stem,
+                                           source_size=index['size']))
+            os.replace(tmp_path, self._path(target, _LOG_SUFFIX))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self._remove_segment(stem)
+        return True
+
+    def _remove_segment(self, stem: str):
+        self._path(stem, _LOG_SUFFIX).unlink(missing_ok=True)
+        self._path(stem, _INDEX_SUFFIX).unlink(missing_ok=True)
+
+    # --- Фоновое обслуживание ---
+
+    def start(self, compaction: bool = True):
+        """
+        Запуск фонового потока сброса буфера и уплотнения.
+        compaction=False - только сброс буфера (каталог уплотняет другой процесс)
+        """
+        if self._worker is not None:
+            return
+        self._compaction_enabled = compaction
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='interaction-log', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        last_compaction = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                with self._lock:
+                    self._flush_locked()
+                    # Окно закончилось, а новых записей не было - закрываем сегмент
+                    if (self._active is not None and
+                            self._window_of(time.time()) != self._active['window']):
+                        self._close_active_locked()
+                if self._compaction_enabled and \
+                        time.monotonic() - last_compaction >= self.compaction_interval:
+                    last_compaction = time.monotonic()
+                    self.compact()
+            except Exception:
+                logger.exception("Ошибка обслуживания журнала взаимодействий")
+
+    def close(self):
+        """Остановка фонового потока и закрытие активного сегмента"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        with self._lock:
+            self._flush_locked()
+            self._close_active_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика журнала"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['buffered'] = len(self._buffer)
+            stats['active_segment'] = self._active['stem'] if self._active else None
+        stats['segments'] = len(self._stems())
+        return stats
+
+
+def read_log_directory(directory: str) -> Iterator[Dict[str, Any]]:
+    """
+    Записи всех сегментов каталога журнала только чтением: в отличие от
+    InteractionLog, каталог, индексы и блокировки не создаются и файлы не
+    изменяются. Недописанный хвост сегмента пропускается; исходный сегмент,
+    уже замененный уплотненной копией, не читается повторно
+    """
+    root = Path(directory)
+    stems = {path.stem for path in root.glob(f"*{_LOG_SUFFIX}")} if root.is_dir() else set()
+    for stem in sorted(stems):
+        if stem + _COMPACTED in stems:
+            continue
+        for candidate in (stem, stem + _COMPACTED):
+            try:
+                f = open(root / f"{candidate}{_LOG_SUFFIX}", 'rb')
+            except FileNotFoundError:
+                # Сегмент удален уплотнением после получения списка
+                continue
+            with f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    yield json.loads(line)
+            break
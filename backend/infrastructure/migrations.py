@@ -0,0 +1,225 @@
+import sqlite3
+from typing import List, Tuple
+
+# Версионированные миграции схемы: (версия, описание, SQL-выражения).
+# Примененная версия хранится в PRAGMA user_version.
+# Новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'Исходная схема', [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            user_type TEXT NOT NULL CHECK(user_type IN ('owner', 'end_user')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            model_file_path TEXT,
+            status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'verified', 'failed')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (owner_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scenarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            scenario_data TEXT,
+            is_template BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS product_characteristics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            characteristic_name TEXT NOT NULL,
+            characteristic_value TEXT NOT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS test_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            scenario_id INTEGER,
+            session_data TEXT,
+            status TEXT DEFAULT 'active' CHECK(status IN ('active', 'completed')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (scenario_id) REFERENCES scenarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS interactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            interaction_type TEXT NOT NULL,
+            interaction_data TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES test_sessions(id)
+        )
+        """
+    ]),
+    (2, 'Индексы по внешним ключам и фильтрам горячих запросов', [
+        "CREATE INDEX IF NOT EXISTS idx_scenarios_product ON scenarios(product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_scenarios_template ON scenarios(is_template) WHERE is_template = 1",
+        # Покрывающий индекс: все столбцы характеристик читаются без обращения к таблице
+        """
+        CREATE INDEX IF NOT EXISTS idx_characteristics_product
+        ON product_characteristics(product_id, characteristic_name, characteristic_value)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_interactions_session ON interactions(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_test_sessions_user ON test_sessions(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_test_sessions_product ON test_sessions(product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_products_status ON products(status)",
+        "CREATE INDEX IF NOT EXISTS idx_products_owner ON products(owner_id)"
+    ]),
+    (3, 'Индекс для постраничной выдачи каталога по (created_at, id)', [
+        "CREATE INDEX IF NOT EXISTS idx_products_catalog ON products(status, created_at, id)"
+    ]),
+    (4, 'Агрегаты взаимодействий по продуктам, сценариям и временным интервалам', [
+        # scenario_id = 0 - сеансы без сценария
+        """
+        CREATE TABLE IF NOT EXISTS interaction_rollups (
+            product_id INTEGER NOT NULL,
+            scenario_id INTEGER NOT NULL,
+            interaction_type TEXT NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            interactions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, scenario_id, interaction_type, bucket_start)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS session_rollups (
+            session_id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            scenario_id INTEGER NOT NULL,
+            interactions INTEGER NOT NULL DEFAULT 0,
+            first_at REAL NOT NULL,
+            last_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_session_rollups_product ON session_rollups(product_id)",
+        """
+        CREATE TABLE IF NOT EXISTS scenario_rollups (
+            product_id INTEGER NOT NULL,
+            scenario_id INTEGER NOT NULL,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            interactions INTEGER NOT NULL DEFAULT 0,
+            duration_total REAL NOT NULL DEFAULT 0,
+            duration_max REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, scenario_id)
+        ) WITHOUT ROWID
+        """,
+        # Отметка обработанной части источника (время журнала или id строки interactions)
+        """
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            source TEXT PRIMARY KEY,
+            position REAL NOT NULL
+        )
+        """
+    ]),
+    (5, 'Время последней активности сеанса для завершения брошенных сеансов', [
+        # unix-время: последнее событие из снимка состояния или создание сеанса
+        "ALTER TABLE test_sessions ADD COLUMN last_active_at REAL",
+        """
+        UPDATE test_sessions
+        SET last_active_at = CAST(strftime('%s', created_at) AS REAL)
+        """,
+        # Частичный индекс: просматриваются только активные сеансы
+        """
+        CREATE INDEX IF NOT EXISTS idx_test_sessions_active
+        ON test_sessions(id, last_active_at) WHERE status = 'active'
+        """
+    ]),
+    (6, 'Версия строки сеанса для оптимистичной записи состояния', [
+        "ALTER TABLE test_sessions ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0"
+    ]),
+    (7, 'Журнал изменений для сброса кэшей рабочих процессов', [
+        # origin - pid процесса, внесшего изменение (свои записи он пропускает)
+        """
+        CREATE TABLE IF NOT EXISTS cache_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            key INTEGER NOT NULL,
+            origin INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    ]),
+    (8, 'Размер и хеш файла модели продукта', [
+        "ALTER TABLE products ADD COLUMN model_file_size INTEGER",
+        "ALTER TABLE products ADD COLUMN model_file_sha256 TEXT"
+    ]),
+    (9, 'Отметки агрегатов по смещениям в сегментах журнала', [
+        # Обработанная длина каждого сегмента журнала (байты полных записей)
+        """
+        CREATE TABLE IF NOT EXISTS rollup_segments (
+            source TEXT NOT NULL,
+            stem TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (source, stem)
+        ) WITHOUT ROWID
+        """,
+        # Прежняя отметка журнала - время, до которого записи уже учтены:
+        # в сегментах без отметки более ранние записи пропускаются
+        "ALTER TABLE rollup_state ADD COLUMN log_cutoff REAL",
+        "UPDATE rollup_state SET log_cutoff = position WHERE source = 'interaction_log'"
+    ]),
+    (10, 'Версия состояния сеанса, подтвержденная последней записью', [
+        # Движок, восстановивший из снимка и журнала более раннюю версию,
+        # видит, что журнал другого процесса еще не дописан
+        "ALTER TABLE test_sessions ADD COLUMN state_version INTEGER NOT NULL DEFAULT 0"
+    ])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы базы данных"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """
+    Применение недостающих миграций.
+    Каждая миграция выполняется в отдельной транзакции вместе с записью версии.
+    Возвращает список примененных версий
+    """
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    for version, _description, statements in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Версию перечитываем под блокировкой записи: миграции
+            # могли применить параллельно запущенные процессы
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, Optional
+
+import h11
+
+logger = logging.getLogger(__name__)
+
+# Пути, закрепленные за рабочим процессом по id: сеансы симуляции и прогоны сценариев
+_AFFINITY_PATH = re.compile(r'^/api/(simulation|runs)/(\d+)(/|$)')
+
+# Заголовки соединения не пересылаются
+_HOP_BY_HOP = {b'connection', b'keep-alive', b'transfer-encoding', b'upgrade',
+               b'host', b'content-length', b'te', b'trailer', b'proxy-connection'}
+
+
+class SessionAffinityMiddleware:
+    """
+    ASGI-посредник закрепления сеансов за рабочими процессами.
+
+    Запросы /api/simulation/{id}/... и /api/runs/{id}/... (включая WebSocket)
+    обслуживает только процесс id % worker_count, поэтому движок сеанса и
+    состояние прогона существуют ровно в одном процессе. Запрос, принятый другим
+    процессом, пересылается владельцу на его внутренний порт
+    (internal_port + номер процесса); запросы на внутренний порт всегда
+    обслуживаются на месте
+    """
+
+    def __init__(self, app: Callable, worker_index: int, worker_count: int,
+                 internal_port: int, internal_host: str = '127.0.0.1'):
+        self.app = app
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.internal_port = internal_port
+        self.internal_host = internal_host
+
+    def _owner(self, scope: Dict[str, Any]) -> Optional[int]:
+        """Номер процесса-владельца или None, если запрос обслуживается на месте"""
+        if scope['type'] not in ('http', 'websocket') or self.worker_count <= 1:
+            return None
+        server = scope.get('server')
+        if server and server[1] == self.internal_port + self.worker_index:
+            return None
+        match = _AFFINITY_PATH.match(scope['path'])
+        if match is None:
+            return None
+        owner = int(match.group(2)) % self.worker_count
+        return owner if owner != self.worker_index else None
+
+    async def __call__(self, scope, receive, send):
+        owner = self._owner(scope)
+        if owner is None:
+            await self.app(scope, receive, send)
+        elif scope['type'] == 'http':
+            await self._forward_http(scope, receive, send, owner)
+        else:
+            await self._forward_websocket(scope, receive, send, owner)
+
+    def _target(self, scope: Dict[str, Any]) -> bytes:
+        target = scope.get('raw_path') or scope['path'].encode()
+        if scope.get('query_string'):
+            target += b'?' + scope['query_string']
+        return target
+
+    async def _forward_http(self, scope, receive, send, owner: int):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        port = self.internal_port + owner
+        try:
+            reader, writer = await asyncio.open_connection(self.internal_host, port)
+        except OSError:
+            logger.warning("Рабочий процесс %d недоступен (порт %d)", owner, port)
+            await _send_error(send, 503, "Рабочий процесс сеанса недоступен")
+            return
+
+        connection = h11.Connection(h11.CLIENT)
+        headers = [(name, value) for name, value in scope['headers']
+                   if name.lower() not in _HOP_BY_HOP]
+        headers += [(b'host', f'{self.internal_host}:{port}'.encode()),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'connection', b'close')]
+        started = False
+        try:
+            writer.write(connection.send(h11.Request(
+                method=scope['method'], target=self._target(scope), headers=headers)))
+            if body:
+                writer.write(connection.send(h11.Data(data=body)))
+            writer.write(connection.send(h11.EndOfMessage()))
+            await writer.drain()
+
+            while True:
+                event = connection.next_event()
+                if event is h11.NEED_DATA:
+                    connection.receive_data(await reader.read(65536))
+                elif isinstance(event, h11.Response):
+                    started = True
+                    await send({
+                        'type': 'http.response.start',
+                        'status': event.status_code,
+                        'headers': [(name, value) for name, value in event.headers
+                                    if name not in (b'connection', b'transfer-encoding')]
+                    })
+                elif isinstance(event, h11.Data):
+                    await send({'type': 'http.response.body', 'body': bytes(event.data),
+                                'more_body': True})
+                elif isinstance(event, (h11.EndOfMessage, h11.ConnectionClosed)):
+                    if started:
+                        await send({'type': 'http.response.body', 'body': b''})
+                    else:
+                        await _send_error(send, 502, "Рабочий процесс сеанса не ответил")
+                    return
+        except (OSError, h11.ProtocolError):
+            logger.exception("Ошибка пересылки запроса рабочему процессу %d", owner)
+            if not started:
+                await _send_error(send, 502, "Ошибка пересылки запроса рабочему процессу")
+        finally:
+            writer.close()
+
+    async def _forward_websocket(self, scope, receive, send, owner: int):
+        # websockets устанавливается вместе с uvicorn[standard]
+        import websockets
+
+        await receive()  # websocket.connect
+        uri = f"ws://{self.internal_host}:{self.internal_port + owner}" \
+              f"{self._target(scope).decode('latin1')}"
+        try:
+            upstream = await websockets.connect(uri)
+        except (OSError, websockets.exceptions.WebSocketException):
+            logger.warning("Рабочий процесс %d недоступен для WebSocket", owner)
+            await send({'type': 'websocket.close', 'code': 1013})
+            return
+        await send({'type': 'websocket.accept'})
+
+        async def client_to_upstream():
+            while True:
+                message = await receive()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                if message.get('text') is not None:
+                    await upstream.send(message['text'])
+                elif message.get('bytes') is not None:
+                    await upstream.send(message['bytes'])
+
+        async def upstream_to_client():
+            try:
+                async for data in upstream:
+                    if isinstance(data, str):
+                        await send({'type': 'websocket.send', 'text': data})
+                    else:
+                        await send({'type': 'websocket.send', 'bytes': data})
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            await send({'type': 'websocket.close', 'code': upstream.close_code or 1000})
+
+        tasks = [asyncio.ensure_future(client_to_upstream()),
+                 asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+
+
+async def _send_error(send, status: int, detail: str):
+    body = json.dumps({'detail': detail}, ensure_ascii=False).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,62 @@
+import sqlite3
+from typing import Dict, Any
+
+# Предустановленные профили хранилища SQLite.
+# cache_size < 0 задается в килобайтах, mmap_size - в байтах.
+STORAGE_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Каждая транзакция гарантированно на диске
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -16000,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000
+    },
+    # Максимальная пропускная способность: при сбое питания возможна
+    # потеря последних транзакций, но не повреждение базы
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'cache_size': -65536,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    }
+}
+
+_SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+_TEMP_STORE_NAMES = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+
+
+def get_profile(name: str) -> Dict[str, Any]:
+    """Получение профиля по имени"""
+    if name not in STORAGE_PROFILES:
+        raise ValueError(
+            f"Неизвестный профиль хранилища '{name}', "
+            f"доступны: {', '.join(STORAGE_PROFILES)}")
+    return STORAGE_PROFILES[name]
+
+
+def apply_profile(conn: sqlite3.Connection, profile: Dict[str, Any]):
+    """Применение профиля к соединению"""
+    conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+    conn.execute(f"PRAGMA temp_store = {profile['temp_store']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+
+
+def read_settings(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Чтение фактических настроек соединения"""
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    temp_store = conn.execute("PRAGMA temp_store").fetchone()[0]
+    return {
+        'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0].upper(),
+        'synchronous': _SYNCHRONOUS_NAMES.get(synchronous, synchronous),
+        'mmap_size': conn.execute("PRAGMA mmap_size").fetchone()[0],
+        'cache_size': conn.execute("PRAGMA cache_size").fetchone()[0],
+        'temp_store': _TEMP_STORE_NAMES.get(temp_store, temp_store),
+        'busy_timeout': conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    }
@@ -0,0 +1,53 @@
+import json
+from typing import Callable, Iterable
+
+from fastapi import HTTPException
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI-посредник ограничения размера тела загрузок.
+
+    Для путей paths запрос с Content-Length больше max_bytes отклоняется (413)
+    до чтения тела. Тело без Content-Length (chunked) считается по мере
+    получения: при превышении предела чтение прерывается HTTPException(413),
+    поэтому форма не буферизуется целиком
+    """
+
+    def __init__(self, app: Callable, paths: Iterable[str], max_bytes: int):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope['headers']).get(b'content-length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await _send_error(send, 413, self._detail())
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"Размер файла модели превышает {self.max_bytes} байт"
+
+
+async def _send_error(send, status: int, detail: str):
+    body = json.dumps({'detail': detail}, ensure_ascii=False).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,93 @@
+"""
+Запуск сервера в нескольких рабочих процессах.
+
+Главный процесс открывает общий сокет host:port и запускает workers процессов
+uvicorn, передавая им сокет по номеру дескриптора. Процесс i получает
+WORKER_INDEX=i и WORKER_COUNT=workers и дополнительно слушает
+127.0.0.1:internal_port + i - на этот порт SessionAffinityMiddleware пересылает
+запросы закрепленных за ним сеансов. Завершившийся рабочий процесс перезапускается.
+
+Рабочий процесс: python -m infrastructure.workers --fd N (из каталога backend)
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+
+def serve(app: str, host: str, port: int, workers: int, internal_port: int):
+    """Запуск workers рабочих процессов приложения app ('модуль:объект') на host:port"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(2048)
+    listener.set_inheritable(True)
+
+    def start(index: int) -> subprocess.Popen:
+        env = dict(os.environ, WORKER_INDEX=str(index), WORKER_COUNT=str(workers),
+                   WORKER_INTERNAL_PORT=str(internal_port))
+        return subprocess.Popen(
+            [sys.executable, '-m', 'infrastructure.workers', '--app', app,
+             '--fd', str(listener.fileno())],
+            cwd=BACKEND_DIR, env=env, pass_fds=(listener.fileno(),))
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    processes: List[subprocess.Popen] = [start(index) for index in range(workers)]
+    logger.info("Запущено рабочих процессов: %d (http://%s:%d)", workers, host, port)
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            for index, process in enumerate(processes):
+                if process.poll() is not None and not stopping:
+                    logger.warning("Рабочий процесс %d завершился с кодом %s, перезапуск",
+                                   index, process.returncode)
+                    processes[index] = start(index)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        listener.close()
+
+
+def _run_worker(app: str, fd: int):
+    import uvicorn
+    import config
+
+    shared = socket.socket(fileno=fd)
+    internal = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    internal.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    internal.bind(('127.0.0.1', config.WORKER_INTERNAL_PORT + config.WORKER_INDEX))
+    uvicorn.Server(uvicorn.Config(app)).run(sockets=[shared, internal])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Рабочий процесс сервера")
+    parser.add_argument('--app', default='main:app')
+    parser.add_argument('--fd', type=int, required=True, help="дескриптор общего сокета")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    _run_worker(args.app, args.fd)
@@ -0,0 +1,170 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFullError(Exception):
+    """Очередь записи переполнена дольше отведенного времени"""
+
+
+class WriteTimeoutError(Exception):
+    """Результат операции записи не получен за отведенное время"""
+
+
+class WriteQueue:
+    """
+    Единственный поток-писатель SQLite с групповой фиксацией.
+
+    Операции записи (функции от соединения) ставятся в ограниченную очередь;
+    поток-писатель объединяет накопившиеся операции в одну транзакцию
+    (до batch_size операций или flush_interval секунд ожидания). Каждая операция
+    выполняется в своей точке сохранения: ошибка одной не отменяет остальные.
+    Результат возвращается через Future после фиксации транзакции
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_size: int,
+                 batch_size: int, flush_interval: float, put_timeout: float):
+        self._connect = connect
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {
+            'submitted': 0,
+            'committed': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'full_waits': 0,
+            'rejected': 0
+        }
+
+    def submit(self, operation: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Постановка операции в очередь. При заполненной очереди ждет put_timeout секунд"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Очередь записи закрыта")
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='sqlite-writer',
+                                                daemon=True)
+                self._worker.start()
+            self._stats['submitted'] += 1
+        try:
+            self._queue.put_nowait((operation, future))
+        except queue.Full:
+            with self._lock:
+                self._stats['full_waits'] += 1
+            try:
+                self._queue.put((operation, future), timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self._stats['rejected'] += 1
+                raise WriteQueueFullError(
+                    f"Очередь записи заполнена ({self.max_size}) дольше {self.put_timeout} с")
+        return future
+
+    def _collect_batch(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                # Сигнал остановки возвращаем в очередь для основного цикла
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                self._commit_batch(conn, self._collect_batch(first))
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = operation(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    future.set_exception(e)
+                    with self._lock:
+                        self._stats['failed'] += 1
+                    continue
+                conn.execute("RELEASE write_op")
+                results.append((future, result))
+            conn.commit()
+        except Exception as e:
+            logger.exception("Ошибка фиксации пакета записи")
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            # Ошибка BEGIN, точки сохранения или фиксации: завершаются все
+            # незавершенные операции пакета, включая еще не начатые
+            failed = 0
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    failed += 1
+            with self._lock:
+                self._stats['failed'] += failed
+            return
+
+        for future, result in results:
+            future.set_result(result)
+        with self._lock:
+            self._stats['committed'] += len(results)
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+
+    def close(self):
+        """Выполнение оставшихся операций и остановка потока-писателя"""
+        with self._lock:
+            self._closed = True
+            worker = self._worker
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика очереди записи"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['max_size'] = self.max_size
+        stats['avg_batch'] = (stats['committed'] + stats['failed']) / stats['batches'] \
+            if stats['batches'] else 0.0
+        return stats
@@ -1,39 +1,127 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional
 from pathlib import Path
-import json as json_lib
+import logging
 
 
+import config
 from infrastructure.database_repository import DatabaseRepository
 from infrastructure.file_storage import FileStorage
+from infrastructure.interaction_log import InteractionLog
+from infrastructure.async_repository import BlockingExecutor, AsyncProxy, AsyncDatabaseRepository
+from infrastructure.change_feed import ChangeFeed
+from infrastructure.session_routing import SessionAffinityMiddleware
+from infrastructure.upload_limit import UploadLimitMiddleware
 
 
 from services.auth_service import AuthService
 from services.product_service import ProductService
 from services.simulation_service import SimulationService
+from services.engine_cache import EngineCache
+from services.scenario_cache import ScenarioCache
+from services.scenario_runner import ScenarioRunner
+from services.interaction_rollups import InteractionRollups
+from services.interaction_analytics import InteractionAnalytics
+from services.columnar_export import ColumnarExporter
+from services.session_reaper import SessionReaper
 
 
 from controllers.auth_controller import AuthController
 from controllers.product_controller import ProductController
-from controllers.simulation_controller import SimulationController, CreateSessionRequest, InteractionRequest
+from controllers.simulation_controller import (
+    SimulationController, CreateSessionRequest, InteractionRequest, InteractionBatchRequest)
+from controllers.run_controller import ScenarioRunController, ScenarioRunRequest
+
+
+logger = logging.getLogger(__name__)
 
 
 db_repository = DatabaseRepository()
 file_storage = FileStorage()
+interaction_log = InteractionLog(
+    config.INTERACTION_LOG_DIR,
+    segment_seconds=config.INTERACTION_LOG_SEGMENT_SECONDS,
+    flush_every=config.INTERACTION_LOG_FLUSH_EVERY,
+    flush_interval=config.INTERACTION_LOG_FLUSH_INTERVAL,
+    compaction_interval=config.INTERACTION_LOG_COMPACTION_INTERVAL,
+    fsync=config.INTERACTION_LOG_FSYNC
+)
+
+
+# При нескольких рабочих процессах изменения каталога сбрасывают кэши остальных процессов
+multi_worker = config.WORKER_COUNT > 1
+change_feed = ChangeFeed(db_repository, config.CACHE_SYNC_INTERVAL,
+                         config.CACHE_CHANGES_RETENTION)
 
 
 auth_service = AuthService(db_repository)
-product_service = ProductService(db_repository, file_storage)
-simulation_service = SimulationService(db_repository)
+product_service = ProductService(db_repository, file_storage,
+                                 ScenarioCache(config.SCENARIO_CACHE_SIZE),
+                                 change_feed if multi_worker else None,
+                                 upload_max_bytes=config.MODEL_UPLOAD_MAX_BYTES,
+                                 upload_chunk_size=config.MODEL_UPLOAD_CHUNK_SIZE)
+engine_cache = (EngineCache(config.ENGINE_CACHE_SIZE, config.ENGINE_CACHE_TTL,
+                           config.ENGINE_CACHE_FLUSH_INTERVAL)
+                if config.ENGINE_CACHE_SIZE > 0 else None)
+simulation_service = SimulationService(db_repository, interaction_log, engine_cache)
+interaction_rollups = InteractionRollups(
+    db_repository, interaction_log,
+    bucket_seconds=config.ROLLUP_BUCKET_SECONDS,
+    interval=config.ROLLUP_INTERVAL
+)
+# Уплотнение меняет порядок записей: сегмент уплотняется, когда агрегаты его учли
+interaction_log.set_compaction_guard(interaction_rollups.is_segment_processed)
+interaction_analytics = InteractionAnalytics(
+    db_repository, interaction_log,
+    heatmap_bins=config.ANALYTICS_HEATMAP_BINS,
+    cache_size=config.ANALYTICS_CACHE_SIZE,
+    max_events=config.ANALYTICS_MAX_EVENTS
+)
+session_reaper = SessionReaper(
+    simulation_service, db_repository,
+    idle_ttl=config.SESSION_IDLE_TTL,
+    interval=config.SESSION_REAPER_INTERVAL,
+    batch_size=config.SESSION_REAPER_BATCH_SIZE,
+    shard=config.WORKER_INDEX,
+    shards=config.WORKER_COUNT
+)
+columnar_exporter = ColumnarExporter(db_repository, interaction_log, config.EXPORT_CHUNK_ROWS)
+scenario_runner = ScenarioRunner(
+    db_repository, interaction_log,
+    mode=config.SCENARIO_RUNNER_MODE,
+    max_workers=config.SCENARIO_RUNNER_WORKERS,
+    max_sessions=config.SCENARIO_RUNNER_MAX_SESSIONS,
+    max_active_runs=config.SCENARIO_RUNNER_MAX_ACTIVE,
+    chunk_size=config.SCENARIO_RUNNER_CHUNK_SIZE,
+    history_size=config.SCENARIO_RUNNER_HISTORY,
+    # id прогона определяет рабочий процесс, в котором он выполняется
+    first_id=config.WORKER_INDEX + config.WORKER_COUNT,
+    id_step=config.WORKER_COUNT
+)
 
 
-auth_controller = AuthController(auth_service)
-product_controller = ProductController(product_service, db_repository)
+# Блокирующая работа (SQLite, файлы) выполняется в ограниченном пуле потоков,
+# чтобы медленный запрос не останавливал цикл событий
+blocking_executor = BlockingExecutor(config.BLOCKING_EXECUTOR_WORKERS)
+async_db = AsyncDatabaseRepository(blocking_executor, db_repository)
+async_auth_service = AsyncProxy(auth_service, blocking_executor)
+async_product_service = AsyncProxy(product_service, blocking_executor)
+async_simulation_service = AsyncProxy(simulation_service, blocking_executor)
+async_scenario_runner = AsyncProxy(scenario_runner, blocking_executor)
+async_interaction_rollups = AsyncProxy(interaction_rollups, blocking_executor)
+async_interaction_analytics = AsyncProxy(interaction_analytics, blocking_executor)
+
+
+auth_controller = AuthController(async_auth_service)
+product_controller = ProductController(async_product_service, async_db,
+                                       async_interaction_rollups, async_interaction_analytics,
+                                       columnar_exporter)
 simulation_controller = SimulationController(
-    simulation_service, product_service, db_repository)
+    async_simulation_service, async_product_service, async_db)
+run_controller = ScenarioRunController(async_scenario_runner, async_product_service, async_db)
 
 
 app = FastAPI(
@@ -48,6 +136,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Тело загрузки модели ограничивается до разбора формы (в том числе без Content-Length)
+app.add_middleware(
+    UploadLimitMiddleware,
+    paths=["/api/products/upload"],
+    max_bytes=config.MODEL_UPLOAD_MAX_BYTES
+)
+
+# Сеансы и прогоны закреплены за рабочими процессами по id
+if multi_worker:
+    app.add_middleware(
+        SessionAffinityMiddleware,
+        worker_index=config.WORKER_INDEX,
+        worker_count=config.WORKER_COUNT,
+        internal_port=config.WORKER_INTERNAL_PORT
+    )
+
 static_dir = Path(__file__).parent.parent / "frontend" / "static"
 if static_dir.exists():
     app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
@@ -60,13 +164,40 @@ app.mount("/uploads/models",
 
 @app.on_event("startup")
 async def startup_event():
-    db_repository.init_database()
-    if not db_repository.get_user_by_username("test_owner"):
-        auth_service.register_user(
-            "test_owner", "owner@test.com", "password", "owner")
-    if not db_repository.get_user_by_username("test_user"):
-        auth_service.register_user(
-            "test_user", "user@test.com", "password", "end_user")
+    storage_settings = await async_db.init_database()
+    # Журнал общий для всех процессов: уплотняет его процесс 0
+    interaction_log.start(compaction=config.WORKER_INDEX == 0)
+    if engine_cache:
+        engine_cache.start()
+    # Агрегаты общие для всех процессов: достаточно одного фонового задания
+    if config.WORKER_INDEX == 0:
+        interaction_rollups.start()
+    if config.SESSION_IDLE_TTL > 0:
+        session_reaper.start()
+    if multi_worker:
+        change_feed.start()
+    logger.info("Настройки хранилища SQLite: %s", storage_settings)
+    # Тестовые аккаунты создает один процесс, чтобы не было гонки при регистрации
+    if config.WORKER_INDEX == 0:
+        if not await async_db.get_user_by_username("test_owner"):
+            await async_auth_service.register_user(
+                "test_owner", "owner@test.com", "password", "owner")
+        if not await async_db.get_user_by_username("test_user"):
+            await async_auth_service.register_user(
+                "test_user", "user@test.com", "password", "end_user")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    blocking_executor.shutdown()
+    scenario_runner.close()
+    interaction_rollups.close()
+    session_reaper.close()
+    change_feed.close()
+    if engine_cache:
+        engine_cache.close()
+    interaction_log.close()
+    db_repository.close_write_queue()
 
 
 # --- Аутентификация ---
@@ -75,13 +206,13 @@ async def startup_event():
 async def register(username: str = Form(...), email: str = Form(...),
                    password: str = Form(...), user_type: str = Form(...)):
     """Регистрация пользователя"""
-    return auth_controller.register(username, email, password, user_type)
+    return await auth_controller.register(username, email, password, user_type)
 
 
 @app.post("/api/auth/login")
 async def login(username: str = Form(...), password: str = Form(...)):
     """Вход в систему"""
-    return auth_controller.login(username, password)
+    return await auth_controller.login(username, password)
 
 
 # ---Управление продуктами ---
@@ -102,21 +233,66 @@ async def upload_product(
 
 
 @app.get("/api/products")
-async def get_products(owner_id: Optional[int] = None):
-    """Получение списка всех доступных продуктов или продуктов владельца"""
-    return product_controller.get_products(owner_id)
+async def get_products(owner_id: Optional[int] = None, limit: Optional[int] = None,
+                       cursor: Optional[str] = None, include: Optional[str] = None,
+                       format: str = "json"):
+    """
+    Получение списка всех доступных продуктов или продуктов владельца.
+    limit/cursor - постраничная выдача каталога ({items, next_cursor});
+    include - список вложений через запятую (по умолчанию "scenarios", пустая строка - без них);
+    format=ndjson - потоковая выдача по одному продукту в строке
+    """
+    if owner_id:
+        return await product_controller.get_products(owner_id)
+    include_scenarios = 'scenarios' in (include if include is not None else 'scenarios').split(',')
+    if format == 'ndjson':
+        return await product_controller.stream_products(limit, cursor, include_scenarios)
+    if format != 'json':
+        raise HTTPException(status_code=400, detail="Неверный формат: ожидается json или ndjson")
+    if limit is not None or cursor is not None:
+        return await product_controller.get_products_page(limit, cursor, include_scenarios)
+    return await product_controller.get_products(None, include_scenarios)
 
 
 @app.get("/api/products/{product_id}")
 async def get_product(product_id: int):
     """Получение детальной информации о продукте"""
-    return product_controller.get_product(product_id)
+    return await product_controller.get_product(product_id)
 
 
 @app.get("/api/products/{product_id}/scenarios")
 async def get_product_scenarios(product_id: int):
     """Получение сценариев для продукта"""
-    return product_controller.get_product_scenarios(product_id)
+    return await product_controller.get_product_scenarios(product_id)
+
+
+@app.get("/api/products/{product_id}/analytics")
+async def get_product_analytics(product_id: int, owner_id: int, start: Optional[float] = None,
+                                end: Optional[float] = None):
+    """
+    Сводка взаимодействий продукта из агрегатов: по типам, сценариям,
+    длительности сеансов и временным интервалам [start, end) (unix-время)
+    """
+    return await product_controller.get_product_analytics(product_id, owner_id, start, end)
+
+
+@app.get("/api/products/{product_id}/analytics/distributions")
+async def get_product_distributions(product_id: int, owner_id: int, bins: Optional[int] = None):
+    """
+    Распределения взаимодействий продукта: тепловая карта кликов (bins x bins),
+    гистограмма углов поворота, распределение масштаба, время между взаимодействиями
+    """
+    return await product_controller.get_product_distributions(product_id, owner_id, bins)
+
+
+@app.get("/api/products/{product_id}/export")
+async def export_product(product_id: int, owner_id: int, start: Optional[float] = None,
+                         end: Optional[float] = None):
+    """
+    Выгрузка сеансов и взаимодействий продукта за [start, end) (unix-время):
+    архив tar со столбцами .npy и manifest.json, передается потоком
+    """
+    return await product_controller.export_product(product_id, owner_id, start, end)
 
 
 @app.put("/api/products/{product_id}")
@@ -127,13 +303,13 @@ async def update_product_endpoint(
     owner_id: int = Form(...)
 ):
     """Обновление продукта"""
-    return product_controller.update_product(product_id, name, description, owner_id)
+    return await product_controller.update_product(product_id, name, description, owner_id)
 
 
 @app.delete("/api/products/{product_id}")
 async def delete_product_endpoint(product_id: int, owner_id: int):
     """Удаление продукта"""
-    return product_controller.delete_product(product_id, owner_id)
+    return await product_controller.delete_product(product_id, owner_id)
 
 
 # --- Симуляция ---
@@ -141,139 +317,119 @@ async def delete_product_endpoint(product_id: int, owner_id: int):
 @app.post("/api/simulation/create-session")
 async def create_simulation_session(request: CreateSessionRequest):
     """Создание сеанса тестирования"""
-    import json as json_lib
-    log_data = {
-        "sessionId": "debug-session",
-        "runId": "run1",
-        "hypothesisId": "A",
-        "location": "main.py:create_simulation_session",
-        "message": "Endpoint called with request data",
-        "data": {
-            "user_id": request.user_id,
-            "product_id": request.product_id,
-            "scenario_id": request.scenario_id
-        },
-        "timestamp": int(__import__('time').time() * 1000)
-    }
-    try:
-        with open('/Users/Vilka/Documents/ВУЗ/ОМИС/лр6/.cursor/debug.log', 'a', encoding='utf-8') as f:
-            f.write(json_lib.dumps(log_data, ensure_ascii=False) + '\n')
-    except:
-        pass
-    result = simulation_controller.create_simulation_session(request)
-    log_data2 = {
-        "sessionId": "debug-session",
-        "runId": "run1",
-        "hypothesisId": "A",
-        "location": "main.py:create_simulation_session",
-        "message": "Session created successfully",
-        "data": {"result": result},
-        "timestamp": int(__import__('time').time() * 1000)
-    }
-    try:
-        with open('/Users/Vilka/Documents/ВУЗ/ОМИС/лр6/.cursor/debug.log', 'a', encoding='utf-8') as f:
-            f.write(json_lib.dumps(log_data2, ensure_ascii=False) + '\n')
-    except:
-        pass
-    return result
+    return await simulation_controller.create_simulation_session(request)
 
 
 @app.post("/api/simulation/{session_id}/initialize")
 async def initialize_simulation(session_id: int):
     """Инициализация виртуальной среды"""
-    import json as json_lib
-    log_data = {
-        "sessionId": "debug-session",
-        "runId": "run1",
-        "hypothesisId": "E",
-        "location": "main.py:initialize_simulation",
-        "message": "Initialize called",
-        "data": {"session_id": session_id},
-        "timestamp": int(__import__('time').time() * 1000)
-    }
-    try:
-        with open('/Users/Vilka/Documents/ВУЗ/ОМИС/лр6/.cursor/debug.log', 'a', encoding='utf-8') as f:
-            f.write(json_lib.dumps(log_data, ensure_ascii=False) + '\n')
-    except:
-        pass
-    # #endregion
-    result = simulation_controller.initialize_simulation(session_id)
-    # #region agent log
-    log_data2 = {
-        "sessionId": "debug-session",
-        "runId": "run1",
-        "hypothesisId": "E",
-        "location": "main.py:initialize_simulation",
-        "message": "Product loaded",
-        "data": {"session_id": session_id},
-        "timestamp": int(__import__('time').time() * 1000)
-    }
-    try:
-        with open('/Users/Vilka/Documents/ВУЗ/ОМИС/лр6/.cursor/debug.log', 'a', encoding='utf-8') as f:
-            f.write(json_lib.dumps(log_data2, ensure_ascii=False) + '\n')
-    except:
-        pass
-    # #endregion
-    return result
+    return await simulation_controller.initialize_simulation(session_id)
 
 
 @app.post("/api/simulation/{session_id}/interact")
-async def process_interaction(session_id: int, request: InteractionRequest):
-    """Обработка взаимодействия пользователя"""
-    # #region agent log
-    log_data = {
-        "sessionId": "debug-session",
-        "runId": "run1",
-        "hypothesisId": "C",
-        "location": "main.py:process_interaction",
-        "message": "Interaction endpoint called",
-        "data": {
-            "session_id": session_id,
-            "interaction_type": request.interaction_type,
-            "interaction_data": request.interaction_data
-        },
-        "timestamp": int(__import__('time').time() * 1000)
-    }
-    try:
-        with open('/Users/Vilka/Documents/ВУЗ/ОМИС/лр6/.cursor/debug.log', 'a', encoding='utf-8') as f:
-            f.write(json_lib.dumps(log_data, ensure_ascii=False) + '\n')
-    except:
-        pass
-    result = simulation_controller.process_interaction(session_id, request)
-    log_data2 = {
-        "sessionId": "debug-session",
-        "runId": "run1",
-        "hypothesisId": "C",
-        "location": "main.py:process_interaction",
-        "message": "Interaction processed",
-        "data": {"result": result},
-        "timestamp": int(__import__('time').time() * 1000)
-    }
-    try:
-        with open('/Users/Vilka/Documents/ВУЗ/ОМИС/лр6/.cursor/debug.log', 'a', encoding='utf-8') as f:
-            f.write(json_lib.dumps(log_data2, ensure_ascii=False) + '\n')
-    except:
-        pass
-    return result
+async def process_interaction(session_id: int, request: InteractionRequest, mode: str = "full"):
+    """
+    Обработка взаимодействия пользователя.
+    mode=delta - в ответе только шаг, изменения состояния и номер версии
+    """
+    return await simulation_controller.process_interaction(session_id, request, mode)
+
+
+@app.post("/api/simulation/{session_id}/interact/batch")
+async def process_interactions(session_id: int, request: InteractionBatchRequest,
+                               mode: str = "delta"):
+    """
+    Обработка упорядоченного пакета взаимодействий за один проход.
+    Возвращает результат для каждого элемента; mode=full - также итоговое состояние
+    """
+    return await simulation_controller.process_interactions(session_id, request, mode)
+
+
+@app.websocket("/api/simulation/{session_id}/ws")
+async def simulation_websocket(websocket: WebSocket, session_id: int):
+    """Поток взаимодействий сеанса по WebSocket (ответы в формате delta)"""
+    await simulation_controller.handle_websocket(websocket, session_id)
 
 
 @app.get("/api/simulation/{session_id}/state")
-async def get_simulation_state(session_id: int):
-    """Получение текущего состояния симуляции"""
-    return simulation_controller.get_simulation_state(session_id)
+async def get_simulation_state(session_id: int, step: Optional[int] = None):
+    """
+    Получение текущего состояния симуляции.
+    step - состояние на указанном шаге текущей инициализации (восстанавливается из журнала)
+    """
+    return await simulation_controller.get_simulation_state(session_id, step)
+
+
+@app.get("/api/simulation/{session_id}/snapshot")
+async def get_simulation_snapshot(session_id: int):
+    """Полный снимок состояния симуляции с номером версии"""
+    return await simulation_controller.get_simulation_snapshot(session_id)
+
+
+@app.get("/api/simulation/{session_id}/interactions")
+async def get_session_interactions(session_id: int):
+    """История взаимодействий сеанса"""
+    return await simulation_controller.get_session_interactions(session_id)
 
 
 @app.post("/api/simulation/{session_id}/finalize")
 async def finalize_simulation(session_id: int):
     """Завершение сеанса симуляции"""
-    return simulation_controller.finalize_simulation(session_id)
+    return await simulation_controller.finalize_simulation(session_id)
+
+
+# --- Серверные прогоны сценариев ---
+
+@app.post("/api/runs")
+async def start_scenario_run(request: ScenarioRunRequest):
+    """Запуск прогона сценария на множестве виртуальных сеансов"""
+    return await run_controller.start_run(request)
+
+
+@app.get("/api/runs/{run_id}")
+async def get_scenario_run(run_id: int):
+    """Прогресс и итоговые результаты прогона"""
+    return await run_controller.get_run(run_id)
+
+
+@app.get("/api/runs/{run_id}/events")
+async def stream_scenario_run(run_id: int):
+    """Поток прогресса прогона (NDJSON) до его завершения"""
+    return await run_controller.stream_run(run_id)
+
+
+@app.post("/api/runs/{run_id}/cancel")
+async def cancel_scenario_run(run_id: int):
+    """Отмена прогона"""
+    return await run_controller.cancel_run(run_id)
 
 
 # --- Шаблоны сценариев ---
 @app.get("/api/scenarios/templates")
 async def get_scenario_templates():
     """Получение шаблонов сценариев"""
-    return product_controller.get_scenario_templates()
+    return await product_controller.get_scenario_templates()
+
+
+# --- Служебная информация ---
+@app.get("/api/system/stats")
+async def get_system_stats():
+    """Метрики инфраструктуры (пул соединений и т.п.)"""
+    return {
+        'db_pool': db_repository.get_pool_stats(),
+        'db_write_queue': db_repository.get_write_queue_stats(),
+        'storage': await async_db.get_storage_settings(),
+        'interaction_log': interaction_log.get_stats(),
+        'engine_cache': simulation_service.get_engine_cache_stats(),
+        'session_locks': simulation_service.get_session_lock_stats(),
+        'scenario_cache': product_service.get_scenario_cache_stats(),
+        'scenario_runner': scenario_runner.get_stats(),
+        'interaction_rollups': interaction_rollups.get_stats(),
+        'interaction_analytics': interaction_analytics.get_stats(),
+        'session_reaper': session_reaper.get_stats(),
+        'worker': {'index': config.WORKER_INDEX, 'count': config.WORKER_COUNT},
+        'change_feed': change_feed.get_stats() if multi_worker else None
+    }
 
 
 # --- Главная страница ---
@@ -287,5 +443,17 @@ async def root():
 
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    logging.basicConfig(level=logging.INFO)
+    # Процессы пула прогонов (spawn) заново выполняют модуль __main__: этот файл
+    # повторил бы в каждом из них всю инициализацию приложения (база, очередь
+    # записи, журнал, кэши). Главным модулем для них объявляется минимальный
+    # infrastructure.workers
+    __spec__ = importlib.util.find_spec("infrastructure.workers")
+    if config.WORKERS > 1:
+        from infrastructure.workers import serve
+        serve("main:app", host="0.0.0.0", port=8000, workers=config.WORKERS,
+              internal_port=config.WORKER_INTERNAL_PORT)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
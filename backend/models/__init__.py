@@ -3,9 +3,10 @@
 """
 from .user import User
 from .product import Product
-from .scenario import Scenario
+from .scenario import Scenario, ScenarioStep, CompiledScenario
 from .test_session import TestSession
 from .interaction import Interaction
+from .session_state import SessionState
 
-__all__ = ['User', 'Product', 'Scenario', 'TestSession', 'Interaction']
+__all__ = ['User', 'Product', 'Scenario', 'ScenarioStep', 'CompiledScenario', 'TestSession', 'Interaction', 'SessionState']
 
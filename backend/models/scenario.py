@@ -1,4 +1,5 @@
-from typing import Optional
+import json
+from typing import Any, Dict, Optional, Tuple
 from dataclasses import dataclass
 
 
@@ -38,3 +39,94 @@ class Scenario:
             created_at=data.get('created_at')
         )
 
+
+
+@dataclass(frozen=True, slots=True)
+class ScenarioStep:
+    """Шаг сценария: ожидаемое взаимодействие"""
+    index: int
+    interaction_type: str
+    interaction_data: Dict[str, Any]
+    description: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledScenario:
+    """
+    Разобранный и проверенный сценарий.
+    Неизменяем и разделяется между сеансами: data передается движку только для чтения
+    """
+    id: int
+    product_id: int
+    name: str
+    data: Dict[str, Any]
+    steps: Tuple[ScenarioStep, ...]
+    expected_interactions: Tuple[str, ...]
+    # Поколение продукта на момент компиляции (см. ScenarioCache)
+    version: int = 0
+
+    @classmethod
+    def compile(cls, row: dict, version: int = 0) -> 'CompiledScenario':
+        """
+        Компиляция строки таблицы scenarios.
+        ValueError, если scenario_data не является корректным описанием сценария
+        """
+        data = cls.parse_data(row.get('scenario_data'))
+        steps = cls.parse_steps(data)
+        expected = data.get('expected_interactions')
+        if expected is None:
+            expected_interactions = tuple(step.interaction_type for step in steps)
+        elif isinstance(expected, list) and all(isinstance(t, str) for t in expected):
+            expected_interactions = tuple(expected)
+        else:
+            raise ValueError('expected_interactions должен быть списком строк')
+        return cls(
+            id=row['id'],
+            product_id=row['product_id'],
+            name=row['name'],
+            data=data,
+            steps=steps,
+            expected_interactions=expected_interactions,
+            version=version
+        )
+
+    @staticmethod
+    def parse_data(scenario_data: Optional[str]) -> Dict[str, Any]:
+        """Разбор JSON scenario_data (пустое значение - пустой сценарий)"""
+        if not scenario_data:
+            return {}
+        try:
+            data = json.loads(scenario_data)
+        except ValueError as e:
+            raise ValueError('scenario_data не является корректным JSON') from e
+        if data is None:
+            return {}
+        if not isinstance(data, dict):
+            raise ValueError('scenario_data должен быть JSON-объектом')
+        return data
+
+    @staticmethod
+    def parse_steps(data: Dict[str, Any]) -> Tuple[ScenarioStep, ...]:
+        """
+        Шаги сценария из data['steps'].
+        Шаг - строка (тип взаимодействия) или объект
+        {interaction_type | type, interaction_data | data, description}
+        """
+        raw_steps = data.get('steps', [])
+        if not isinstance(raw_steps, list):
+            raise ValueError('steps должен быть списком')
+        steps = []
+        for index, raw in enumerate(raw_steps):
+            if isinstance(raw, str):
+                raw = {'interaction_type': raw}
+            if not isinstance(raw, dict):
+                raise ValueError(f'Шаг {index}: ожидается строка или объект')
+            interaction_type = raw.get('interaction_type', raw.get('type'))
+            if not isinstance(interaction_type, str) or not interaction_type:
+                raise ValueError(f'Шаг {index}: не указан тип взаимодействия')
+            interaction_data = raw.get('interaction_data', raw.get('data')) or {}
+            if not isinstance(interaction_data, dict):
+                raise ValueError(f'Шаг {index}: данные взаимодействия должны быть объектом')
+            steps.append(ScenarioStep(index, interaction_type, interaction_data,
+                                      raw.get('description')))
+        return tuple(steps)
@@ -0,0 +1,76 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+DEFAULT_RECENT_EVENTS = 32
+
+
+@dataclass(slots=True)
+class SessionState:
+    """
+    Компактное состояние сеанса симуляции.
+    Хранит счетчики, текущие преобразования модели и кольцевой буфер последних
+    событий; полная история взаимодействий находится только в журнале
+    """
+    initialized: bool = False
+    product: Optional[Dict[str, Any]] = None
+    scenario: Dict[str, Any] = field(default_factory=dict)
+    current_step: int = 0
+    interactions_count: int = 0
+    transforms: Dict[str, Any] = field(default_factory=dict)
+    # Номер версии состояния: увеличивается при каждом изменении
+    version: int = 0
+    # Версия на момент инициализации среды: события журнала с большей версией
+    # относятся к текущей инициализации
+    base_version: int = 0
+    # Время последнего учтенного события (для выборки событий после снимка)
+    last_event_at: float = 0.0
+    recent: Deque[Dict[str, Any]] = field(
+        default_factory=lambda: deque(maxlen=DEFAULT_RECENT_EVENTS))
+
+    def record(self, event: Dict[str, Any], updated_state: Dict[str, Any]):
+        """Учет обработанного взаимодействия"""
+        self.recent.append(event)
+        self.last_event_at = event['timestamp']
+        self.transforms.update(updated_state)
+        self.interactions_count += 1
+        self.current_step += 1
+        self.version += 1
+
+    def to_dict(self) -> dict:
+        """Преобразование в словарь"""
+        return {
+            'initialized': self.initialized,
+            'product': self.product,
+            'scenario': self.scenario,
+            'current_step': self.current_step,
+            'interactions_count': self.interactions_count,
+            'transforms': dict(self.transforms),
+            'version': self.version,
+            'base_version': self.base_version,
+            'last_event_at': self.last_event_at,
+            'recent_interactions': list(self.recent)
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, recent_limit: int = DEFAULT_RECENT_EVENTS) -> 'SessionState':
+        """Создание из словаря (поддерживается и прежний формат с полным списком interactions)"""
+        history = data.get('interactions')
+        if history is not None:
+            recent = history[-recent_limit:] if recent_limit else []
+            interactions_count = len(history)
+        else:
+            recent = data.get('recent_interactions', [])
+            interactions_count = data.get('interactions_count', 0)
+        return cls(
+            initialized=data.get('initialized', False),
+            product=data.get('product'),
+            scenario=data.get('scenario') or {},
+            current_step=data.get('current_step', 0),
+            interactions_count=interactions_count,
+            transforms=dict(data.get('transforms', {})),
+            version=data.get('version', 0),
+            base_version=data.get('base_version', 0),
+            last_event_at=data.get('last_event_at', 0.0),
+            recent=deque(recent, maxlen=recent_limit)
+        )
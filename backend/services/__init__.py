@@ -4,6 +4,13 @@
 from .auth_service import AuthService
 from .product_service import ProductService
 from .simulation_service import SimulationService
+from .engine_cache import EngineCache
+from .scenario_cache import ScenarioCache
+from .scenario_runner import ScenarioRunner
+from .interaction_rollups import InteractionRollups
+from .interaction_analytics import InteractionAnalytics
+from .columnar_export import ColumnarExporter
+from .session_reaper import SessionReaper
 
-__all__ = ['AuthService', 'ProductService', 'SimulationService']
+__all__ = ['AuthService', 'ProductService', 'SimulationService', 'EngineCache', 'ScenarioCache', 'ScenarioRunner', 'InteractionRollups', 'InteractionAnalytics', 'ColumnarExporter', 'SessionReaper']
 
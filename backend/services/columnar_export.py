@@ -0,0 +1,240 @@
+import calendar
+import io
+import json
+import re
+import struct
+import sys
+import tarfile
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+
+EXPORT_FORMAT = 'npy-columns/1'
+
+# Поля данных, которые всегда выгружаются для известных типов взаимодействий
+_KNOWN_FIELDS = {'click': ('x', 'y'), 'rotate': ('angle',), 'zoom': ('level',)}
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _db_time(value: Optional[str]) -> float:
+    if not value:
+        return float('nan')
+    return float(calendar.timegm(time.strptime(value[:19], '%Y-%m-%d %H:%M:%S')))
+
+
+def npy_bytes(values: List[Any], dtype: str) -> Tuple[bytes, str]:
+    """
+    Столбец в формате .npy (версия 1.0) без зависимости от numpy.
+    dtype: '<i8', '<f8' или '<U' (ширина строк вычисляется по данным).
+    Возвращает байты файла и итоговый тип
+    """
+    if dtype in ('<i8', '<f8'):
+        body = array('q' if dtype == '<i8' else 'd', values)
+        if sys.byteorder == 'big':
+            body.byteswap()
+        data = body.tobytes()
+    elif dtype == '<U':
+        width = max([len(value) for value in values] + [1])
+        dtype = f'<U{width}'
+        data = b''.join(value.ljust(width, '\0').encode('utf-32-le') for value in values)
+    else:
+        raise ValueError(f"Неподдерживаемый тип столбца: {dtype}")
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (dtype, len(values))
+    # Заголовок дополняется пробелами до кратности 64 байтам (вместе с magic и длиной)
+    header += ' ' * (63 - (10 + len(header)) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + \
+        header.encode('latin1') + data, dtype
+
+
+class _TarStream:
+    """Архив tar, записываемый потоком: готовые байты забираются через drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.tar = tarfile.open(fileobj=self, mode='w|')
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def add(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+    def close(self):
+        self.tar.close()
+
+
+class ColumnarExporter:
+    """
+    Потоковая выгрузка сеансов и взаимодействий в столбцы .npy внутри архива tar.
+
+    Сеансы - таблица sessions, взаимодействия - отдельная таблица на каждый тип
+    (interactions/<тип>); interaction_data раскладывается в типизированные
+    столбцы data.<поле>: числа - float64 (NaN при отсутствии), прочее - строки.
+    Таблицы пишутся частями не длиннее chunk_rows строк, журнал читается
+    построчно, поэтому память ограничена размером части. Описание частей и столбцов - в manifest.json в конце архива
+    """
+
+    def __init__(self, db_repository: DatabaseRepository,
+                 interaction_log: Optional[InteractionLog], chunk_rows: int = 65536):
+        self.db = db_repository
+        self.interaction_log = interaction_log
+        self.chunk_rows = max(1, chunk_rows)
+
+    def export(self, product_id: Optional[int] = None, start: Optional[float] = None,
+               end: Optional[float] = None) -> Iterator[bytes]:
+        """Байты архива выгрузки; interactions - за [start, end), sessions - созданные в нем"""
+        stream = _TarStream()
+        tables: Dict[str, Dict[str, Any]] = {}
+
+        after_id = 0
+        while True:
+            rows = self.db.get_test_sessions_page(after_id, self.chunk_rows,
+                                                  product_id, start, end)
+            if not rows:
+                break
+            after_id = rows[-1]['id']
+            self._write_part(stream, tables, 'sessions', self._session_columns(rows))
+            yield stream.drain()
+            if len(rows) < self.chunk_rows:
+                break
+
+        # Всего в буферах типов не больше chunk_rows записей: при заполнении
+        # пишется самый большой буфер, поэтому число типов не влияет на память
+        buffers: Dict[str, List[Dict[str, Any]]] = {}
+        buffered = 0
+        for record in self._interaction_records(product_id, start, end):
+            buffers.setdefault(record['interaction_type'], []).append(record)
+            buffered += 1
+            if buffered >= self.chunk_rows:
+                interaction_type = max(buffers, key=lambda name: len(buffers[name]))
+                buffer = buffers.pop(interaction_type)
+                self._write_interactions(stream, tables, interaction_type, buffer)
+                buffered -= len(buffer)
+                yield stream.drain()
+        for interaction_type, buffer in buffers.items():
+            self._write_interactions(stream, tables, interaction_type, buffer)
+            yield stream.drain()
+
+        manifest = {
+            'format': EXPORT_FORMAT,
+            'created_at': time.time(),
+            'product_id': product_id,
+            'start': start,
+            'end': end,
+            'tables': tables
+        }
+        stream.add('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2).encode())
+        stream.close()
+        yield stream.drain()
+
+    # --- Источники ---
+
+    def _interaction_records(self, product_id: Optional[int], start: Optional[float],
+                             end: Optional[float]) -> Iterator[Dict[str, Any]]:
+        if self.interaction_log is not None:
+            session_ids: Optional[Set[int]] = None
+            if product_id is not None:
+                session_ids = set(self.db.get_session_ids_by_product(product_id))
+            for record in self.interaction_log.scan(start, end):
+                if session_ids is None or record['session_id'] in session_ids:
+                    yield record
+            return
+
+        after_id = 0
+        while True:
+            rows = self.db.get_interactions_page(after_id, self.chunk_rows,
+                                                 product_id, start, end)
+            for row in rows:
+                try:
+                    data = json.loads(row['interaction_data']) if row['interaction_data'] else {}
+                except ValueError:
+                    data = {}
+                yield {
+                    'session_id': row['session_id'],
+                    'interaction_type': row['interaction_type'],
+                    'interaction_data': data,
+                    'timestamp': _db_time(row['timestamp']),
+                    'step': None,
+                    'version': None
+                }
+            if len(rows) < self.chunk_rows:
+                return
+            after_id = rows[-1]['id']
+
+    # --- Столбцы ---
+
+    @staticmethod
+    def _session_columns(rows: List[Dict[str, Any]]) -> Dict[str, Tuple[list, str]]:
+        return {
+            'id': ([row['id'] for row in rows], '<i8'),
+            'user_id': ([row['user_id'] for row in rows], '<i8'),
+            'product_id': ([row['product_id'] for row in rows], '<i8'),
+            'scenario_id': ([row['scenario_id'] if row['scenario_id'] is not None else -1
+                             for row in rows], '<i8'),
+            'status': ([row['status'] or '' for row in rows], '<U'),
+            'created_at': ([_db_time(row['created_at']) for row in rows], '<f8'),
+            'completed_at': ([_db_time(row['completed_at']) for row in rows], '<f8')
+        }
+
+    @staticmethod
+    def _interaction_columns(interaction_type: str,
+                             records: List[Dict[str, Any]]) -> Dict[str, Tuple[list, str]]:
+        columns = {
+            'session_id': ([r['session_id'] for r in records], '<i8'),
+            'timestamp': ([float(r['timestamp']) for r in records], '<f8'),
+            'step': ([r['step'] if r.get('step') is not None else -1 for r in records], '<i8'),
+            'version': ([r['version'] if r.get('version') is not None else -1
+                         for r in records], '<i8')
+        }
+        data = [r['interaction_data'] if isinstance(r['interaction_data'], dict) else {}
+                for r in records]
+        fields = dict.fromkeys(_KNOWN_FIELDS.get(interaction_type, ()))
+        for item in data:
+            fields.update(dict.fromkeys(item))
+        for field in fields:
+            values = [item.get(field) for item in data]
+            name = 'data.' + re.sub(r'[^A-Za-z0-9_-]', '_', str(field))
+            if all(value is None or _is_number(value) for value in values):
+                columns[name] = ([float(value) if value is not None else float('nan')
+                                  for value in values], '<f8')
+            else:
+                columns[name] = ([value if isinstance(value, str) else
+                                  '' if value is None else
+                                  json.dumps(value, ensure_ascii=False)
+                                  for value in values], '<U')
+        return columns
+
+    def _write_interactions(self, stream: _TarStream, tables: Dict[str, Dict[str, Any]],
+                            interaction_type: str, records: List[Dict[str, Any]]):
+        table = 'interactions/' + re.sub(r'[^A-Za-z0-9_-]', '_', interaction_type)
+        self._write_part(stream, tables, table,
+                         self._interaction_columns(interaction_type, records),
+                         interaction_type=interaction_type)
+
+    @staticmethod
+    def _write_part(stream: _TarStream, tables: Dict[str, Dict[str, Any]], table: str,
+                    columns: Dict[str, Tuple[list, str]], **meta):
+        info = tables.setdefault(table, dict(meta, rows=0, parts=[]))
+        path = f"{table}/part-{len(info['parts']):05d}"
+        dtypes = {}
+        rows = 0
+        for name, (values, dtype) in columns.items():
+            data, dtypes[name] = npy_bytes(values, dtype)
+            stream.add(f"{path}/{name}.npy", data)
+            rows = len(values)
+        info['rows'] += rows
+        info['parts'].append({'path': path, 'rows': rows, 'columns': dtypes})
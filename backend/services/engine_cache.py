@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EngineCache:
+    """
+    LRU-кэш активных движков симуляции с отложенной записью состояния.
+
+    Движок остается в памяти между запросами, а его состояние сохраняется
+    фоновым потоком раз в flush_interval, при вытеснении (по размеру или TTL)
+    и при удалении из кэша (завершение сеанса)
+    """
+
+    def __init__(self, max_size: int, ttl: float, flush_interval: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # session_id -> (движок, время последнего обращения)
+        self._engines: 'OrderedDict[int, List[Any]]' = OrderedDict()
+        # Вытесненные, но еще не сохраненные движки
+        self._pending: Dict[int, Any] = {}
+        # Закрепленные сеансы (например, с открытым WebSocket): не вытесняются
+        self._pinned: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evicted_size': 0,
+            'evicted_ttl': 0,
+            'flushes': 0,
+            'flush_errors': 0
+        }
+
+    def get(self, session_id: int, load: Callable[[], Any]) -> Any:
+        """Движок сеанса из кэша; при промахе создается через load()"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                self._engines.move_to_end(session_id)
+                self._stats['hits'] += 1
+                return entry[0]
+            engine = self._pending.pop(session_id, None)
+            if engine is not None:
+                # Вытесненный движок еще не сохранен - возвращаем его в кэш
+                self._stats['hits'] += 1
+                self._engines[session_id] = [engine, now]
+                return engine
+            self._stats['misses'] += 1
+
+        engine = load()
+        with self._lock:
+            # Параллельный запрос мог загрузить тот же сеанс раньше
+            entry = self._engines.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                return entry[0]
+            self._engines[session_id] = [engine, now]
+            evicted = self._evict_over_size_locked()
+        self._flush_evicted(evicted)
+        return engine
+
+    def pin(self, session_id: int, load: Callable[[], Any]) -> Any:
+        """Получение движка с закреплением в кэше до вызова unpin"""
+        with self._lock:
+            self._pinned[session_id] = self._pinned.get(session_id, 0) + 1
+        try:
+            return self.get(session_id, load)
+        except Exception:
+            self.unpin(session_id)
+            raise
+
+    def unpin(self, session_id: int):
+        """Снятие закрепления"""
+        with self._lock:
+            count = self._pinned.get(session_id, 0) - 1
+            if count > 0:
+                self._pinned[session_id] = count
+            else:
+                self._pinned.pop(session_id, None)
+
+    def peek(self, session_id: int) -> Optional[Tuple[Any, float]]:
+        """
+        Движок сеанса и время без обращений (секунды) без загрузки и без
+        обновления LRU. Закрепленный сеанс считается используемым (0),
+        вытесненный - давно не используемым. None, если движка нет в памяти
+        """
+        with self._lock:
+            entry = self._engines.get(session_id)
+            if entry is not None:
+                idle = 0.0 if session_id in self._pinned else time.monotonic() - entry[1]
+                return entry[0], idle
+            engine = self._pending.get(session_id)
+            return (engine, float('inf')) if engine is not None else None
+
+    def contains(self, engine: Any) -> bool:
+        """Находится ли этот движок в кэше"""
+        with self._lock:
+            entry = self._engines.get(engine.session_id)
+            return entry is not None and entry[0] is engine
+
+    def remove(self, session_id: int):
+        """Удаление движка из кэша с сохранением состояния"""
+        with self._lock:
+            entry = self._engines.pop(session_id, None)
+            engine = entry[0] if entry else self._pending.get(session_id)
+            if engine is not None:
+                self._pending[session_id] = engine
+        if engine is not None:
+            self._flush_evicted([(session_id, engine)])
+
+    def _evict_over_size_locked(self) -> list:
+        evicted = []
+        for session_id in list(self._engines):
+            if len(self._engines) <= self.max_size:
+                break
+            if session_id in self._pinned:
+                continue
+            engine, _ = self._engines.pop(session_id)
+            self._pending[session_id] = engine
+            self._stats['evicted_size'] += 1
+            evicted.append((session_id, engine))
+        return evicted
+
+    def _evict_expired(self) -> list:
+        deadline = time.monotonic() - self.ttl
+        evicted = []
+        with self._lock:
+            for session_id, (engine, last_access) in list(self._engines.items()):
+                if session_id in self._pinned:
+                    continue
+                if last_access > deadline:
+                    break
+                del self._engines[session_id]
+                self._pending[session_id] = engine
+                self._stats['evicted_ttl'] += 1
+                evicted.append((session_id, engine))
+        return evicted
+
+    def _persist(self, engine: Any) -> bool:
+        try:
+            if engine.persist_session_state():
+                with self._lock:
+                    self._stats['flushes'] += 1
+            return True
+        except Exception:
+            logger.exception("Не удалось сохранить состояние сеанса %s", engine.session_id)
+            with self._lock:
+                self._stats['flush_errors'] += 1
+            return False
+
+    def _flush_evicted(self, evicted: list):
+        for session_id, engine in evicted:
+            self._persist(engine)
+            with self._lock:
+                if self._pending.get(session_id) is engine:
+                    del self._pending[session_id]
+
+    def flush(self) -> int:
+        """Сохранение всех измененных движков. Возвращает число сохраненных"""
+        with self._lock:
+            engines = [entry[0] for entry in self._engines.values()]
+        flushed = 0
+        for engine in engines:
+            if engine.dirty and self._persist(engine):
+                flushed += 1
+        return flushed
+
+    def start(self):
+        """Запуск фонового потока отложенной записи и вытеснения по TTL"""
+        if self._worker is not None:
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='engine-cache', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._flush_evicted(self._evict_expired())
+                self.flush()
+            except Exception:
+                logger.exception("Ошибка обслуживания кэша движков")
+
+    def close(self):
+        """Остановка фонового потока и сохранение всех движков"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        with self._lock:
+            evicted = list(self._engines.items())
+            self._engines.clear()
+            for session_id, (engine, _) in evicted:
+                self._pending[session_id] = engine
+        self._flush_evicted([(session_id, entry[0]) for session_id, entry in evicted])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._engines)
+            stats['max_size'] = self.max_size
+            stats['pending'] = len(self._pending)
+            stats['pinned'] = len(self._pinned)
+            stats['dirty'] = sum(1 for entry in self._engines.values() if entry[0].dirty)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['miss_rate'] = stats['misses'] / lookups if lookups else 0.0
+        return stats
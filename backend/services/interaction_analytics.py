@@ -0,0 +1,440 @@
+import calendar
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость
+    np = None
+
+# Столбцы событий: session_id, timestamp, код типа и числовые поля данных
+_FIELDS = ('x', 'y', 'angle', 'level')
+_TYPE_CODES = {'click': 1, 'rotate': 2, 'zoom': 3}
+
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) \
+        else float('nan')
+
+
+def _to_columns(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Записи журнала -> столбцы NumPy (отсутствующие значения - NaN, прочие типы - код 0)"""
+    data = [record['interaction_data'] if isinstance(record['interaction_data'], dict) else {}
+            for record in records]
+    columns = {
+        'session_id': np.fromiter((record['session_id'] for record in records),
+                                  dtype=np.int64, count=len(records)),
+        'timestamp': np.fromiter((record['timestamp'] for record in records),
+                                 dtype=np.float64, count=len(records)),
+        'type': np.fromiter((_TYPE_CODES.get(record['interaction_type'], 0)
+                             for record in records), dtype=np.int8, count=len(records))
+    }
+    for field in _FIELDS:
+        columns[field] = np.fromiter((_number(item.get(field)) for item in data),
+                                     dtype=np.float64, count=len(records))
+    return columns
+
+
+def _concat(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    names = ('session_id', 'timestamp', 'type') + _FIELDS
+    if not chunks:
+        return {name: np.empty(0, dtype=np.int64 if name == 'session_id' else
+                               np.int8 if name == 'type' else np.float64) for name in names}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in names}
+
+
+def _summary(values) -> Optional[Dict[str, float]]:
+    if values.size == 0:
+        return None
+    p50, p95 = np.percentile(values, [50, 95])
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'p50': float(p50),
+        'p95': float(p95),
+        'max': float(values.max())
+    }
+
+
+class InteractionAnalytics:
+    """
+    Распределения взаимодействий продукта: тепловая карта кликов, гистограмма углов
+    поворота, распределение масштаба и время между взаимодействиями.
+
+    Столбцы NumPy хранятся по продуктам: при первом запросе из сегментов журнала
+    читаются только диапазоны сеансов продукта, затем новые хвосты сегментов
+    разбираются один раз и раскладываются по загруженным продуктам. У каждого
+    продукта свое поколение данных - новые события одного продукта не сбрасывают
+    результаты других. Продукты вытесняются по давности запроса (не более
+    cache_size продуктов и max_events событий в памяти).
+
+    Общая блокировка защищает только словари; чтение журнала и запросы к базе
+    идут вне ее, загрузка продукта - под блокировкой этого продукта
+    """
+
+    # Число записей хвоста сегмента, разбираемых за один шаг
+    _TAIL_BATCH = 65536
+    # Число кэшированных результатов (значений bins) на продукт
+    _RESULTS_PER_PRODUCT = 8
+    # Число повторов загрузки продукта, если сегмент уплотнен во время чтения
+    _LOAD_RETRIES = 2
+
+    def __init__(self, db_repository: DatabaseRepository,
+                 interaction_log: Optional[InteractionLog], heatmap_bins: int = 32,
+                 cache_size: int = 128, max_events: int = 2000000):
+        self.db = db_repository
+        self.interaction_log = interaction_log
+        self.heatmap_bins = heatmap_bins
+        self.cache_size = cache_size
+        self.max_events = max_events
+        # Словари и статистика; под этой блокировкой нет чтения файлов и запросов к базе
+        self._lock = threading.Lock()
+        # Дочитывание хвостов журнала и регистрация новых продуктов
+        self._refresh_lock = threading.Lock()
+        # stem -> прочитано байт (до этой границы загруженные продукты актуальны)
+        self._segments: Dict[str, int] = {}
+        # product_id -> {'chunks': {stem: [столбцы]}, 'sessions': set, 'events',
+        #                'generation', 'results': {bins: (поколение, результат)},
+        #                'ends': границы сегментов для загрузки, 'lock', 'ready', 'removed'}
+        self._products: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        # session_id -> product_id для сеансов загруженных продуктов
+        self._session_products: Dict[int, int] = {}
+        # Режим без журнала: (product_id, bins) -> (последний id взаимодействия, число сеансов, результат)
+        self._results: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'segments_parsed': 0, 'events_parsed': 0,
+                       'products_loaded': 0, 'products_evicted': 0}
+
+    # --- Журнал ---
+
+    def _refresh_log(self):
+        """
+        Дочитывание новых хвостов сегментов в зарегистрированные продукты
+        (под self._refresh_lock). Уплотненная копия полностью прочитанного сегмента
+        наследует его столбцы; данные удаленных сегментов отбрасываются с новым
+        поколением продуктов
+        """
+        info = self.interaction_log.segment_info()
+        copies = {meta['source']: (stem, meta['source_size'])
+                  for stem, meta in info.items() if meta['source']}
+        with self._lock:
+            for stem in [stem for stem in self._segments if stem not in info]:
+                end = self._segments.pop(stem)
+                copy = copies.get(stem)
+                inherit = copy is not None and copy[1] == end and copy[0] not in self._segments
+                if inherit:
+                    self._segments[copy[0]] = info[copy[0]]['size']
+                for product in self._products.values():
+                    chunks = product['chunks'].pop(stem, None)
+                    if inherit and chunks:
+                        product['chunks'][copy[0]] = chunks
+                    elif chunks:
+                        product['events'] -= sum(chunk['timestamp'].size for chunk in chunks)
+                        product['generation'] += 1
+            tails = [(stem, self._segments.get(stem, 0), meta['size'])
+                     for stem, meta in info.items() if meta['size'] > self._segments.get(stem, 0)]
+            if not self._products:
+                # Разбирать хвосты не для кого - они будут прочитаны при загрузке продуктов
+                for stem, _start, end in tails:
+                    self._segments[stem] = end
+                return
+        for stem, start, end in tails:
+            try:
+                self._read_tail(stem, start, end)
+            except FileNotFoundError:
+                # Сегмент уплотнен после получения списка - дочитаем копию в следующий раз
+                continue
+            with self._lock:
+                self._segments[stem] = end
+                self._stats['segments_parsed'] += 1
+
+    def _read_tail(self, stem: str, start: int, end: int):
+        batch = []
+        for record in self.interaction_log.iter_segment(stem, start, end):
+            batch.append(record)
+            if len(batch) >= self._TAIL_BATCH:
+                self._distribute(stem, batch)
+                batch = []
+        if batch:
+            self._distribute(stem, batch)
+
+    def _distribute(self, stem: str, records: List[Dict[str, Any]]):
+        """Раскладка записей хвоста по зарегистрированным продуктам"""
+        with self._lock:
+            unknown = {record['session_id'] for record in records} - \
+                self._session_products.keys()
+        # Новые сеансы: продукт запрашивается из базы вне блокировки
+        meta = self.db.get_sessions_meta(list(unknown)) if unknown else {}
+        with self._lock:
+            self._stats['events_parsed'] += len(records)
+            for session_id, (product_id, _scenario_id) in meta.items():
+                product = self._products.get(product_id)
+                if product is not None:
+                    product['sessions'].add(session_id)
+                    self._session_products[session_id] = product_id
+            session_products = {session_id: self._session_products.get(session_id)
+                                for session_id in {record['session_id'] for record in records}}
+            products = {product_id: self._products[product_id]
+                        for product_id in set(session_products.values()) if product_id is not None}
+        by_product: Dict[int, List[Dict[str, Any]]] = {}
+        for record in records:
+            product_id = session_products[record['session_id']]
+            if product_id is not None:
+                by_product.setdefault(product_id, []).append(record)
+        columns = {product_id: _to_columns(product_records)
+                   for product_id, product_records in by_product.items()}
+        with self._lock:
+            for product_id, product_columns in columns.items():
+                # Продукт мог быть вытеснен, пока столбцы строились
+                if self._products.get(product_id) is products[product_id]:
+                    self._add_chunk(products[product_id], stem, product_columns)
+
+    @staticmethod
+    def _add_chunk(product: Dict[str, Any], stem: str, columns: Dict[str, Any]):
+        chunks = product['chunks'].setdefault(stem, [])
+        chunks.append(columns)
+        if len(chunks) > 1:
+            # Части сегмента объединяются, чтобы число массивов не росло
+            product['chunks'][stem] = [_concat(chunks)]
+        product['events'] += int(columns['timestamp'].size)
+        product['generation'] += 1
+
+    def _register(self, product_id: int) -> Dict[str, Any]:
+        """
+        Регистрация продукта (под self._refresh_lock и self._lock): хвосты после
+        текущих границ сегментов будут разложены в него при дочитывании журнала
+        """
+        product = {'chunks': {}, 'sessions': set(), 'events': 0, 'generation': 0,
+                   'results': {}, 'ends': dict(self._segments), 'lock': threading.Lock(),
+                   'ready': False, 'removed': False}
+        self._products[product_id] = product
+        return product
+
+    def _unregister(self, product_id: int, product: Dict[str, Any]):
+        """Удаление продукта из памяти (под self._lock)"""
+        product['removed'] = True
+        if self._products.get(product_id) is product:
+            del self._products[product_id]
+        for session_id in product['sessions']:
+            if self._session_products.get(session_id) == product_id:
+                del self._session_products[session_id]
+
+    def _load_product(self, product_id: int, product: Dict[str, Any]):
+        """
+        Загрузка столбцов продукта до границ сегментов на момент регистрации
+        (под блокировкой продукта): из каждого сегмента читаются только диапазоны
+        сеансов продукта. FileNotFoundError, если сегмент уплотнен во время загрузки
+        """
+        # Сеансы запрашиваются после регистрации: более новые сеансы найдет дочитывание
+        sessions = set(self.db.get_session_ids_by_product(product_id))
+        with self._lock:
+            product['sessions'] |= sessions
+            for session_id in sessions:
+                self._session_products[session_id] = product_id
+        chunks = {}
+        if sessions:
+            for stem, end in product['ends'].items():
+                records = self.interaction_log.read_segment_sessions(stem, sessions, end)
+                if records:
+                    chunks[stem] = _to_columns(records)
+        with self._lock:
+            removed = [stem for stem in chunks if stem not in self._segments]
+            if removed:
+                # Сегмент заменен копией, которую дочитывание разложит заново
+                raise FileNotFoundError(removed[0])
+            for stem, columns in chunks.items():
+                self._add_chunk(product, stem, columns)
+            product['ready'] = True
+            self._stats['products_loaded'] += 1
+
+    def _evict(self, keep: int):
+        """
+        Вытеснение давно запрошенных продуктов сверх cache_size и max_events
+        (под self._lock); загружаемые продукты не вытесняются
+        """
+        total = sum(product['events'] for product in self._products.values())
+        for product_id in list(self._products):
+            if len(self._products) <= 1 or not (len(self._products) > self.cache_size or
+                                                total > self.max_events):
+                break
+            product = self._products[product_id]
+            if product_id == keep or not product['ready']:
+                continue
+            self._unregister(product_id, product)
+            total -= product['events']
+            self._stats['products_evicted'] += 1
+
+    def _resident_product(self, product_id: int) -> Dict[str, Any]:
+        """
+        Актуальные столбцы продукта; при необходимости продукт загружается.
+        Загрузки разных продуктов идут параллельно, повторные запросы
+        загружаемого продукта ждут на его блокировке
+        """
+        failures = 0
+        while True:
+            with self._refresh_lock:
+                self._refresh_log()
+                with self._lock:
+                    product = self._products.get(product_id)
+                    if product is None:
+                        product = self._register(product_id)
+                    self._products.move_to_end(product_id)
+            with product['lock']:
+                if product['ready']:
+                    break
+                if product['removed']:
+                    # Загрузка другим запросом не удалась - продукт регистрируется заново
+                    continue
+                try:
+                    self._load_product(product_id, product)
+                except FileNotFoundError:
+                    with self._lock:
+                        self._unregister(product_id, product)
+                    failures += 1
+                    if failures > self._LOAD_RETRIES:
+                        raise
+                    continue
+                except Exception:
+                    with self._lock:
+                        self._unregister(product_id, product)
+                    raise
+                break
+        with self._lock:
+            # Хвосты журнала и загрузка могли превысить пределы
+            self._evict(keep=product_id)
+        return product
+
+    # --- Распределения ---
+
+    def get_product_distributions(self, product_id: int,
+                                  bins: Optional[int] = None) -> Dict[str, Any]:
+        """Распределения взаимодействий продукта. RuntimeError, если numpy не установлен"""
+        if np is None:
+            raise RuntimeError('Для аналитики распределений требуется numpy')
+        bins = bins or self.heatmap_bins
+        if self.interaction_log is None:
+            return self._table_distributions(product_id, bins)
+
+        product = self._resident_product(product_id)
+        with self._lock:
+            generation = product['generation']
+            cached = product['results'].get(bins)
+            if cached is not None and cached[0] == generation:
+                self._stats['hits'] += 1
+                return cached[1]
+            self._stats['misses'] += 1
+            chunks = [chunk for chunks in product['chunks'].values() for chunk in chunks]
+
+        result = self._compute(_concat(chunks), bins)
+        result['product_id'] = product_id
+        with self._lock:
+            results = product['results']
+            results.pop(bins, None)
+            results[bins] = (generation, result)
+            while len(results) > self._RESULTS_PER_PRODUCT:
+                del results[next(iter(results))]
+        return result
+
+    def _table_distributions(self, product_id: int, bins: int) -> Dict[str, Any]:
+        """Режим без журнала: новые данные отмечает рост id в таблице interactions"""
+        session_ids = self.db.get_session_ids_by_product(product_id)
+        key = (product_id, bins)
+        generation = self.db.get_last_interaction_id()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == generation and \
+                    cached[1] == len(session_ids):
+                self._results.move_to_end(key)
+                self._stats['hits'] += 1
+                return cached[2]
+            self._stats['misses'] += 1
+
+        records = self._table_records(product_id)
+        result = self._compute(_concat([_to_columns(records)] if records else []), bins)
+        result['product_id'] = product_id
+        with self._lock:
+            self._results[key] = (generation, len(session_ids), result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return result
+
+    def _table_records(self, product_id: int) -> List[Dict[str, Any]]:
+        return [{
+            'session_id': row['session_id'],
+            'interaction_type': row['interaction_type'],
+            'interaction_data': json.loads(row['interaction_data'] or 'null'),
+            'timestamp': float(calendar.timegm(time.strptime(row['timestamp'],
+                                                             '%Y-%m-%d %H:%M:%S')))
+        } for row in self.db.get_product_interactions(product_id)]
+
+    @staticmethod
+    def _compute(columns: Dict[str, Any], bins: int) -> Dict[str, Any]:
+        """Векторный расчет распределений по столбцам событий продукта"""
+        kind = columns['type']
+
+        clicks = (kind == _TYPE_CODES['click']) & np.isfinite(columns['x']) & \
+            np.isfinite(columns['y'])
+        heatmap = None
+        if clicks.any():
+            counts, x_edges, y_edges = np.histogram2d(columns['x'][clicks],
+                                                      columns['y'][clicks], bins=bins)
+            heatmap = {
+                'x_edges': x_edges.tolist(),
+                'y_edges': y_edges.tolist(),
+                'counts': counts.astype(np.int64).tolist()
+            }
+
+        rotates = (kind == _TYPE_CODES['rotate']) & np.isfinite(columns['angle'])
+        angles = np.mod(columns['angle'][rotates], 360.0)
+        angle_counts, angle_edges = np.histogram(angles, bins=36, range=(0.0, 360.0))
+
+        zooms = (kind == _TYPE_CODES['zoom']) & np.isfinite(columns['level'])
+        levels = columns['level'][zooms]
+        zoom = None
+        if levels.size:
+            level_counts, level_edges = np.histogram(levels, bins=20)
+            zoom = {
+                'edges': level_edges.tolist(),
+                'counts': level_counts.tolist(),
+                'summary': _summary(levels)
+            }
+
+        # Время между соседними взаимодействиями сеанса и длительность сеансов
+        order = np.lexsort((columns['timestamp'], columns['session_id']))
+        sessions = columns['session_id'][order]
+        timestamps = columns['timestamp'][order]
+        same_session = sessions[1:] == sessions[:-1]
+        dwell = np.diff(timestamps)[same_session]
+        starts = np.flatnonzero(np.r_[True, ~same_session]) if sessions.size else \
+            np.empty(0, dtype=np.int64)
+        durations = np.maximum.reduceat(timestamps, starts) - \
+            np.minimum.reduceat(timestamps, starts) if starts.size else np.empty(0)
+
+        return {
+            'events': int(kind.size),
+            'sessions': int(starts.size),
+            'click_heatmap': heatmap,
+            'rotation_histogram': {
+                'edges': angle_edges.tolist(),
+                'counts': angle_counts.tolist()
+            },
+            'zoom_distribution': zoom,
+            'dwell_time': _summary(dwell),
+            'session_duration': _summary(durations)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша распределений"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_results'] = len(self._results) + \
+                sum(len(product['results']) for product in self._products.values())
+            stats['products_resident'] = len(self._products)
+            stats['events_loaded'] = sum(product['events'] for product in self._products.values())
+        stats['numpy'] = np is not None
+        return stats
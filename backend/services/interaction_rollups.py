@@ -0,0 +1,234 @@
+import calendar
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+
+logger = logging.getLogger(__name__)
+
+_LOG_SOURCE = 'interaction_log'
+_TABLE_SOURCE = 'interactions'
+
+
+class InteractionRollups:
+    """
+    Агрегаты взаимодействий по продукту, сценарию, типу и временному интервалу.
+
+    Фоновое задание догоняет источник (журнал взаимодействий или таблицу
+    interactions) от сохраненной отметки и добавляет приращения одной транзакцией
+    вместе с новой отметкой. Отметка журнала - обработанная длина каждого сегмента:
+    сегменты только дописываются, поэтому записи, сброшенные на диск с любым
+    опозданием, учитываются при следующем проходе, а прочитанное не перечитывается
+    """
+
+    def __init__(self, db_repository: DatabaseRepository,
+                 interaction_log: Optional[InteractionLog], bucket_seconds: int,
+                 interval: float, batch_size: int = 10000):
+        self.db = db_repository
+        self.interaction_log = interaction_log
+        self.bucket_seconds = bucket_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self.source = _LOG_SOURCE if interaction_log is not None else _TABLE_SOURCE
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {
+            'passes': 0,
+            'events': 0,
+            'conflicts': 0,
+            'errors': 0,
+            'last_pass_seconds': 0.0
+        }
+
+    def _bucket_of(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds) * self.bucket_seconds
+
+    def _aggregate(self, events: Iterable[Tuple[int, str, float]]) -> Tuple[dict, dict, int]:
+        """
+        Приращения агрегатов по событиям (session_id, interaction_type, timestamp).
+        События сворачиваются по сеансам за один проход: память зависит
+        от числа сеансов и интервалов, а не от числа событий
+        """
+        partials: Dict[int, List[Any]] = {}
+        count = 0
+        for session_id, interaction_type, timestamp in events:
+            count += 1
+            key = (interaction_type, self._bucket_of(timestamp))
+            partial = partials.get(session_id)
+            if partial is None:
+                partials[session_id] = [1, timestamp, timestamp, {key: 1}]
+                continue
+            partial[0] += 1
+            partial[1] = min(partial[1], timestamp)
+            partial[2] = max(partial[2], timestamp)
+            partial[3][key] = partial[3].get(key, 0) + 1
+
+        meta = self.db.get_sessions_meta(list(partials))
+        buckets: Dict[Tuple[int, int, str, int], int] = {}
+        sessions: Dict[int, List[Any]] = {}
+        for session_id, (total, first_at, last_at, counts) in partials.items():
+            if session_id not in meta:
+                continue
+            product_id, scenario_id = meta[session_id]
+            scenario_id = scenario_id or 0
+            sessions[session_id] = [product_id, scenario_id, total, first_at, last_at]
+            for (interaction_type, bucket_start), n in counts.items():
+                key = (product_id, scenario_id, interaction_type, bucket_start)
+                buckets[key] = buckets.get(key, 0) + n
+        return buckets, sessions, count
+
+    def catch_up(self) -> int:
+        """Обработка новых событий источника. Возвращает число учтенных событий"""
+        started = time.monotonic()
+        if self.source == _LOG_SOURCE:
+            processed = self._catch_up_log()
+        else:
+            processed = self._catch_up_table()
+        with self._lock:
+            self._stats['passes'] += 1
+            self._stats['events'] += processed
+            self._stats['last_pass_seconds'] = time.monotonic() - started
+        return processed
+
+    def _catch_up_log(self) -> int:
+        # Отметка источника - время прохода: все, что было на диске к этому
+        # времени, учтено; ее смена другим процессом означает конфликт
+        position = self.db.get_rollup_position(self.source)
+        started = time.time()
+        marks = self.db.get_rollup_segments(self.source)
+        cutoff = self.db.get_rollup_cutoff(self.source)
+        ranges: List[Tuple[str, int, int]] = []
+        segments: Dict[str, int] = {}
+        removed: List[str] = []
+        for stem, info in self.interaction_log.segment_info().items():
+            mark = marks.get(stem)
+            source = info['source']
+            if mark is None and source is not None and source in marks:
+                # Уплотненная копия: уплотнение разрешено только полностью учтенному сегменту
+                removed.append(source)
+                segments[stem] = info['size']
+                if marks[source] < info['source_size']:
+                    logger.warning("Сегмент %s уплотнен до полного учета в агрегатах", source)
+                continue
+            if info['size'] > (mark or 0):
+                ranges.append((stem, mark or 0, info['size']))
+                segments[stem] = info['size']
+        if not segments:
+            return 0
+
+        def events():
+            for stem, start, end in ranges:
+                # В сегментах без отметки записи раньше прежней отметки времени уже учтены
+                skip_before = cutoff if start == 0 and cutoff is not None else None
+                for r in self.interaction_log.iter_segment(stem, start, end):
+                    if skip_before is None or r['timestamp'] >= skip_before:
+                        yield r['session_id'], r['interaction_type'], r['timestamp']
+
+        buckets, sessions, processed = self._aggregate(events())
+        if not self.db.apply_rollups(self.source, position, max(started, position),
+                                     buckets, sessions, segments, removed):
+            with self._lock:
+                self._stats['conflicts'] += 1
+            return 0
+        return processed
+
+    def is_segment_processed(self, stem: str, size: int) -> bool:
+        """Сегмент журнала учтен полностью (условие его уплотнения)"""
+        if self.source != _LOG_SOURCE:
+            return True
+        return self.db.get_rollup_segments(self.source).get(stem, 0) >= size
+
+    def _catch_up_table(self) -> int:
+        processed = 0
+        while True:
+            position = self.db.get_rollup_position(self.source)
+            rows = self.db.get_interactions_after(int(position), self.batch_size)
+            if not rows:
+                return processed
+            events = [(row['session_id'], row['interaction_type'],
+                       float(calendar.timegm(time.strptime(row['timestamp'],
+                                                           '%Y-%m-%d %H:%M:%S'))))
+                      for row in rows]
+            buckets, sessions, _ = self._aggregate(events)
+            if not self.db.apply_rollups(self.source, position, rows[-1]['id'],
+                                         buckets, sessions):
+                with self._lock:
+                    self._stats['conflicts'] += 1
+                return processed
+            processed += len(rows)
+            if len(rows) < self.batch_size:
+                return processed
+
+    def get_product_analytics(self, product_id: int, start: Optional[float] = None,
+                              end: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Сводка взаимодействий продукта: по типам, по сценариям, длительности сеансов
+        и ряд по временным интервалам [start, end) (unix-время)
+        """
+        rollups = self.db.get_product_rollups(
+            product_id,
+            self._bucket_of(start) if start is not None else None,
+            int(end) if end is not None else None)
+        by_type: Dict[str, int] = {}
+        timeline: Dict[int, Dict[str, int]] = {}
+        for row in rollups['buckets']:
+            by_type[row['interaction_type']] = \
+                by_type.get(row['interaction_type'], 0) + row['interactions']
+            bucket = timeline.setdefault(row['bucket_start'], {})
+            bucket[row['interaction_type']] = \
+                bucket.get(row['interaction_type'], 0) + row['interactions']
+        scenarios = []
+        for row in rollups['scenarios']:
+            sessions = row['sessions']
+            scenarios.append({
+                'scenario_id': row['scenario_id'] or None,
+                'sessions': sessions,
+                'interactions': row['interactions'],
+                'interactions_per_session': row['interactions'] / sessions if sessions else 0.0,
+                'avg_duration': row['duration_total'] / sessions if sessions else 0.0,
+                'max_duration': row['duration_max']
+            })
+        return {
+            'product_id': product_id,
+            'bucket_seconds': self.bucket_seconds,
+            'updated_through': self.db.get_rollup_position(self.source),
+            'by_type': by_type,
+            'scenarios': scenarios,
+            'timeline': [{'bucket_start': bucket_start, 'interactions': counts}
+                         for bucket_start, counts in sorted(timeline.items())]
+        }
+
+    def start(self):
+        """Запуск фонового задания догоняющей агрегации"""
+        if self._worker is not None:
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='interaction-rollups',
+                                        daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.catch_up()
+            except Exception:
+                logger.exception("Ошибка обновления агрегатов взаимодействий")
+                with self._lock:
+                    self._stats['errors'] += 1
+
+    def close(self):
+        """Остановка фонового задания"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика агрегации"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['source'] = self.source
+        return stats
@@ -1,85 +1,153 @@
+import io
 import os
 import json
-from typing import Dict, Any, List, Optional
+import base64
+from typing import BinaryIO, Dict, Any, List, Optional, Tuple
 from infrastructure.database_repository import DatabaseRepository
 from infrastructure.file_storage import FileStorage
+from infrastructure.change_feed import ChangeFeed
 from models.product import Product
+from models.scenario import CompiledScenario
+from services.scenario_cache import ScenarioCache
 
 
 class ProductService:
     """Сервис для работы с продуктами"""
     
-    def __init__(self, db_repository: DatabaseRepository, file_storage: FileStorage):
+    def __init__(self, db_repository: DatabaseRepository, file_storage: FileStorage,
+                 scenario_cache: Optional[ScenarioCache] = None,
+                 change_feed: Optional[ChangeFeed] = None,
+                 upload_max_bytes: Optional[int] = None,
+                 upload_chunk_size: int = 1024 * 1024):
         self.db = db_repository
         self.file_storage = file_storage
+        self.upload_max_bytes = upload_max_bytes
+        self.upload_chunk_size = upload_chunk_size
+        self.scenario_cache = scenario_cache or ScenarioCache(0)
+        # При нескольких рабочих процессах изменения продуктов сбрасывают их кэши
+        self.change_feed = change_feed
+        if change_feed is not None:
+            change_feed.subscribe('product', self.scenario_cache.invalidate_product)
     
     def upload_product(self, owner_id: int, product_data: Dict[str, Any], 
-                      model_file: bytes = None, model_filename: str = None) -> Dict[str, Any]:
+                      model_file: bytes = None, model_filename: str = None,
+                      model_stream: Optional[BinaryIO] = None) -> Dict[str, Any]:
         """
         Загрузка продукта на платформу
-        Включает модель продукта, сценарии использования и характеристики
+        Включает модель продукта, сценарии использования и характеристики.
+        model_stream - файловый объект модели (вместо model_file): копируется
+        на диск блоками, без чтения в память целиком.
+        ValueError, если описание сценария или имя файла модели некорректно;
+        FileTooLargeError, если модель больше upload_max_bytes
         """
-        model_file_path = None
-        if model_file and model_filename:
-            model_file_path = self.file_storage.save_model_file(model_file, model_filename)
+        self.validate_scenarios(product_data)
+        if model_stream is None and model_file:
+            model_stream = io.BytesIO(model_file)
+        saved = None
+        if model_stream is not None and model_filename:
+            saved = self.file_storage.save_model_stream(
+                model_stream, model_filename, self.upload_max_bytes, self.upload_chunk_size)
+        model_file_path = saved['path'] if saved else None
         
-        product_id = self.db.create_product(
-            owner_id=owner_id,
-            name=product_data.get('name'),
-            description=product_data.get('description'),
-            model_file_path=model_file_path
-        )
+        # Проверка совместимости (симуляция) по размеру, посчитанному при записи
+        compatibility_result = self.check_compatibility(
+            model_file_path, saved['size'] if saved else None)
         
-        characteristics = product_data.get('characteristics', [])
-        for char in characteristics:
-            self.db.add_product_characteristic(
-                product_id=product_id,
-                name=char.get('name'),
-                value=char.get('value')
-            )
-        
-        scenarios = product_data.get('scenarios', [])
-        for scenario in scenarios:
-            self.db.create_scenario(
-                product_id=product_id,
-                name=scenario.get('name'),
-                description=scenario.get('description'),
-                scenario_data=json.dumps(scenario.get('data', {}))
-            )
-        
-        # Проверка совместимости (симуляция)
-        compatibility_result = self.check_compatibility(product_id, model_file_path)
+        record = self._build_product_record(owner_id, product_data, model_file_path,
+                                            compatibility_result)
+        if saved:
+            record['model_file_size'] = saved['size']
+            record['model_file_sha256'] = saved['sha256']
+        # Продукт, характеристики и сценарии записываются одной транзакцией
+        product_id = self.db.create_product_with_details(record)
         
         if compatibility_result['success']:
-            self.db.update_product_status(product_id, 'verified')
             return {
                 'success': True,
                 'product_id': product_id,
                 'message': 'Продукт успешно загружен и проверен'
             }
         else:
-            self.db.update_product_status(product_id, 'failed')
             return {
                 'success': False,
                 'product_id': product_id,
                 'message': f"Ошибка проверки совместимости: {compatibility_result['error']}"
             }
     
-    def check_compatibility(self, product_id: int, model_file_path: Optional[str]) -> Dict[str, Any]:
+    def import_products(self, owner_id: int, products_data: List[Dict[str, Any]]) -> List[int]:
+        """
+        Массовый импорт продуктов одной транзакцией.
+        Каждый элемент - product_data как в upload_product плюс необязательный model_file_path
+        """
+        records = []
+        for product_data in products_data:
+            self.validate_scenarios(product_data)
+            model_file_path = product_data.get('model_file_path')
+            records.append(self._build_product_record(
+                owner_id, product_data, model_file_path,
+                self.check_compatibility(model_file_path)
+            ))
+        return self.db.bulk_create_products(records)
+    
+    @staticmethod
+    def validate_scenarios(product_data: Dict[str, Any]):
+        """
+        Проверка описаний сценариев до записи: сценарий компилируется из того же
+        scenario_data, что будет сохранен, поэтому некорректный сценарий
+        (шаги, expected_interactions) отклоняется при загрузке, а не при инициализации
+        """
+        for scenario in product_data.get('scenarios', []):
+            try:
+                CompiledScenario.compile({
+                    'id': 0,
+                    'product_id': 0,
+                    'name': scenario.get('name'),
+                    'scenario_data': json.dumps(scenario.get('data', {}))
+                })
+            except ValueError as e:
+                raise ValueError(f"Сценарий «{scenario.get('name')}»: {e}") from e
+    
+    @staticmethod
+    def _build_product_record(owner_id: int, product_data: Dict[str, Any],
+                              model_file_path: Optional[str],
+                              compatibility_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Подготовка записи продукта для репозитория"""
+        return {
+            'owner_id': owner_id,
+            'name': product_data.get('name'),
+            'description': product_data.get('description'),
+            'model_file_path': model_file_path,
+            'status': 'verified' if compatibility_result['success'] else 'failed',
+            'characteristics': [
+                {'name': char.get('name'), 'value': char.get('value')}
+                for char in product_data.get('characteristics', [])
+            ],
+            'scenarios': [
+                {
+                    'name': scenario.get('name'),
+                    'description': scenario.get('description'),
+                    'scenario_data': json.dumps(scenario.get('data', {}))
+                }
+                for scenario in product_data.get('scenarios', [])
+            ]
+        }
+    
+    def check_compatibility(self, model_file_path: Optional[str],
+                            file_size: Optional[int] = None) -> Dict[str, Any]:
         """
         Проверка совместимости модели
-        В реальной системе здесь была бы сложная логика проверки
+        В реальной системе здесь была бы сложная логика проверки.
+        file_size - размер, известный после записи (файл повторно не проверяется)
         """
 
         if not model_file_path:
             return {'success': False, 'error': 'Файл модели не предоставлен'}
         
 
-        if not os.path.exists(model_file_path):
-            return {'success': False, 'error': 'Файл модели не найден'}
-        
-
-        file_size = os.path.getsize(model_file_path)
+        if file_size is None:
+            if not os.path.exists(model_file_path):
+                return {'success': False, 'error': 'Файл модели не найден'}
+            file_size = os.path.getsize(model_file_path)
         if file_size == 0:
             return {'success': False, 'error': 'Файл модели пуст'}
         
@@ -97,16 +165,93 @@ class ProductService:
         
         return product_dict
     
-    def get_all_available_products(self) -> List[Dict[str, Any]]:
+    def get_all_available_products(self, include_scenarios: bool = True) -> List[Dict[str, Any]]:
         """Получение всех доступных продуктов для пользователей"""
         products = self.db.get_all_products()
+        if include_scenarios:
+            self._attach_scenarios(products)
+        return products
+    
+    def get_available_products_page(self, limit: int, cursor: Optional[str] = None,
+                                    include_scenarios: bool = True) -> Dict[str, Any]:
+        """
+        Страница доступных продуктов (keyset-пагинация по created_at, id).
+        cursor - значение next_cursor предыдущей страницы; ValueError, если он некорректен
+        """
+        after = self.decode_catalog_cursor(cursor) if cursor else None
+        products = self.db.get_products_page(limit, after)
+        if include_scenarios:
+            self._attach_scenarios(products)
+        next_cursor = None
+        if len(products) == limit:
+            last = products[-1]
+            next_cursor = self.encode_catalog_cursor(last['created_at'], last['id'])
+        return {'items': products, 'next_cursor': next_cursor}
+    
+    def _attach_scenarios(self, products: List[Dict[str, Any]]):
+        """Добавление сценариев к продуктам (один запрос на весь список)"""
+        scenarios = self.db.get_scenarios_by_products([p['id'] for p in products])
+        for product in products:
+            product['scenarios'] = scenarios[product['id']]
+    
+    @staticmethod
+    def encode_catalog_cursor(created_at: str, product_id: int) -> str:
+        """Непрозрачный курсор каталога"""
+        raw = json.dumps([created_at, product_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+    
+    @staticmethod
+    def decode_catalog_cursor(cursor: str) -> Tuple[str, int]:
+        """Разбор курсора каталога"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, product_id = json.loads(base64.urlsafe_b64decode(padded))
+            return str(created_at), int(product_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError('Некорректный курсор каталога') from e
+    
+    def get_owner_products(self, owner_id: int) -> List[Dict[str, Any]]:
+        """Получение продуктов владельца со сценариями и характеристиками"""
+        products = self.db.get_products_by_owner(owner_id)
+        product_ids = [p['id'] for p in products]
+        scenarios = self.db.get_scenarios_by_products(product_ids)
+        characteristics = self.db.get_characteristics_by_products(product_ids)
         result = []
         for product in products:
             product_dict = dict(product)
-            product_dict['scenarios'] = self.db.get_scenarios_by_product(product['id'])
+            product_dict['scenarios'] = scenarios[product['id']]
+            product_dict['characteristics'] = characteristics[product['id']]
             result.append(product_dict)
         return result
     
+    def update_product(self, product_id: int, name: Optional[str] = None,
+                       description: Optional[str] = None):
+        """Обновление продукта со сбросом его скомпилированных сценариев"""
+        self.db.update_product(product_id, name=name, description=description)
+        self._invalidate_product(product_id)
+    
+    def delete_product(self, product_id: int):
+        """Удаление продукта со сбросом его скомпилированных сценариев"""
+        self.db.delete_product(product_id)
+        self._invalidate_product(product_id)
+    
+    def _invalidate_product(self, product_id: int):
+        """Сброс кэшей продукта в этом процессе и (через журнал изменений) в остальных"""
+        self.scenario_cache.invalidate_product(product_id)
+        if self.change_feed is not None:
+            self.change_feed.publish('product', product_id)
+    
+    def get_compiled_scenario(self, scenario_id: int) -> Optional[CompiledScenario]:
+        """
+        Скомпилированный сценарий из кэша (разбор scenario_data - только при промахе).
+        ValueError, если сохраненный сценарий некорректен
+        """
+        return self.scenario_cache.get(scenario_id, lambda: self.db.get_scenario(scenario_id))
+    
+    def get_scenario_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кэша скомпилированных сценариев"""
+        return self.scenario_cache.get_stats()
+    
     def get_scenario_templates(self) -> List[Dict[str, Any]]:
         """Получение всех шаблонов сценариев"""
         return self.db.get_scenario_templates()
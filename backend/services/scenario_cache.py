@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from models.scenario import CompiledScenario
+
+
+class ScenarioCache:
+    """
+    Ограниченный LRU-кэш скомпилированных сценариев.
+
+    Ключ - (id сценария, поколение продукта). Поколение увеличивается при
+    изменении или удалении продукта. Счетчик инвалидаций запоминается до
+    загрузки строки: если за время загрузки была инвалидация, сценарий
+    не кэшируется (продукт строки до загрузки неизвестен)
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._scenarios: 'OrderedDict[int, CompiledScenario]' = OrderedDict()
+        # product_id -> поколение (отсутствие ключа - поколение 0)
+        self._generations: Dict[int, int] = {}
+        # Число инвалидаций любых продуктов
+        self._invalidations = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evicted': 0,
+            'invalidated': 0
+        }
+
+    def get(self, scenario_id: int,
+            load: Callable[[], Optional[dict]]) -> Optional[CompiledScenario]:
+        """
+        Скомпилированный сценарий; при промахе строка загружается через load().
+        None, если сценарий не найден; ValueError, если он некорректен
+        """
+        with self._lock:
+            compiled = self._scenarios.get(scenario_id)
+            if compiled is not None and \
+                    compiled.version == self._generations.get(compiled.product_id, 0):
+                self._scenarios.move_to_end(scenario_id)
+                self._stats['hits'] += 1
+                return compiled
+            self._stats['misses'] += 1
+            invalidations = self._invalidations
+
+        row = load()
+        if row is None:
+            return None
+        with self._lock:
+            generation = self._generations.get(row['product_id'], 0)
+        compiled = CompiledScenario.compile(row, generation)
+        if self.max_size <= 0:
+            return compiled
+        with self._lock:
+            # Во время загрузки был изменен продукт - результат не кэшируем
+            if self._invalidations == invalidations:
+                self._scenarios[scenario_id] = compiled
+                self._scenarios.move_to_end(scenario_id)
+                while len(self._scenarios) > self.max_size:
+                    self._scenarios.popitem(last=False)
+                    self._stats['evicted'] += 1
+        return compiled
+
+    def invalidate_product(self, product_id: int):
+        """Сброс сценариев продукта (вызывается при изменении и удалении продукта)"""
+        with self._lock:
+            self._generations[product_id] = self._generations.get(product_id, 0) + 1
+            self._invalidations += 1
+            stale = [scenario_id for scenario_id, compiled in self._scenarios.items()
+                     if compiled.product_id == product_id]
+            for scenario_id in stale:
+                del self._scenarios[scenario_id]
+            self._stats['invalidated'] += len(stale)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._scenarios)
+            stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
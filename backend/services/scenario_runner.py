@@ -0,0 +1,365 @@
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.util
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor,
+                                FIRST_COMPLETED, wait)
+from typing import Any, Dict, List, Optional, Tuple
+import config
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+from models.scenario import CompiledScenario
+from services.simulation_service import SimulationEngine
+
+logger = logging.getLogger(__name__)
+
+# Результат одного виртуального сеанса: (session_id, успех, взаимодействий, секунд, ошибка)
+SessionResult = Tuple[int, bool, int, float, Optional[str]]
+
+# Журнал взаимодействий рабочего процесса (создается инициализатором пула)
+_worker_log: Optional[InteractionLog] = None
+
+
+class ScenarioRunnerBusyError(Exception):
+    """Достигнуто максимальное число одновременных прогонов"""
+
+
+def run_sessions(session_ids: List[int], product: Dict[str, Any],
+                 scenario_data: Dict[str, Any], steps: List[Tuple[str, Dict[str, Any]]],
+                 interaction_log: Optional[InteractionLog]) -> List[SessionResult]:
+    """Прогон сценария в каждом сеансе: инициализация, пакет шагов, завершение"""
+    db = DatabaseRepository()
+    results = []
+    for session_id in session_ids:
+        started = time.perf_counter()
+        try:
+            engine = SimulationEngine(session_id, db, interaction_log)
+            engine.initialize_environment(product, scenario_data)
+            response = engine.process_interactions(steps, delta=True)
+            if not response['success']:
+                raise RuntimeError(response.get('error'))
+            engine.finalize_session()
+            results.append((session_id, True, len(steps),
+                            time.perf_counter() - started, None))
+        except Exception as e:
+            results.append((session_id, False, 0, time.perf_counter() - started,
+                            f"{type(e).__name__}: {e}"))
+    if interaction_log is not None:
+        interaction_log.flush()
+    return results
+
+
+def _init_process_worker():
+    """Инициализация рабочего процесса: собственные сегменты журнала и поток-писатель"""
+    global _worker_log
+    _worker_log = InteractionLog(
+        config.INTERACTION_LOG_DIR,
+        segment_seconds=config.INTERACTION_LOG_SEGMENT_SECONDS,
+        flush_every=config.INTERACTION_LOG_FLUSH_EVERY,
+        flush_interval=config.INTERACTION_LOG_FLUSH_INTERVAL,
+        compaction_interval=config.INTERACTION_LOG_COMPACTION_INTERVAL,
+        fsync=config.INTERACTION_LOG_FSYNC
+    )
+    # Фоновый сброс буфера и закрытие сегмента по окончании окна; каталог
+    # уплотняет процесс сервера
+    _worker_log.start(compaction=False)
+    # Финализаторы multiprocessing выполняются при штатном завершении процесса пула
+    multiprocessing.util.Finalize(_worker_log, _worker_log.close, exitpriority=10)
+    multiprocessing.util.Finalize(None, DatabaseRepository.close_write_queue, exitpriority=5)
+
+
+def _run_sessions_in_process(session_ids: List[int], product: Dict[str, Any],
+                             scenario_data: Dict[str, Any],
+                             steps: List[Tuple[str, Dict[str, Any]]]) -> List[SessionResult]:
+    return run_sessions(session_ids, product, scenario_data, steps, _worker_log)
+
+
+class ScenarioRun:
+    """Прогон сценария на множестве виртуальных сеансов: прогресс и итоги"""
+
+    def __init__(self, run_id: int, user_id: int, product_id: int, scenario_id: int,
+                 session_ids: List[int], steps_count: int):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.product_id = product_id
+        self.scenario_id = scenario_id
+        self.session_ids = session_ids
+        self.steps_count = steps_count
+        self.lock = threading.Lock()
+        self.cancel_requested = threading.Event()
+        self.status = 'pending'
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.interactions = 0
+        self.durations: List[float] = []
+        self.errors: List[str] = []
+        # Увеличивается при каждом изменении прогресса
+        self.version = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'cancelled', 'failed')
+
+    def record(self, results: List[SessionResult]):
+        """Учет результатов задачи рабочего"""
+        with self.lock:
+            for _session_id, success, interactions, seconds, error in results:
+                self.durations.append(seconds)
+                if success:
+                    self.completed += 1
+                    self.interactions += interactions
+                else:
+                    self.failed += 1
+                    if len(self.errors) < 10:
+                        self.errors.append(error)
+            self.version += 1
+
+    def set_status(self, status: str):
+        with self.lock:
+            self.status = status
+            now = time.time()
+            if status == 'running':
+                self.started_at = now
+            elif self.finished:
+                self.finished_at = now
+            self.version += 1
+
+    @staticmethod
+    def _percentile(ordered: List[float], fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Прогресс и агрегированные результаты"""
+        with self.lock:
+            total = len(self.session_ids)
+            done = self.completed + self.failed
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            ordered = sorted(self.durations)
+            latency = None
+            if ordered:
+                latency = {
+                    'mean': sum(ordered) / len(ordered) * 1000,
+                    'p50': self._percentile(ordered, 0.5) * 1000,
+                    'p95': self._percentile(ordered, 0.95) * 1000,
+                    'max': ordered[-1] * 1000
+                }
+            return {
+                'run_id': self.run_id,
+                'user_id': self.user_id,
+                'product_id': self.product_id,
+                'scenario_id': self.scenario_id,
+                'status': self.status,
+                'version': self.version,
+                'sessions': total,
+                'steps': self.steps_count,
+                'completed': self.completed,
+                'failed': self.failed,
+                'skipped': self.skipped,
+                'progress': done / total if total else 1.0,
+                'interactions': self.interactions,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed': elapsed,
+                'sessions_per_second': done / elapsed if elapsed else 0.0,
+                'interactions_per_second': self.interactions / elapsed if elapsed else 0.0,
+                'session_latency_ms': latency,
+                'errors': list(self.errors)
+            }
+
+
+class ScenarioRunner:
+    """
+    Серверный прогон сценария на множестве виртуальных сеансов.
+
+    Сеансы создаются одной транзакцией и делятся на задачи по chunk_size;
+    задачи выполняются пулом процессов (или потоков), в работе одновременно
+    не больше двух задач на рабочего. Отмена прекращает выдачу новых задач,
+    невыполненные сеансы завершаются без взаимодействий
+    """
+
+    def __init__(self, db_repository: DatabaseRepository,
+                 interaction_log: Optional[InteractionLog], mode: str, max_workers: int,
+                 max_sessions: int, max_active_runs: int, chunk_size: int,
+                 history_size: int = 100, first_id: int = 1, id_step: int = 1):
+        if mode not in ('process', 'thread'):
+            raise ValueError(f"Неизвестный режим прогона: {mode}")
+        self.db = db_repository
+        self.interaction_log = interaction_log
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_sessions = max_sessions
+        self.max_active_runs = max_active_runs
+        self.chunk_size = max(1, chunk_size)
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._runs: 'OrderedDict[int, ScenarioRun]' = OrderedDict()
+        self._threads: Dict[int, threading.Thread] = {}
+        # При нескольких рабочих процессах id прогона определяет процесс,
+        # в котором он выполняется (id % WORKER_COUNT)
+        self._ids = itertools.count(first_id, id_step)
+        self._closed = False
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'process':
+                    # spawn: дочерние процессы не наследуют соединения SQLite и потоки
+                    self._executor = ProcessPoolExecutor(
+                        self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_process_worker)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        self.max_workers, thread_name_prefix='scenario-runner')
+            return self._executor
+
+    def start_run(self, user_id: int, product: Dict[str, Any], scenario: CompiledScenario,
+                  sessions: int) -> Dict[str, Any]:
+        """
+        Запуск прогона в фоне. ValueError - неверные параметры,
+        ScenarioRunnerBusyError - достигнут предел одновременных прогонов
+        """
+        if not 1 <= sessions <= self.max_sessions:
+            raise ValueError(f"Число сеансов должно быть от 1 до {self.max_sessions}")
+        if not scenario.steps:
+            raise ValueError("В сценарии нет шагов для прогона")
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Исполнитель прогонов остановлен")
+            if len(self._threads) >= self.max_active_runs:
+                raise ScenarioRunnerBusyError(
+                    f"Уже выполняется {self.max_active_runs} прогонов")
+            run_id = next(self._ids)
+            # Место резервируется до создания сеансов
+            self._threads[run_id] = None
+
+        try:
+            session_ids = self.db.create_test_sessions(
+                user_id, product['id'], scenario.id, sessions)
+        except Exception:
+            with self._lock:
+                del self._threads[run_id]
+            raise
+        run = ScenarioRun(run_id, user_id, product['id'], scenario.id, session_ids,
+                          len(scenario.steps))
+        engine_product = {
+            'id': product.get('id'),
+            'name': product.get('name'),
+            'model_file_path': product.get('model_file_path')
+        }
+        steps = [(step.interaction_type, step.interaction_data) for step in scenario.steps]
+        thread = threading.Thread(
+            target=self._execute, args=(run, engine_product, scenario.data, steps),
+            name=f'scenario-run-{run_id}', daemon=True)
+        with self._lock:
+            self._runs[run_id] = run
+            self._threads[run_id] = thread
+            self._trim_history_locked()
+        thread.start()
+        return run.to_dict()
+
+    def _trim_history_locked(self):
+        finished = [run_id for run_id, run in self._runs.items() if run.finished]
+        for run_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self._runs[run_id]
+
+    def _submit(self, executor: Executor, chunk: List[int], product: Dict[str, Any],
+                scenario_data: Dict[str, Any], steps: list) -> Future:
+        if self.mode == 'process':
+            return executor.submit(_run_sessions_in_process, chunk, product,
+                                   scenario_data, steps)
+        return executor.submit(run_sessions, chunk, product, scenario_data, steps,
+                               self.interaction_log)
+
+    def _execute(self, run: ScenarioRun, product: Dict[str, Any],
+                 scenario_data: Dict[str, Any], steps: list):
+        run.set_status('running')
+        chunks = [run.session_ids[i:i + self.chunk_size]
+                  for i in range(0, len(run.session_ids), self.chunk_size)]
+        next_chunk = 0
+        in_flight: Dict[Future, List[int]] = {}
+        try:
+            executor = self._get_executor()
+            while True:
+                while (not run.cancel_requested.is_set() and next_chunk < len(chunks)
+                       and len(in_flight) < 2 * self.max_workers):
+                    chunk = chunks[next_chunk]
+                    next_chunk += 1
+                    in_flight[self._submit(executor, chunk, product, scenario_data,
+                                           steps)] = chunk
+                if not in_flight:
+                    break
+                done, _ = wait(list(in_flight), timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    try:
+                        run.record(future.result())
+                    except Exception as e:
+                        logger.exception("Ошибка задачи прогона %s", run.run_id)
+                        error = f"{type(e).__name__}: {e}"
+                        run.record([(session_id, False, 0, 0.0, error)
+                                    for session_id in chunk])
+            skipped = [session_id for chunk in chunks[next_chunk:] for session_id in chunk]
+            if skipped:
+                self.db.complete_test_sessions(skipped)
+                with run.lock:
+                    run.skipped = len(skipped)
+            run.set_status('cancelled' if run.cancel_requested.is_set() else 'completed')
+        except Exception:
+            logger.exception("Прогон %s завершился с ошибкой", run.run_id)
+            run.set_status('failed')
+        finally:
+            with self._lock:
+                self._threads.pop(run.run_id, None)
+
+    def get_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Прогресс и результаты прогона (None, если прогон не найден)"""
+        with self._lock:
+            run = self._runs.get(run_id)
+        return run.to_dict() if run else None
+
+    def cancel_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Запрос отмены прогона: выполняющиеся задачи дорабатывают, новые не выдаются"""
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is None:
+            return None
+        run.cancel_requested.set()
+        return run.to_dict()
+
+    def close(self):
+        """Отмена выполняющихся прогонов и остановка пула"""
+        with self._lock:
+            self._closed = True
+            runs = list(self._runs.values())
+            threads = [thread for thread in self._threads.values() if thread is not None]
+        for run in runs:
+            run.cancel_requested.set()
+        for thread in threads:
+            thread.join()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика исполнителя прогонов"""
+        with self._lock:
+            runs = list(self._runs.values())
+            active = len(self._threads)
+        return {
+            'mode': self.mode,
+            'workers': self.max_workers,
+            'active_runs': active,
+            'max_active_runs': self.max_active_runs,
+            'runs': len(runs)
+        }
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from infrastructure.database_repository import DatabaseRepository
+from services.simulation_service import SimulationService
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """
+    Фоновое завершение брошенных сеансов.
+
+    Раз в interval секунд активные сеансы без активности дольше idle_ttl секунд
+    завершаются (как при /finalize). Сеансы обрабатываются пакетами по batch_size:
+    каждый пакет - одна короткая транзакция, поэтому запись не блокируется надолго.
+    При нескольких рабочих процессах каждый обрабатывает только свои сеансы
+    (id % shards == shard)
+    """
+
+    def __init__(self, simulation_service: SimulationService,
+                 db_repository: DatabaseRepository, idle_ttl: float, interval: float,
+                 batch_size: int = 100, shard: int = 0, shards: int = 1):
+        self.simulation_service = simulation_service
+        self.db = db_repository
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.shard = shard
+        self.shards = max(1, shards)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {
+            'passes': 0,
+            'reclaimed': 0,
+            'errors': 0,
+            'last_pass_reclaimed': 0,
+            'last_pass_active': 0,
+            'last_pass_seconds': 0.0
+        }
+
+    def reap(self) -> Dict[str, Any]:
+        """Один проход: завершение сеансов, неактивных дольше idle_ttl"""
+        started = time.monotonic()
+        cutoff = time.time() - self.idle_ttl
+        reclaimed = active = 0
+        after_id = 0
+        while not self._stop.is_set():
+            session_ids = self.db.get_idle_session_ids(cutoff, after_id, self.batch_size,
+                                                       self.shard, self.shards)
+            if not session_ids:
+                break
+            after_id = session_ids[-1]
+            result = self.simulation_service.reclaim_idle_sessions(session_ids, cutoff)
+            reclaimed += result['reclaimed']
+            active += result['active']
+            if len(session_ids) < self.batch_size:
+                break
+        seconds = time.monotonic() - started
+        with self._lock:
+            self._stats['passes'] += 1
+            self._stats['reclaimed'] += reclaimed
+            self._stats['last_pass_reclaimed'] = reclaimed
+            self._stats['last_pass_active'] = active
+            self._stats['last_pass_seconds'] = seconds
+        if reclaimed:
+            logger.info("Завершено брошенных сеансов: %d за %.3f с", reclaimed, seconds)
+        return {'reclaimed': reclaimed, 'active': active, 'seconds': seconds}
+
+    def start(self):
+        """Запуск фонового задания"""
+        if self._worker is not None:
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("Ошибка завершения брошенных сеансов")
+                with self._lock:
+                    self._stats['errors'] += 1
+
+    def close(self):
+        """Остановка фонового задания"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика завершения сеансов"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle_ttl'] = self.idle_ttl
+        return stats
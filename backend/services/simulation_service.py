@@ -1,96 +1,298 @@
 import json
 import time
-from typing import Dict, Any, Optional
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterator
+import config
 from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+from services.engine_cache import EngineCache
+from models.session_state import SessionState
+
+# Сколько секунд ждать событий, подтвержденных в базе, но еще не видных в журнале;
+# позже они считаются потерянными (процесс-писатель остановился до записи журнала)
+UNCOMMITTED_EVENTS_WAIT = 5.0
+
+
+class SessionConflictError(Exception):
+    """Состояние сеанса в базе изменено другим движком (не совпала row_version)"""
 
 
 class SimulationEngine:
     """Движок симуляции для обработки взаимодействий с продуктами"""
     
-    def __init__(self, session_id: int, db_repository: DatabaseRepository):
+    def __init__(self, session_id: int, db_repository: DatabaseRepository,
+                 interaction_log: Optional[InteractionLog] = None,
+                 write_behind: bool = False):
         self.session_id = session_id
         self.db = db_repository
+        self.interaction_log = interaction_log
+        # При отложенной записи состояние сохраняет владелец движка (EngineCache)
+        self.write_behind = write_behind
+        self.dirty = False
+        # Событий журнала после последнего снимка состояния в базе
+        self.events_since_snapshot = 0
+        # Движок из кэша используется несколькими запросами сеанса
+        self.lock = threading.RLock()
         self.session = self.db.get_test_session(session_id)
-        self.state = {}
+        self.state = self._new_state()
         self.load_session_state()
     
+    @staticmethod
+    def _new_state() -> SessionState:
+        return SessionState.from_dict({}, recent_limit=config.SESSION_RECENT_INTERACTIONS)
+    
     def load_session_state(self):
-        """Загрузка состояния сеанса"""
+        """
+        Загрузка состояния сеанса: последний снимок из базы плюс события журнала
+        после него (их не больше SESSION_SNAPSHOT_EVERY)
+        """
+        # Версия строки сеанса, от которой ведется запись состояния (CAS)
+        self.row_version = self.session.get('row_version', 0) if self.session else 0
         if self.session and self.session.get('session_data'):
             try:
-                self.state = json.loads(self.session['session_data'])
+                self.state = SessionState.from_dict(
+                    json.loads(self.session['session_data']),
+                    recent_limit=config.SESSION_RECENT_INTERACTIONS
+                )
             except:
-                self.state = {}
+                self.state = self._new_state()
         else:
-            self.state = {
-                'initialized': False,
-                'interactions': [],
-                'current_step': 0
-            }
+            self.state = self._new_state()
+        if self.interaction_log is not None and self.state.initialized:
+            for record in self._read_events(self.state.version, self.state.last_event_at):
+                self._replay_event(self.state, record)
+                self.events_since_snapshot += 1
+        # Последняя запись подтвердила более позднюю версию: ее события еще не
+        # дописаны в журнал (или не сохранены) другим движком - записывать нельзя
+        self.stale = False
+        confirmed_version = (self.session or {}).get('state_version') or 0
+        if self.state.version < confirmed_version:
+            last_active_at = self.session.get('last_active_at') or 0
+            if time.time() - last_active_at < UNCOMMITTED_EVENTS_WAIT:
+                self.stale = True
+            else:
+                # События потеряны: версии продолжаются после подтвержденной
+                self.state.version = confirmed_version
+    
+    def reload(self):
+        """Повторная загрузка состояния из базы и журнала (несохраненное отбрасывается)"""
+        self.session = self.db.get_test_session(self.session_id)
+        self.dirty = False
+        self.events_since_snapshot = 0
+        self.load_session_state()
     
-    def save_session_state(self):
-        """Сохранение состояния сеанса"""
-        session_data = json.dumps(self.state)
-        self.db.update_test_session_data(self.session_id, session_data)
+    def _read_events(self, after_version: int, since: float = None) -> List[Dict[str, Any]]:
+        """События журнала с версией больше after_version в порядке версий"""
+        events = [record for record in self.interaction_log.read_session(self.session_id, since)
+                  if (record.get('version') or 0) > after_version]
+        events.sort(key=lambda record: record['version'])
+        return events
+    
+    def _replay_event(self, state: SessionState, record: Dict[str, Any]):
+        """Повторное применение события журнала к состоянию"""
+        result = self._simulate_interaction(record['interaction_type'],
+                                            record['interaction_data'])
+        state.record({
+            'type': record['interaction_type'],
+            'data': record['interaction_data'],
+            'timestamp': record['timestamp'],
+            'step': record['step']
+        }, result['updated_state'])
+    
+    def save_session_state(self, snapshot: bool = False,
+                           interactions: List[Tuple[str, str]] = ()):
+        """
+        Учет изменения состояния. При журнале взаимодействий снимок в базу нужен
+        раз в SESSION_SNAPSHOT_EVERY событий, остальное восстанавливается из журнала;
+        при отложенной записи такой снимок сохраняет EngineCache.
+        snapshot=True - снимок записывается сразу.
+        interactions - строки таблицы interactions (без журнала): записываются
+        вместе со снимком или отдельно, если снимок откладывается
+        """
+        if not snapshot:
+            if (self.interaction_log is not None and
+                    self.events_since_snapshot < config.SESSION_SNAPSHOT_EVERY):
+                self._claim_version()
+                return
+            if self.write_behind:
+                self._claim_version(interactions)
+                self.dirty = True
+                return
+        self.persist_session_state(force=True, interactions=interactions)
+    
+    def _claim_version(self, interactions: List[Tuple[str, str]] = ()):
+        """
+        Изменение без снимка: row_version проверяется и увеличивается при каждой
+        записи, поэтому устаревший движок (сеанс изменил другой процесс) получает
+        SessionConflictError до записи своих событий
+        """
+        with self.lock:
+            if self.stale or not self.db.claim_test_session_version(
+                    self.session_id, self.row_version, self.state.version,
+                    self.state.last_event_at or None, interactions):
+                self._conflict()
+            self.row_version += 1
+    
+    def _conflict(self):
+        """Перезагрузка устаревшего состояния и SessionConflictError"""
+        self.reload()
+        raise SessionConflictError(
+            f"Состояние сеанса {self.session_id} изменено другим запросом")
+    
+    def persist_session_state(self, force: bool = False,
+                              interactions: List[Tuple[str, str]] = ()) -> bool:
+        """
+        Запись состояния в базу, если оно изменилось. Возвращает True, если запись была.
+        Запись условная по row_version: если строку изменил другой движок, состояние
+        перезагружается и возбуждается SessionConflictError (ничего не записано)
+        """
+        # Блокировка удерживается на время записи: версия строки должна
+        # соответствовать записываемому снимку
+        with self.lock:
+            if not (self.dirty or force):
+                return False
+            session_data = json.dumps(self.state.to_dict())
+            # Активность сеанса - время последнего события (после инициализации - сейчас)
+            if self.stale or not self.db.update_test_session_data(
+                    self.session_id, session_data, self.state.last_event_at or None,
+                    self.row_version, interactions, state_version=self.state.version):
+                self._conflict()
+            self.row_version += 1
+            self.dirty = False
+            self.events_since_snapshot = 0
+        return True
     
     def initialize_environment(self, product_data: Dict[str, Any], 
                                scenario_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """Инициализация виртуальной среды для симуляции"""
-        self.state['initialized'] = True
-        self.state['product'] = {
+        # Версия продолжает расти, чтобы клиенты заметили сброс состояния
+        version = self.state.version + 1
+        self.state = self._new_state()
+        self.state.version = version
+        self.state.base_version = version
+        self.state.initialized = True
+        self.state.product = {
             'id': product_data.get('id'),
             'name': product_data.get('name'),
             'model_file': product_data.get('model_file_path')
         }
-        self.state['scenario'] = scenario_data or {}
-        self.state['current_step'] = 0
-        self.state['interactions'] = []
+        self.state.scenario = scenario_data or {}
         
-        self.save_session_state()
+        # Инициализация не записывается в журнал - снимок обязателен
+        self.save_session_state(snapshot=True)
         
         return {
             'success': True,
             'environment': {
-                'product': self.state['product'],
-                'scenario': self.state['scenario'],
+                'product': self.state.product,
+                'scenario': self.state.scenario,
                 'ready': True
             }
         }
     
     def process_interaction(self, interaction_type: str, 
-                           interaction_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Обработка взаимодействия пользователя с продуктом"""
-        if not self.state.get('initialized'):
+                           interaction_data: Dict[str, Any],
+                           delta: bool = False) -> Dict[str, Any]:
+        """
+        Обработка взаимодействия пользователя с продуктом.
+        delta=True - в ответе только изменения (updated_state) и версия состояния
+        вместо полного состояния
+        """
+        if not self.state.initialized:
             return {'success': False, 'error': 'Среда не инициализирована'}
         
+        db_rows, log_records = [], []
+        response = self._apply_interaction(interaction_type, interaction_data,
+                                           db_rows, log_records)
+        self._commit(db_rows, log_records)
+        
+        if not delta:
+            response['state'] = self.state.to_dict()
+            del response['delta']
+        return response
+    
+    def process_interactions(self, interactions: List[Tuple[str, Dict[str, Any]]],
+                             delta: bool = True) -> Dict[str, Any]:
+        """
+        Обработка упорядоченного пакета взаимодействий за один проход:
+        состояние сохраняется один раз, взаимодействия записываются одной операцией.
+        Для каждого элемента возвращается результат в формате delta
+        """
+        if not self.state.initialized:
+            return {'success': False, 'error': 'Среда не инициализирована'}
+        
+        db_rows, log_records = [], []
+        results = [self._apply_interaction(interaction_type, interaction_data,
+                                           db_rows, log_records)
+                   for interaction_type, interaction_data in interactions]
+        self._commit(db_rows, log_records)
+        
+        response = {
+            'success': True,
+            'results': results,
+            'step': self.state.current_step,
+            'version': self.state.version
+        }
+        if not delta:
+            response['state'] = self.state.to_dict()
+        return response
+    
+    def _apply_interaction(self, interaction_type: str, interaction_data: Dict[str, Any],
+                           db_rows: list, log_records: list) -> Dict[str, Any]:
+        """
+        Применение одного взаимодействия к состоянию (без сохранения состояния).
+        Записи для журнала или таблицы interactions добавляются в log_records и db_rows
+        """
         interaction_record = {
             'type': interaction_type,
             'data': interaction_data,
             'timestamp': time.time(),
-            'step': self.state['current_step']
+            'step': self.state.current_step
         }
         
-        self.state['interactions'].append(interaction_record)
-        self.state['current_step'] += 1
-        
-        self.db.add_interaction(
-            session_id=self.session_id,
-            interaction_type=interaction_type,
-            interaction_data=json.dumps(interaction_data)
-        )
-        
         # Обрабатываем взаимодействие (симуляция)
         result = self._simulate_interaction(interaction_type, interaction_data)
         
-        self.save_session_state()
+        # В состоянии остаются только счетчики, преобразования и последние события;
+        # полная история - в журнале взаимодействий
+        self.state.record(interaction_record, result['updated_state'])
+        
+        if self.interaction_log is not None:
+            log_records.append({
+                'session_id': self.session_id,
+                'interaction_type': interaction_type,
+                'interaction_data': interaction_data,
+                'timestamp': interaction_record['timestamp'],
+                'step': interaction_record['step'],
+                'version': self.state.version
+            })
+            self.events_since_snapshot += 1
+        else:
+            db_rows.append((interaction_type, json.dumps(interaction_data)))
         
         return {
             'success': True,
             'result': result,
-            'step': self.state['current_step'],
-            'state': self.state
+            'step': self.state.current_step,
+            'version': self.state.version,
+            'delta': result['updated_state']
         }
     
+    def _commit(self, db_rows: list, log_records: list):
+        """
+        Сохранение примененных взаимодействий. Сначала состояние (с проверкой
+        row_version, строки interactions - той же транзакцией), затем журнал:
+        при конфликте версий ничего не записано и операцию можно повторить.
+        Между снимками журнал - единственная копия взаимодействий, поэтому
+        записи фиксируются в нем до ответа клиенту
+        """
+        self.save_session_state(interactions=db_rows)
+        for record in log_records:
+            self.interaction_log.append(**record)
+        if log_records:
+            self.interaction_log.commit()
+    
     def _simulate_interaction(self, interaction_type: str, 
                              interaction_data: Dict[str, Any]) -> Dict[str, Any]:
         """Симуляция конкретного взаимодействия"""
@@ -119,29 +321,112 @@ class SimulationEngine:
     def get_current_state(self) -> Dict[str, Any]:
         """Получение текущего состояния симуляции"""
         return {
-            'initialized': self.state.get('initialized', False),
-            'product': self.state.get('product'),
-            'scenario': self.state.get('scenario'),
-            'current_step': self.state.get('current_step', 0),
-            'interactions_count': len(self.state.get('interactions', []))
+            'initialized': self.state.initialized,
+            'product': self.state.product,
+            'scenario': self.state.scenario,
+            'current_step': self.state.current_step,
+            'interactions_count': self.state.interactions_count,
+            'transforms': dict(self.state.transforms),
+            'version': self.state.version
+        }
+    
+    def get_state_at(self, step: int) -> Dict[str, Any]:
+        """
+        Состояние на шаге step текущей инициализации: воспроизведение событий
+        журнала от начала инициализации. ValueError без журнала или при неверном шаге
+        """
+        if self.interaction_log is None:
+            raise ValueError('Восстановление состояния требует журнала взаимодействий')
+        if not self.state.initialized:
+            raise ValueError('Среда не инициализирована')
+        if not 0 <= step <= self.state.current_step:
+            raise ValueError(f'Шаг должен быть от 0 до {self.state.current_step}')
+        state = self._new_state()
+        state.initialized = True
+        state.product = self.state.product
+        state.scenario = self.state.scenario
+        state.version = state.base_version = self.state.base_version
+        for record in self._read_events(self.state.base_version):
+            if state.current_step >= step:
+                break
+            self._replay_event(state, record)
+        return state.to_dict()
+    
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Полный снимок состояния для клиентов, пропустивших изменения"""
+        return {
+            'session_id': self.session_id,
+            'version': self.state.version,
+            'state': self.state.to_dict()
         }
     
     def finalize_session(self):
         """Завершение сеанса симуляции"""
+        self.persist_session_state(force=self.events_since_snapshot > 0)
         self.db.update_test_session_status(self.session_id, 'completed')
         return {
             'success': True,
             'session_id': self.session_id,
-            'total_interactions': len(self.state.get('interactions', [])),
-            'final_state': self.state
+            'total_interactions': self.state.interactions_count,
+            'final_state': self.state.to_dict()
         }
 
 
 class SimulationService:
-    """Сервис для работы с симуляцией"""
+    """
+    Сервис для работы с симуляцией.
+    Операции одного сеанса выполняются последовательно (блокировка сеанса),
+    разных сеансов - параллельно
+    """
     
-    def __init__(self, db_repository: DatabaseRepository):
+    def __init__(self, db_repository: DatabaseRepository,
+                 interaction_log: Optional[InteractionLog] = None,
+                 engine_cache: Optional[EngineCache] = None):
         self.db = db_repository
+        self.interaction_log = interaction_log
+        self.engine_cache = engine_cache
+        # session_id -> [блокировка, число ожидающих и владеющих потоков]
+        self._session_locks: Dict[int, list] = {}
+        self._locks_guard = threading.Lock()
+        self._conflicts = 0
+    
+    @contextmanager
+    def _session_lock(self, session_id: int) -> Iterator[None]:
+        """Блокировка сеанса; удаляется, когда ее никто не ждет"""
+        with self._locks_guard:
+            entry = self._session_locks.get(session_id)
+            if entry is None:
+                entry = self._session_locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._session_locks[session_id]
+    
+    def _run(self, session_id: int, operation: Callable[[SimulationEngine], Any],
+             engine: Optional[SimulationEngine] = None) -> Any:
+        """
+        Выполнение операции над движком сеанса под блокировкой сеанса.
+        При конфликте версий движок уже перезагружен из базы и журнала,
+        операция повторяется до SESSION_CONFLICT_RETRIES раз
+        """
+        with self._session_lock(session_id):
+            engine = engine or self.get_simulation_engine(session_id)
+            with engine.lock:
+                attempt = 0
+                while True:
+                    try:
+                        return operation(engine)
+                    except SessionConflictError:
+                        with self._locks_guard:
+                            self._conflicts += 1
+                        attempt += 1
+                        if attempt > config.SESSION_CONFLICT_RETRIES:
+                            raise
     
     def create_simulation_session(self, user_id: int, product_id: int, 
                                  scenario_id: int = None) -> Dict[str, Any]:
@@ -158,6 +443,186 @@ class SimulationService:
         }
     
     def get_simulation_engine(self, session_id: int) -> SimulationEngine:
-        """Получение движка симуляции для сеанса"""
-        return SimulationEngine(session_id, self.db)
+        """Получение движка симуляции для сеанса (из кэша, если он включен)"""
+        if self.engine_cache is None:
+            return SimulationEngine(session_id, self.db, self.interaction_log)
+        return self.engine_cache.get(
+            session_id,
+            lambda: SimulationEngine(session_id, self.db, self.interaction_log,
+                                     write_behind=True)
+        )
+    
+    def initialize_simulation(self, session_id: int, product_data: Dict[str, Any],
+                              scenario_data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Инициализация виртуальной среды сеанса"""
+        return self._run(session_id,
+                         lambda engine: engine.initialize_environment(product_data, scenario_data))
+    
+    def process_interaction(self, session_id: int, interaction_type: str,
+                            interaction_data: Dict[str, Any],
+                            delta: bool = False) -> Dict[str, Any]:
+        """Обработка взаимодействия в сеансе"""
+        return self._run(session_id, lambda engine: engine.process_interaction(
+            interaction_type, interaction_data, delta))
+    
+    def process_interactions(self, session_id: int,
+                             interactions: List[Tuple[str, Dict[str, Any]]],
+                             delta: bool = True) -> Dict[str, Any]:
+        """Обработка пакета взаимодействий в сеансе"""
+        return self._run(session_id,
+                         lambda engine: engine.process_interactions(interactions, delta))
+    
+    def bind_engine(self, session_id: int) -> Optional[SimulationEngine]:
+        """
+        Движок для долгоживущего соединения (WebSocket).
+        При включенном кэше движок закрепляется в нем до release_engine.
+        None, если сеанс не найден
+        """
+        if self.engine_cache is None:
+            engine = SimulationEngine(session_id, self.db, self.interaction_log)
+        else:
+            engine = self.engine_cache.pin(
+                session_id,
+                lambda: SimulationEngine(session_id, self.db, self.interaction_log,
+                                         write_behind=True)
+            )
+        if engine.session is None:
+            if self.engine_cache is not None:
+                self.engine_cache.unpin(session_id)
+                self.engine_cache.remove(session_id)
+            return None
+        return engine
+    
+    def release_engine(self, engine: SimulationEngine):
+        """Освобождение движка, полученного через bind_engine"""
+        if self.engine_cache is not None:
+            self.engine_cache.unpin(engine.session_id)
+            if self.engine_cache.contains(engine):
+                return
+        # Движок вне кэша (кэш отключен или сеанс завершен) - сохраняем сразу
+        engine.persist_session_state()
+    
+    def process_bound_interaction(self, engine: SimulationEngine, interaction_type: str,
+                                  interaction_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Обработка взаимодействия движком, полученным через bind_engine (ответ - delta)"""
+        return self._run(engine.session_id, lambda engine: engine.process_interaction(
+            interaction_type, interaction_data, delta=True), engine)
+    
+    def get_bound_snapshot(self, engine: SimulationEngine) -> Dict[str, Any]:
+        """Полный снимок состояния движка, полученного через bind_engine"""
+        return self._run(engine.session_id, lambda engine: engine.get_snapshot(), engine)
+    
+    def get_simulation_state(self, session_id: int) -> Dict[str, Any]:
+        """Текущее состояние симуляции сеанса"""
+        return self._run(session_id, lambda engine: engine.get_current_state())
+    
+    def get_simulation_state_at(self, session_id: int, step: int) -> Dict[str, Any]:
+        """Состояние сеанса на указанном шаге (восстанавливается из журнала)"""
+        return self._run(session_id, lambda engine: engine.get_state_at(step))
+    
+    def get_simulation_snapshot(self, session_id: int) -> Dict[str, Any]:
+        """Полный снимок состояния сеанса"""
+        return self._run(session_id, lambda engine: engine.get_snapshot())
+    
+    def finalize_simulation(self, session_id: int) -> Dict[str, Any]:
+        """Завершение сеанса симуляции"""
+        result = self._run(session_id, lambda engine: engine.finalize_session())
+        if self.engine_cache is not None:
+            self.engine_cache.remove(session_id)
+        return result
+    
+    def reclaim_idle_sessions(self, session_ids: List[int], cutoff: float) -> Dict[str, int]:
+        """
+        Завершение сеансов без активности с момента cutoff (unix-время).
+        Перед завершением сохраняется снимок с событиями журнала после последнего
+        снимка. Сеансы, активные в кэше движков или в журнале, не завершаются:
+        для них обновляется время последней активности. Блокировки простаивающих
+        сеансов удерживаются до фиксации завершения, поэтому взаимодействие,
+        пришедшее после проверки, не теряется
+        """
+        now = time.time()
+        idle, active = [], {}
+        with ExitStack() as held:
+            for session_id in session_ids:
+                with ExitStack() as stack:
+                    stack.enter_context(self._session_lock(session_id))
+                    last_active = self._last_activity(session_id, cutoff, now)
+                    if last_active is None:
+                        idle.append(session_id)
+                        held.enter_context(stack.pop_all())
+                    elif last_active >= cutoff:
+                        active[session_id] = last_active
+            if active:
+                self.db.touch_test_sessions(active)
+            reclaimed = self.db.expire_test_sessions(idle, cutoff) if idle else []
+            if self.engine_cache is not None:
+                for session_id in reclaimed:
+                    self.engine_cache.remove(session_id)
+        return {'reclaimed': len(reclaimed), 'active': len(active)}
+
+    def _last_activity(self, session_id: int, cutoff: float, now: float) -> Optional[float]:
+        """
+        Время последней активности сеанса, если она не раньше cutoff; None - сеанс
+        простаивает (несохраненные события уже записаны снимком); 0 - сеанс
+        пропускается до следующего прохода. Вызывается под блокировкой сеанса.
+        Движок без кэша строится, только если после снимка в журнале есть события
+        """
+        cached = self.engine_cache.peek(session_id) if self.engine_cache else None
+        if cached is not None and now - cached[1] >= cutoff:
+            return now - cached[1]
+        engine = cached[0] if cached is not None else None
+        if engine is None:
+            last_event_at, pending = self._logged_activity(session_id)
+            if last_event_at >= cutoff:
+                return last_event_at
+            if not pending:
+                return None
+            engine = SimulationEngine(session_id, self.db, self.interaction_log)
+        with engine.lock:
+            if engine.state.last_event_at >= cutoff:
+                return engine.state.last_event_at
+            try:
+                if engine.dirty or engine.events_since_snapshot:
+                    engine.persist_session_state(force=True)
+            except SessionConflictError:
+                # Сеанс изменен в другом процессе - проверяется в следующем проходе
+                return 0.0
+        return None
 
+    def _logged_activity(self, session_id: int) -> Tuple[float, bool]:
+        """
+        (время последнего события, есть ли события после снимка) по снимку
+        в базе и событиям журнала после него - без воспроизведения событий
+        """
+        session = self.db.get_test_session(session_id)
+        try:
+            data = json.loads(session['session_data']) if session and \
+                session.get('session_data') else {}
+        except ValueError:
+            data = {}
+        last_event_at = data.get('last_event_at', 0.0)
+        if self.interaction_log is None or not data.get('initialized'):
+            return last_event_at, False
+        version = data.get('version', 0)
+        pending = False
+        for record in self.interaction_log.read_session(session_id, last_event_at):
+            if (record.get('version') or 0) > version:
+                pending = True
+                last_event_at = max(last_event_at, record['timestamp'])
+        return last_event_at, pending
+    
+    def get_session_lock_stats(self) -> Dict[str, int]:
+        """Число сеансов с выполняемыми операциями и конфликтов версий"""
+        with self._locks_guard:
+            return {'locked_sessions': len(self._session_locks), 'conflicts': self._conflicts}
+    
+    def get_engine_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Статистика кэша движков (None, если кэш отключен)"""
+        return self.engine_cache.get_stats() if self.engine_cache else None
+    
+    def get_session_interactions(self, session_id: int) -> List[Dict[str, Any]]:
+        """История взаимодействий сеанса из журнала"""
+        if self.interaction_log is None:
+            return [dict(row, interaction_data=json.loads(row['interaction_data'] or 'null'))
+                    for row in self.db.get_interactions_by_session(session_id)]
+        return list(self.interaction_log.read_session(session_id))
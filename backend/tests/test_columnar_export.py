@@ -0,0 +1,123 @@
+"""Выгрузка в столбцы .npy внутри tar: формат файлов, части таблиц и манифест"""
+import io
+import json
+import math
+import tarfile
+
+import pytest
+
+from infrastructure import database_repository
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+from services.columnar_export import EXPORT_FORMAT, ColumnarExporter, npy_bytes
+
+np = pytest.importorskip('numpy')
+
+T0 = 1_700_000_000.0
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_repository, 'DATABASE_PATH', str(tmp_path / 'db.sqlite'))
+    db = DatabaseRepository()
+    db.init_database()
+    return db
+
+
+def _load(data: bytes):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+def _archive(exporter: ColumnarExporter, **kwargs) -> tarfile.TarFile:
+    data = b''.join(exporter.export(**kwargs))
+    return tarfile.open(fileobj=io.BytesIO(data), mode='r:')
+
+
+def _column(archive: tarfile.TarFile, manifest: dict, table: str, name: str) -> list:
+    """Столбец таблицы, собранный из всех частей"""
+    return [value for part in manifest['tables'][table]['parts']
+            for value in _load(archive.extractfile(f"{part['path']}/{name}.npy").read()).tolist()]
+
+
+@pytest.mark.parametrize('values, dtype, expected', [
+    ([1, -2, 2 ** 40], '<i8', '<i8'),
+    ([0.5, float('nan')], '<f8', '<f8'),
+    (['', 'клик', 'zoom'], '<U', '<U4'),
+    ([], '<f8', '<f8')
+])
+def test_npy_bytes_round_trip(values, dtype, expected):
+    data, result_dtype = npy_bytes(values, dtype)
+    assert result_dtype == expected
+    # Заголовок выровнен до 64 байт, как пишет numpy
+    header_len = int.from_bytes(data[8:10], 'little')
+    assert (10 + header_len) % 64 == 0
+    array = _load(data)
+    assert array.dtype == np.dtype(expected) and array.shape == (len(values),)
+    assert [str(v) for v in array.tolist()] == [str(v) for v in values]
+
+
+def test_npy_bytes_rejects_unknown_dtype():
+    with pytest.raises(ValueError):
+        npy_bytes([1], '<i4')
+
+
+def test_export_from_log_in_parts(db, tmp_path):
+    user_id = db.create_user('owner', 'owner@test.com', 'x', 'owner')
+    product_id = db.create_product(user_id, 'product')
+    other_product = db.create_product(user_id, 'other')
+    session_id = db.create_test_session(user_id, product_id)
+    other_session = db.create_test_session(user_id, other_product)
+    interaction_log = InteractionLog(str(tmp_path / 'log'))
+    for i in range(5):
+        interaction_log.append(session_id, 'click', {'x': i, 'y': 1.5}, timestamp=T0 + i,
+                               step=i, version=i + 1)
+    interaction_log.append(session_id, 'zoom', {'level': 2, 'mode': {'smooth': True}},
+                           timestamp=T0 + 5, step=5, version=6)
+    interaction_log.append(session_id, 'rotate', {}, timestamp=T0 + 6, step=6, version=7)
+    interaction_log.append(other_session, 'click', {'x': 100}, timestamp=T0 + 7)
+
+    exporter = ColumnarExporter(db, interaction_log, chunk_rows=2)
+    archive = _archive(exporter, product_id=product_id)
+    manifest = json.loads(archive.extractfile('manifest.json').read())
+    interaction_log.close()
+
+    assert manifest['format'] == EXPORT_FORMAT and manifest['product_id'] == product_id
+    tables = manifest['tables']
+    assert set(tables) == {'sessions', 'interactions/click', 'interactions/zoom',
+                           'interactions/rotate'}
+    assert tables['sessions']['rows'] == 1
+    assert _column(archive, manifest, 'sessions', 'id') == [session_id]
+    assert _column(archive, manifest, 'sessions', 'scenario_id') == [-1]
+
+    # Части не длиннее chunk_rows, в сумме - все клики продукта в порядке журнала
+    clicks = tables['interactions/click']
+    assert clicks['interaction_type'] == 'click' and clicks['rows'] == 5
+    assert all(part['rows'] <= 2 for part in clicks['parts']) and len(clicks['parts']) >= 3
+    assert _column(archive, manifest, 'interactions/click', 'data.x') == [0, 1, 2, 3, 4]
+    assert _column(archive, manifest, 'interactions/click', 'step') == [0, 1, 2, 3, 4]
+    assert clicks['parts'][0]['columns']['data.y'] == '<f8'
+
+    # Вложенные значения - строки JSON, у известных типов поля есть всегда
+    zoom = tables['interactions/zoom']['parts'][0]['columns']
+    assert zoom['data.level'] == '<f8' and zoom['data.mode'].startswith('<U')
+    assert _column(archive, manifest, 'interactions/zoom', 'data.mode') == ['{"smooth": true}']
+    assert math.isnan(_column(archive, manifest, 'interactions/rotate', 'data.angle')[0])
+
+
+def test_export_from_table_with_time_range(db):
+    user_id = db.create_user('owner', 'owner@test.com', 'x', 'owner')
+    product_id = db.create_product(user_id, 'product')
+    session_id = db.create_test_session(user_id, product_id)
+    db.add_interactions(session_id, [('click', json.dumps({'x': 1})), ('click', 'не json')])
+
+    exporter = ColumnarExporter(db, None)
+    archive = _archive(exporter)
+    manifest = json.loads(archive.extractfile('manifest.json').read())
+    assert manifest['tables']['interactions/click']['rows'] == 2
+    x = _column(archive, manifest, 'interactions/click', 'data.x')
+    assert x[0] == 1 and math.isnan(x[1])
+    assert _column(archive, manifest, 'interactions/click', 'version') == [-1, -1]
+
+    # Интервал в будущем - ни сеансов, ни взаимодействий
+    archive = _archive(exporter, start=4_000_000_000.0)
+    assert json.loads(archive.extractfile('manifest.json').read())['tables'] == {}
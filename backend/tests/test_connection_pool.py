@@ -0,0 +1,82 @@
+"""Пул соединений SQLite: повторное использование, проверка и замена соединений, ожидание"""
+import sqlite3
+import threading
+
+import pytest
+
+from infrastructure.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'db.sqlite'), size=2, timeout=0.2)
+    yield pool
+    pool.close()
+
+
+def test_released_connection_is_reused(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    stats = pool.get_stats()
+    assert stats['created'] == 1 and stats['open'] == 1 and stats['in_use'] == 1
+
+
+def test_broken_connection_is_replaced(pool):
+    conn = pool.acquire()
+    pool.release(conn)
+    # Соединение, закрытое вне пула, не проходит проверку при выдаче
+    conn.close()
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert replacement.execute("SELECT 1").fetchone()[0] == 1
+    stats = pool.get_stats()
+    assert stats['discarded'] == 1 and stats['created'] == 2 and stats['open'] == 1
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE items (id INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO items VALUES (1)")
+    assert conn.in_transaction
+    pool.release(conn)
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+
+def test_exhausted_pool_waits_then_times_out(pool):
+    first, second = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.get_stats()['timeouts'] == 1
+
+    # Соединение, возвращенное другим потоком, получает ожидающий
+    timer = threading.Timer(0.05, pool.release, args=(first,))
+    timer.start()
+    assert pool.acquire() is first
+    timer.join()
+    stats = pool.get_stats()
+    assert stats['waits'] == 1 and stats['open'] == 2
+    pool.release(second)
+
+
+def test_failed_connect_does_not_leak_slot(tmp_path):
+    calls = []
+
+    def on_connect(conn: sqlite3.Connection):
+        calls.append(conn)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('настройка соединения не удалась')
+
+    pool = ConnectionPool(str(tmp_path / 'db.sqlite'), size=1, timeout=0.1,
+                          on_connect=on_connect)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+    assert pool.get_stats()['open'] == 0
+    conn = pool.acquire()
+    assert pool.get_stats()['open'] == 1
+    pool.release(conn)
+    pool.close()
+    assert pool.get_stats()['open'] == 0
@@ -0,0 +1,140 @@
+"""
+Кэш распределений по журналу: дочитывание новых хвостов по продуктам,
+сохранение столбцов при уплотнении и параллельные запросы разных продуктов
+"""
+import threading
+
+import pytest
+
+from infrastructure import database_repository
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+from services.interaction_analytics import InteractionAnalytics
+
+pytest.importorskip('numpy')
+
+SEGMENT_SECONDS = 60
+# Окна в прошлом: сегменты закрываются при переходе к следующему окну
+T0 = 1_000_000 * SEGMENT_SECONDS
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_repository, 'DATABASE_PATH', str(tmp_path / 'db.sqlite'))
+    db = DatabaseRepository()
+    db.init_database()
+    interaction_log = InteractionLog(str(tmp_path / 'log'), segment_seconds=SEGMENT_SECONDS)
+    yield db, interaction_log
+    interaction_log.close()
+
+
+def _products(db: DatabaseRepository, count: int, sessions: int = 2) -> dict:
+    """product_id -> [session_id]"""
+    user_id = db.create_user('owner', 'owner@test.com', 'x', 'owner')
+    result = {}
+    for i in range(count):
+        product_id = db.create_product(user_id, f'product {i}')
+        result[product_id] = [db.create_test_session(user_id, product_id)
+                              for _ in range(sessions)]
+    return result
+
+
+def _clicks(interaction_log: InteractionLog, session_ids: list, count: int, timestamp: float):
+    for i in range(count):
+        interaction_log.append(session_ids[i % len(session_ids)], 'click',
+                               {'x': float(i), 'y': 1.0}, timestamp=timestamp + i * 0.01)
+    interaction_log.flush()
+
+
+def test_new_events_refresh_only_their_product(storage):
+    db, interaction_log = storage
+    (first, first_sessions), (second, second_sessions) = _products(db, 2).items()
+    _clicks(interaction_log, first_sessions, 10, T0)
+    _clicks(interaction_log, second_sessions, 4, T0)
+    analytics = InteractionAnalytics(db, interaction_log)
+
+    assert analytics.get_product_distributions(first)['events'] == 10
+    assert analytics.get_product_distributions(second)['events'] == 4
+
+    # Хвост только второго продукта: результат первого остается в кэше
+    _clicks(interaction_log, second_sessions, 3, T0 + 1)
+    hits = analytics.get_stats()['hits']
+    assert analytics.get_product_distributions(first)['events'] == 10
+    assert analytics.get_stats()['hits'] == hits + 1
+    assert analytics.get_product_distributions(second)['events'] == 7
+
+    # Новый сеанс загруженного продукта находится при дочитывании
+    user_id = db.get_product(first)['owner_id']
+    new_session = db.create_test_session(user_id, first)
+    _clicks(interaction_log, [new_session], 5, T0 + 2)
+    result = analytics.get_product_distributions(first)
+    assert result['events'] == 15 and result['sessions'] == 3
+    assert analytics.get_stats()['products_loaded'] == 2
+
+
+def test_compacted_segment_keeps_columns(storage):
+    db, interaction_log = storage
+    (product_id, session_ids), = _products(db, 1, sessions=3).items()
+    _clicks(interaction_log, session_ids, 30, T0)
+    analytics = InteractionAnalytics(db, interaction_log)
+    before = analytics.get_product_distributions(product_id)
+
+    # Запись в следующее окно закрывает сегмент; уплотненная копия наследует столбцы
+    _clicks(interaction_log, session_ids, 6, T0 + SEGMENT_SECONDS)
+    assert analytics.get_product_distributions(product_id)['events'] == 36
+    parsed = analytics.get_stats()['events_parsed']
+    assert interaction_log.compact() == 1
+    after = analytics.get_product_distributions(product_id)
+    assert after['events'] == 36
+    assert after['click_heatmap']['counts'] != before['click_heatmap']['counts']
+    assert analytics.get_stats()['events_parsed'] == parsed
+
+    # Новый экземпляр загружает продукт из уплотненного сегмента
+    fresh = InteractionAnalytics(db, interaction_log).get_product_distributions(product_id)
+    assert fresh['events'] == 36
+    assert fresh['click_heatmap'] == after['click_heatmap']
+
+
+def test_eviction_reloads_product(storage):
+    db, interaction_log = storage
+    products = _products(db, 3)
+    for i, session_ids in enumerate(products.values()):
+        _clicks(interaction_log, session_ids, 5 + i, T0)
+    analytics = InteractionAnalytics(db, interaction_log, cache_size=2)
+
+    for product_id in products:
+        analytics.get_product_distributions(product_id)
+    stats = analytics.get_stats()
+    assert stats['products_resident'] == 2 and stats['products_evicted'] == 1
+    first = next(iter(products))
+    assert analytics.get_product_distributions(first)['events'] == 5
+    assert analytics.get_stats()['products_loaded'] == 4
+
+
+def test_concurrent_requests_with_appends(storage):
+    db, interaction_log = storage
+    products = _products(db, 4)
+    analytics = InteractionAnalytics(db, interaction_log)
+    errors = []
+
+    def request(product_id: int):
+        try:
+            for _ in range(20):
+                analytics.get_product_distributions(product_id)
+        except Exception as e:  # ошибки потоков проверяются в основном потоке
+            errors.append(e)
+
+    threads = [threading.Thread(target=request, args=(product_id,))
+               for product_id in products for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for i in range(20):
+        for j, session_ids in enumerate(products.values()):
+            _clicks(interaction_log, session_ids, j + 1, T0 + i)
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    # Каждое событие попало в свой продукт ровно один раз
+    for j, product_id in enumerate(products):
+        assert analytics.get_product_distributions(product_id)['events'] == 20 * (j + 1)
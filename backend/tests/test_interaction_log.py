@@ -0,0 +1,157 @@
+"""
+Журнал взаимодействий: сегменты по окнам, индексы, восстановление после
+сбоя и уплотнение. Окна сегментов в прошлом - сегменты считаются закрытыми
+"""
+import json
+import os
+
+import pytest
+
+from infrastructure.interaction_log import InteractionLog, read_log_directory
+
+SEGMENT_SECONDS = 60
+T0 = 1_000_000 * SEGMENT_SECONDS
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return tmp_path / 'log'
+
+
+def _write(interaction_log: InteractionLog, window: int, sessions=(1, 2, 3), per_session: int = 3):
+    """Записи сеансов вперемешку в окне window; возвращает {session_id: [шаги]}"""
+    steps = {}
+    for step in range(per_session):
+        for session_id in sessions:
+            interaction_log.append(session_id, 'click', {'x': step},
+                                   timestamp=T0 + window * SEGMENT_SECONDS + step,
+                                   step=step, version=step + 1)
+            steps.setdefault(session_id, []).append(step)
+    return steps
+
+
+def _files(log_dir, suffix: str) -> list:
+    return sorted(path.name for path in log_dir.iterdir() if path.name.endswith(suffix))
+
+
+def test_segments_follow_windows_and_get_indexes(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    _write(interaction_log, 0)
+    _write(interaction_log, 1)
+    interaction_log.close()
+
+    segments = _files(log_dir, '.log')
+    assert segments == [f"{T0:012d}-{SEGMENT_SECONDS}s-{os.getpid()}.log",
+                        f"{T0 + SEGMENT_SECONDS:012d}-{SEGMENT_SECONDS}s-{os.getpid()}.log"]
+    assert len(_files(log_dir, '.idx')) == 2
+
+    reader = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    records = list(reader.read_session(2))
+    assert [r['step'] for r in records] == [0, 1, 2, 0, 1, 2]
+    assert all(r['session_id'] == 2 for r in records)
+    # Сегменты, окно которых закончилось до since, не читаются
+    assert len(list(reader.read_session(2, since=T0 + SEGMENT_SECONDS))) == 3
+
+
+def test_commit_writes_buffer_and_fsyncs(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS,
+                                     flush_every=1000, fsync=True)
+    interaction_log.append(1, 'click', {}, timestamp=T0)
+    segment = log_dir / _files(log_dir, '.log')[0]
+    assert segment.stat().st_size == 0
+    interaction_log.commit()
+    assert segment.stat().st_size > 0
+    # Повторная фиксация без новых записей не вызывает fsync
+    interaction_log.commit()
+    assert interaction_log.get_stats()['fsyncs'] == 1
+    interaction_log.close()
+
+
+def test_crashed_segment_is_indexed_and_truncated(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    _write(interaction_log, 0)
+    interaction_log.flush()
+    stem = _files(log_dir, '.log')[0][:-len('.log')]
+    # Сбой процесса: индекс не записан, последняя строка записана не полностью
+    with open(log_dir / f"{stem}.log", 'ab') as f:
+        f.write(b'{"session_id": 1, "interaction_ty')
+    size = (log_dir / f"{stem}.log").stat().st_size
+
+    reader = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    assert len(list(reader.read_session(1))) == 3
+    # У давно закрытого сегмента недописанный хвост отрезается, индекс сохраняется
+    assert (log_dir / f"{stem}.log").stat().st_size < size
+    index = json.loads((log_dir / f"{stem}.idx").read_text())
+    assert index['size'] == (log_dir / f"{stem}.log").stat().st_size
+    assert set(index['sessions']) == {'1', '2', '3'}
+
+
+def test_read_log_directory_skips_partial_tail_without_changes(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    _write(interaction_log, 0)
+    interaction_log.flush()
+    with open(log_dir / _files(log_dir, '.log')[0], 'ab') as f:
+        f.write(b'{"session_id": 1')
+    before = {name: (log_dir / name).stat().st_size for name in os.listdir(log_dir)}
+
+    assert len(list(read_log_directory(str(log_dir)))) == 9
+    assert {name: (log_dir / name).stat().st_size for name in os.listdir(log_dir)} == before
+    assert list(read_log_directory(str(log_dir / 'missing'))) == []
+
+
+def test_compaction_sorts_closed_segments(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    expected = _write(interaction_log, 0)
+    _write(interaction_log, 1)
+    # Активный сегмент (окно 1) не уплотняется
+    assert interaction_log.compact() == 1
+    stem = f"{T0:012d}-{SEGMENT_SECONDS}s-{os.getpid()}"
+    assert not (log_dir / f"{stem}.log").exists()
+
+    compacted = log_dir / f"{stem}-c.log"
+    records = [json.loads(line) for line in compacted.read_bytes().splitlines()]
+    assert [r['session_id'] for r in records] == [1, 1, 1, 2, 2, 2, 3, 3, 3]
+    index = json.loads((log_dir / f"{stem}-c.idx").read_text())
+    assert index['compacted'] and index['source'] == stem
+    assert index['source_size'] == index['size'] == compacted.stat().st_size
+    # Диапазон сеанса содержит только его записи, порядок внутри сеанса сохранен
+    start, end = index['sessions']['2']
+    assert [json.loads(line)['session_id']
+            for line in compacted.read_bytes()[start:end].splitlines()] == [2, 2, 2]
+    for session_id, steps in expected.items():
+        assert [r['step'] for r in interaction_log.read_session(session_id)][:3] == steps
+    assert interaction_log.compact() == 0
+    interaction_log.close()
+
+
+def test_compaction_finishes_interrupted_publish(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    _write(interaction_log, 0)
+    interaction_log.close()
+    stem = _files(log_dir, '.log')[0][:-len('.log')]
+    source = (log_dir / f"{stem}.log").read_bytes()
+    source_index = (log_dir / f"{stem}.idx").read_text()
+    interaction_log.compact()
+    # Сбой после публикации копии: исходный сегмент остался на месте
+    (log_dir / f"{stem}.log").write_bytes(source)
+    (log_dir / f"{stem}.idx").write_text(source_index)
+
+    reader = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    # Читатели предпочитают копию - записи не дублируются
+    assert len(list(reader.read_session(1))) == 3
+    assert len(list(read_log_directory(str(log_dir)))) == 9
+    assert list(reader.segment_info()) == [f"{stem}-c"]
+    reader.compact()
+    assert _files(log_dir, '.log') == [f"{stem}-c.log"]
+
+
+def test_compaction_guard_defers_unread_segments(log_dir):
+    interaction_log = InteractionLog(str(log_dir), segment_seconds=SEGMENT_SECONDS)
+    _write(interaction_log, 0)
+    interaction_log.close()
+    seen = []
+    interaction_log.set_compaction_guard(lambda stem, size: seen.append((stem, size)) or False)
+    assert interaction_log.compact() == 0
+    assert len(seen) == 1 and seen[0][1] == (log_dir / f"{seen[0][0]}.log").stat().st_size
+    interaction_log.set_compaction_guard(None)
+    assert interaction_log.compact() == 1
@@ -0,0 +1,98 @@
+"""
+Агрегаты взаимодействий: догоняющая обработка журнала по смещениям в сегментах,
+уплотнение учтенных сегментов без повторного счета и режим таблицы interactions
+"""
+import pytest
+
+from infrastructure import database_repository
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+from services.interaction_rollups import InteractionRollups
+
+SEGMENT_SECONDS = 60
+T0 = 1_000_000 * SEGMENT_SECONDS
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_repository, 'DATABASE_PATH', str(tmp_path / 'db.sqlite'))
+    db = DatabaseRepository()
+    db.init_database()
+    return db
+
+
+@pytest.fixture
+def interaction_log(tmp_path):
+    interaction_log = InteractionLog(str(tmp_path / 'log'), segment_seconds=SEGMENT_SECONDS)
+    yield interaction_log
+    interaction_log.close()
+
+
+def _session(db: DatabaseRepository) -> tuple:
+    user_id = db.create_user('owner', 'owner@test.com', 'x', 'owner')
+    product_id = db.create_product(user_id, 'product')
+    return product_id, db.create_test_session(user_id, product_id)
+
+
+def _append(interaction_log: InteractionLog, session_id: int, kinds: list, timestamp: float):
+    for i, kind in enumerate(kinds):
+        interaction_log.append(session_id, kind, {}, timestamp=timestamp + i)
+    interaction_log.flush()
+
+
+def test_catch_up_reads_only_new_segment_tails(db, interaction_log):
+    product_id, session_id = _session(db)
+    rollups = InteractionRollups(db, interaction_log, bucket_seconds=SEGMENT_SECONDS, interval=60)
+    _append(interaction_log, session_id, ['click', 'click', 'zoom'], T0)
+    assert rollups.catch_up() == 3
+    assert rollups.catch_up() == 0
+
+    # Дописанный хвост того же сегмента учитывается с сохраненного смещения
+    _append(interaction_log, session_id, ['rotate'], T0 + 10)
+    assert rollups.catch_up() == 1
+    stem, = db.get_rollup_segments('interaction_log')
+    assert db.get_rollup_segments('interaction_log')[stem] == \
+        interaction_log.segment_info()[stem]['size']
+
+    analytics = rollups.get_product_analytics(product_id)
+    assert analytics['by_type'] == {'click': 2, 'zoom': 1, 'rotate': 1}
+    scenario, = analytics['scenarios']
+    assert scenario['sessions'] == 1 and scenario['interactions'] == 4
+    assert scenario['max_duration'] == 10
+
+
+def test_compaction_waits_for_rollups_and_keeps_totals(db, interaction_log):
+    product_id, session_id = _session(db)
+    rollups = InteractionRollups(db, interaction_log, bucket_seconds=SEGMENT_SECONDS, interval=60)
+    interaction_log.set_compaction_guard(rollups.is_segment_processed)
+    _append(interaction_log, session_id, ['click'] * 5, T0)
+    # Запись в следующее окно закрывает первый сегмент
+    _append(interaction_log, session_id, ['zoom'], T0 + SEGMENT_SECONDS)
+
+    # Сегмент еще не учтен - уплотнение откладывается
+    assert interaction_log.compact() == 0
+    assert rollups.catch_up() == 6
+    assert interaction_log.compact() == 1
+
+    # Уплотненная копия наследует смещение исходного сегмента - записи не считаются повторно
+    assert rollups.catch_up() == 0
+    marks = db.get_rollup_segments('interaction_log')
+    assert sorted(marks) == sorted(interaction_log.segment_info())
+    assert any(stem.endswith('-c') for stem in marks)
+    assert rollups.get_product_analytics(product_id)['by_type'] == {'click': 5, 'zoom': 1}
+
+    _append(interaction_log, session_id, ['zoom'], T0 + SEGMENT_SECONDS + 1)
+    assert rollups.catch_up() == 1
+    assert rollups.get_product_analytics(product_id)['by_type'] == {'click': 5, 'zoom': 2}
+
+
+def test_table_source_follows_interaction_ids(db):
+    product_id, session_id = _session(db)
+    rollups = InteractionRollups(db, None, bucket_seconds=SEGMENT_SECONDS, interval=60,
+                                 batch_size=2)
+    db.add_interactions(session_id, [('click', '{}')] * 3)
+    assert rollups.catch_up() == 3
+    db.add_interactions(session_id, [('zoom', '{}')])
+    assert rollups.catch_up() == 1
+    assert rollups.get_product_analytics(product_id)['by_type'] == {'click': 3, 'zoom': 1}
+    assert rollups.get_stats()['source'] == 'interactions'
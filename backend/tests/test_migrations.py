@@ -0,0 +1,69 @@
+"""Версионированные миграции схемы: новая база, обновление с промежуточной версии, ошибки"""
+import sqlite3
+
+import pytest
+
+from infrastructure import migrations
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'db.sqlite'))
+    yield conn
+    conn.close()
+
+
+def _indexes(conn: sqlite3.Connection) -> set:
+    return {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+
+
+def _migrate_to(conn: sqlite3.Connection, version: int, monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATIONS',
+                        [m for m in migrations.MIGRATIONS if m[0] <= version])
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', version)
+    migrations.migrate(conn)
+    monkeypatch.undo()
+
+
+def test_new_database_gets_latest_schema(conn):
+    versions = [version for version, _description, _statements in migrations.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1)), 'версии идут подряд'
+    assert migrations.migrate(conn) == versions
+    assert migrations.get_schema_version(conn) == migrations.LATEST_VERSION
+    assert {'idx_interactions_session', 'idx_test_sessions_product', 'idx_products_catalog',
+            'idx_test_sessions_active'} <= _indexes(conn)
+    # Повторный запуск ничего не применяет
+    assert migrations.migrate(conn) == []
+
+
+def test_upgrade_keeps_existing_rows(conn, monkeypatch):
+    _migrate_to(conn, 4, monkeypatch)
+    assert migrations.get_schema_version(conn) == 4
+    conn.execute("""INSERT INTO users (username, email, password_hash, user_type)
+                    VALUES ('owner', 'owner@test.com', 'x', 'owner')""")
+    conn.execute("INSERT INTO products (owner_id, name) VALUES (1, 'product')")
+    conn.execute("""INSERT INTO test_sessions (user_id, product_id, created_at)
+                    VALUES (1, 1, '2024-01-01 00:00:00')""")
+    conn.commit()
+
+    assert migrations.migrate(conn) == list(range(5, migrations.LATEST_VERSION + 1))
+    row = conn.execute("""SELECT last_active_at, row_version, state_version
+                          FROM test_sessions""").fetchone()
+    # Время активности заполнено временем создания сеанса
+    assert row == (1704067200.0, 0, 0)
+
+
+def test_failed_migration_is_rolled_back(conn, monkeypatch):
+    failing = (migrations.LATEST_VERSION + 1, 'Ошибочная миграция', [
+        "CREATE TABLE extra (id INTEGER)",
+        "INSERT INTO missing_table VALUES (1)"
+    ])
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [failing])
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', failing[0])
+    with pytest.raises(sqlite3.OperationalError):
+        migrations.migrate(conn)
+    # Предыдущие миграции зафиксированы, изменения ошибочной - откатаны
+    assert migrations.get_schema_version(conn) == failing[0] - 1
+    assert conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'extra'").fetchone()[0] == 0
@@ -0,0 +1,168 @@
+"""
+Нагрузочная проверка согласованности сеансов: параллельные взаимодействия
+в нескольких сеансах (с кэшем движков и без него) и конфликт версий
+при записи состояния другим процессом. Используются временные база и журнал
+"""
+import json
+import random
+import threading
+
+import pytest
+
+import config
+from infrastructure import database_repository
+from infrastructure.database_repository import DatabaseRepository
+from infrastructure.interaction_log import InteractionLog
+from services.engine_cache import EngineCache
+from services.simulation_service import SessionConflictError, SimulationEngine, SimulationService
+
+SESSIONS = 4
+THREADS = 8
+INTERACTIONS_PER_THREAD = 40
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_repository, 'DATABASE_PATH', str(tmp_path / 'db.sqlite'))
+    db = DatabaseRepository()
+    db.init_database()
+    interaction_log = InteractionLog(str(tmp_path / 'log'), flush_every=16)
+    yield db, interaction_log
+    interaction_log.close()
+
+
+def _create_sessions(db: DatabaseRepository, service: SimulationService, count: int) -> list:
+    user_id = db.create_user('tester', 'tester@test.com', 'x', 'end_user')
+    product_id = db.create_product(user_id, 'product')
+    session_ids = []
+    for _ in range(count):
+        session_id = service.create_simulation_session(user_id, product_id)['session_id']
+        service.initialize_simulation(session_id, {'id': product_id, 'name': 'product'})
+        session_ids.append(session_id)
+    return session_ids
+
+
+def _interact(service: SimulationService, session_ids: list, seed: int, errors: list):
+    rng = random.Random(seed)
+    try:
+        for _ in range(INTERACTIONS_PER_THREAD):
+            session_id = rng.choice(session_ids)
+            kind = rng.choice(('click', 'rotate', 'zoom'))
+            result = service.process_interaction(session_id, kind, {'x': 1, 'angle': 90, 'level': 2.0},
+                                                 delta=True)
+            assert result['success']
+    except Exception as e:  # ошибки потоков проверяются в основном потоке
+        errors.append(e)
+
+
+@pytest.mark.parametrize('cache_size', [0, 2], ids=['no-cache', 'cache'])
+def test_concurrent_interactions_keep_state_and_log_consistent(storage, cache_size):
+    db, interaction_log = storage
+    # Кэш меньше числа сеансов - движки вытесняются и сохраняются во время нагрузки
+    engine_cache = EngineCache(cache_size, ttl=60.0, flush_interval=0.01) if cache_size else None
+    service = SimulationService(db, interaction_log, engine_cache)
+    session_ids = _create_sessions(db, service, SESSIONS)
+    if engine_cache:
+        engine_cache.start()
+
+    errors = []
+    threads = [threading.Thread(target=_interact, args=(service, session_ids, seed, errors))
+               for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if engine_cache:
+        engine_cache.close()
+    assert not errors
+
+    total = 0
+    for session_id in session_ids:
+        records = service.get_session_interactions(session_id)
+        versions = [record['version'] for record in records]
+        assert len(versions) == len(set(versions)), 'повторяющиеся версии в журнале'
+        # Состояние, восстановленное из базы и журнала, учитывает каждое событие
+        engine = SimulationEngine(session_id, db, interaction_log)
+        assert engine.state.current_step == len(records)
+        assert engine.state.version == max(versions)
+        assert sorted(record['step'] for record in records) == list(range(len(records)))
+        total += len(records)
+    assert total == THREADS * INTERACTIONS_PER_THREAD
+
+
+def test_external_writer_causes_conflict(storage, monkeypatch):
+    db, interaction_log = storage
+    engine_cache = EngineCache(8, ttl=60.0, flush_interval=60.0)
+    service = SimulationService(db, interaction_log, engine_cache)
+    session_id = _create_sessions(db, service, 1)[0]
+    service.process_interaction(session_id, 'click', {'x': 1})
+
+    # Другой процесс записывает состояние сеанса: row_version в базе меняется,
+    # а движок в кэше остается на прежней версии
+    session = db.get_test_session(session_id)
+    assert db.update_test_session_data(session_id, session['session_data'])
+
+    monkeypatch.setattr(config, 'SESSION_CONFLICT_RETRIES', 0)
+    with pytest.raises(SessionConflictError):
+        service.initialize_simulation(session_id, {'id': 1, 'name': 'product'})
+    assert service.get_session_lock_stats()['conflicts'] == 1
+
+    # После конфликта движок перезагружен - повторная запись проходит
+    service.initialize_simulation(session_id, {'id': 1, 'name': 'product'})
+    state = json.loads(db.get_test_session(session_id)['session_data'])
+    assert state['initialized'] and state['current_step'] == 0
+    engine_cache.close()
+
+
+def test_two_engines_conflict_on_every_write(storage):
+    db, interaction_log = storage
+    service = SimulationService(db, interaction_log)
+    session_id = _create_sessions(db, service, 1)[0]
+
+    # Два движка одного сеанса (например, в разных процессах) пишут по очереди;
+    # событий больше SESSION_SNAPSHOT_EVERY - проверка идет и между снимками
+    engines = [SimulationEngine(session_id, db, interaction_log) for _ in range(2)]
+    total = config.SESSION_SNAPSHOT_EVERY * 2 + 10
+    conflicts = 0
+    for i in range(total):
+        engine = engines[(i // 3) % 2]
+        try:
+            engine.process_interaction('click', {'x': i})
+        except SessionConflictError:
+            # Устаревший движок ничего не записал и перезагружен - повтор проходит
+            conflicts += 1
+            engine.process_interaction('click', {'x': i})
+    assert conflicts == total // 3
+
+    records = service.get_session_interactions(session_id)
+    versions = [record['version'] for record in records]
+    assert len(records) == total
+    assert len(versions) == len(set(versions)), 'повторяющиеся версии в журнале'
+    engine = SimulationEngine(session_id, db, interaction_log)
+    assert engine.state.current_step == total
+    assert engine.state.version == max(versions)
+
+
+def test_confirmed_version_missing_from_log(storage, monkeypatch):
+    db, interaction_log = storage
+    service = SimulationService(db, interaction_log)
+    session_id = _create_sessions(db, service, 1)[0]
+    engine = SimulationEngine(session_id, db, interaction_log)
+    engine.process_interaction('click', {'x': 1})
+
+    # Другой процесс подтвердил версию в базе, но еще не дописал событие в журнал
+    row_version = db.get_test_session(session_id)['row_version']
+    assert db.claim_test_session_version(session_id, row_version, engine.state.version + 1)
+    with pytest.raises(SessionConflictError):
+        engine.process_interaction('click', {'x': 2})
+    assert engine.stale
+    with pytest.raises(SessionConflictError):
+        engine.process_interaction('click', {'x': 2})
+
+    # Событие так и не появилось: после ожидания версии продолжаются после подтвержденной
+    monkeypatch.setattr('services.simulation_service.UNCOMMITTED_EVENTS_WAIT', 0.0)
+    engine.reload()
+    result = engine.process_interaction('click', {'x': 2}, delta=True)
+    assert result['version'] == engine.state.version
+    versions = [record['version'] for record in service.get_session_interactions(session_id)]
+    assert len(versions) == len(set(versions)) == 2
@@ -0,0 +1,140 @@
+"""Поток-писатель SQLite: групповая фиксация, ошибки операций, BEGIN и COMMIT"""
+import sqlite3
+import threading
+
+import pytest
+
+from infrastructure.write_queue import WriteQueue, WriteQueueFullError
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'db.sqlite')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        PRAGMA journal_mode = WAL;
+        CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT);
+        CREATE TABLE parents (id INTEGER PRIMARY KEY);
+        CREATE TABLE children (
+            id INTEGER PRIMARY KEY,
+            parent_id INTEGER REFERENCES parents(id) DEFERRABLE INITIALLY DEFERRED
+        );
+    """)
+    conn.close()
+    return path
+
+
+def _queue(path: str, **kwargs) -> WriteQueue:
+    def connect() -> sqlite3.Connection:
+        conn = sqlite3.connect(path, timeout=0, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+    options = dict(max_size=100, batch_size=10, flush_interval=0.05, put_timeout=0.1)
+    options.update(kwargs)
+    return WriteQueue(connect, **options)
+
+
+def _insert(value: str):
+    return lambda conn: conn.execute("INSERT INTO items (value) VALUES (?)", (value,)).lastrowid
+
+
+def _count(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+def test_operations_are_grouped_into_batches(database):
+    write_queue = _queue(database)
+    futures = [write_queue.submit(_insert(str(i))) for i in range(35)]
+    ids = [future.result(timeout=5) for future in futures]
+    write_queue.close()
+
+    assert ids == sorted(ids) and len(set(ids)) == 35
+    assert _count(database) == 35
+    stats = write_queue.get_stats()
+    assert stats['committed'] == 35 and stats['failed'] == 0
+    assert stats['batches'] < 35 and stats['max_batch'] <= 10
+
+
+def test_failed_operation_does_not_cancel_batch(database):
+    write_queue = _queue(database)
+
+    def failing(conn: sqlite3.Connection):
+        conn.execute("INSERT INTO items (value) VALUES ('partial')")
+        raise ValueError('ошибка операции')
+
+    futures = [write_queue.submit(_insert('a')), write_queue.submit(failing),
+               write_queue.submit(_insert('b'))]
+    assert futures[0].result(timeout=5) and futures[2].result(timeout=5)
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    write_queue.close()
+
+    # Изменения неудачной операции откатаны до ее точки сохранения
+    with sqlite3.connect(database) as conn:
+        values = [row[0] for row in conn.execute("SELECT value FROM items ORDER BY id")]
+    assert values == ['a', 'b']
+    assert write_queue.get_stats()['failed'] == 1
+
+
+def test_begin_failure_fails_whole_batch(database):
+    # Другое соединение держит блокировку записи: BEGIN IMMEDIATE писателя не проходит
+    blocker = sqlite3.connect(database)
+    blocker.execute("BEGIN IMMEDIATE")
+    write_queue = _queue(database)
+    futures = [write_queue.submit(_insert(str(i))) for i in range(3)]
+    for future in futures:
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(timeout=5)
+    blocker.rollback()
+    blocker.close()
+
+    # После ошибки поток-писатель продолжает работу
+    assert write_queue.submit(_insert('after')).result(timeout=5)
+    write_queue.close()
+    assert _count(database) == 1
+    assert write_queue.get_stats()['failed'] == 3
+
+
+def test_commit_failure_fails_completed_operations(database):
+    write_queue = _queue(database, flush_interval=0.2)
+    # Отложенная проверка внешнего ключа срабатывает только при COMMIT
+    orphan = write_queue.submit(
+        lambda conn: conn.execute("INSERT INTO children (parent_id) VALUES (42)"))
+    lost = write_queue.submit(_insert('lost'))
+    for future in (orphan, lost):
+        with pytest.raises(sqlite3.IntegrityError):
+            future.result(timeout=5)
+    write_queue.close()
+    assert _count(database) == 0
+
+
+def test_full_queue_rejects_after_timeout(database):
+    write_queue = _queue(database, max_size=1, batch_size=1, put_timeout=0.05)
+    started, gate = threading.Event(), threading.Event()
+
+    def block(conn: sqlite3.Connection):
+        started.set()
+        gate.wait(5)
+
+    blocked = write_queue.submit(block)
+    assert started.wait(5)
+    queued = write_queue.submit(_insert('queued'))
+    with pytest.raises(WriteQueueFullError):
+        write_queue.submit(_insert('rejected'))
+    gate.set()
+    blocked.result(timeout=5)
+    assert queued.result(timeout=5)
+    write_queue.close()
+    stats = write_queue.get_stats()
+    assert stats['full_waits'] == 1 and stats['rejected'] == 1
+
+
+def test_close_drains_queue(database):
+    write_queue = _queue(database, flush_interval=1.0)
+    futures = [write_queue.submit(_insert(str(i))) for i in range(5)]
+    write_queue.close()
+    assert all(future.done() for future in futures)
+    assert _count(database) == 5
+    with pytest.raises(RuntimeError):
+        write_queue.submit(_insert('late'))
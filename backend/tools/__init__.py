@@ -0,0 +1,3 @@
+"""
+Служебные инструменты (нагрузочные стенды, выгрузки)
+"""
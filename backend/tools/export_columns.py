@@ -0,0 +1,73 @@
+"""
+Выгрузка сеансов и взаимодействий в столбцы .npy (архив tar).
+
+Формат совпадает с GET /api/products/{product_id}/export: таблица sessions,
+таблицы interactions/<тип> с типизированными столбцами data.<поле> и
+manifest.json с описанием частей. Архив пишется потоком, частями по
+EXPORT_CHUNK_ROWS строк.
+
+Пример:
+    python backend/tools/export_columns.py --database backend/database.db \\
+        --log-dir backend/interaction_log --product 1 --output product-1.tar
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Выгрузка сеансов и взаимодействий в столбцы .npy")
+    parser.add_argument('--database', help="база SQLite (по умолчанию DATABASE_PATH)")
+    parser.add_argument('--log-dir', help="каталог журнала взаимодействий "
+                                          "(по умолчанию INTERACTION_LOG_DIR)")
+    parser.add_argument('--no-log', action='store_true',
+                        help="взаимодействия из таблицы interactions, а не из журнала")
+    parser.add_argument('--product', type=int, help="id продукта (по умолчанию - все)")
+    parser.add_argument('--start', type=float, help="начало интервала (unix-время)")
+    parser.add_argument('--end', type=float, help="конец интервала (unix-время, не включая)")
+    parser.add_argument('--chunk-rows', type=int, help="строк в одной части столбцов")
+    parser.add_argument('--output', required=True, help="файл архива ('-' - стандартный вывод)")
+    args = parser.parse_args(argv)
+
+    # До импорта модулей приложения: config читает переменные при импорте
+    if args.database:
+        os.environ['DATABASE_PATH'] = os.path.abspath(args.database)
+    if args.log_dir:
+        os.environ['INTERACTION_LOG_DIR'] = os.path.abspath(args.log_dir)
+
+    import config
+    from infrastructure.database_repository import DatabaseRepository
+    from infrastructure.interaction_log import InteractionLog
+    from services.columnar_export import ColumnarExporter
+
+    db_repository = DatabaseRepository()
+    interaction_log = None if args.no_log else InteractionLog(config.INTERACTION_LOG_DIR)
+    exporter = ColumnarExporter(db_repository, interaction_log,
+                                args.chunk_rows or config.EXPORT_CHUNK_ROWS)
+
+    started = time.monotonic()
+    written = 0
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        for chunk in exporter.export(args.product, args.start, args.end):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        if interaction_log is not None:
+            interaction_log.close()
+        db_repository.close_write_queue()
+
+    print(f"Выгружено {written} байт за {time.monotonic() - started:.2f} с", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""
+Стенд воспроизведения взаимодействий для нагрузочной проверки симуляции.
+
+Воспроизводит записанные (таблица interactions или журнал взаимодействий)
+либо синтетические сеансы против приложения в том же процессе через ASGI
+и выводит пропускную способность, задержки p50/p95/p99 по эндпоинтам и
+объем записи на одно взаимодействие. Приложение работает с временной базой
+и временным журналом, исходные данные не изменяются.
+
+Пример:
+    python backend/tools/replay_harness.py --synthetic 200 --length 50 --concurrency 16
+    python backend/tools/replay_harness.py --database backend/database.db --sessions 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from calendar import timegm
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# (interaction_type, interaction_data, timestamp)
+RecordedInteraction = Tuple[str, Dict[str, Any], float]
+
+
+# --- Источники сеансов ---
+
+def _parse_db_timestamp(value: Optional[str]) -> float:
+    if not value:
+        return 0.0
+    return float(timegm(time.strptime(value[:19], '%Y-%m-%d %H:%M:%S')))
+
+
+def load_sessions_from_database(path: str, limit: Optional[int] = None) -> List[List[RecordedInteraction]]:
+    """Сеансы из таблицы interactions (только чтение)"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        sessions: Dict[int, List[RecordedInteraction]] = defaultdict(list)
+        for session_id, interaction_type, interaction_data, timestamp in conn.execute(
+                "SELECT session_id, interaction_type, interaction_data, timestamp "
+                "FROM interactions ORDER BY session_id, id"):
+            try:
+                data = json.loads(interaction_data) if interaction_data else {}
+            except ValueError:
+                data = {}
+            sessions[session_id].append((interaction_type, data, _parse_db_timestamp(timestamp)))
+    finally:
+        conn.close()
+    result = list(sessions.values())
+    return result[:limit] if limit else result
+
+
+def load_sessions_from_log(directory: str, limit: Optional[int] = None) -> List[List[RecordedInteraction]]:
+    """Сеансы из журнала взаимодействий (только чтение)"""
+    from infrastructure.interaction_log import read_log_directory
+
+    sessions: Dict[int, List[RecordedInteraction]] = defaultdict(list)
+    for record in read_log_directory(directory):
+        sessions[record['session_id']].append(
+            (record['interaction_type'], record['interaction_data'], record['timestamp']))
+    result = [sorted(items, key=lambda item: item[2]) for items in sessions.values()]
+    return result[:limit] if limit else result
+
+
+def synthetic_sessions(count: int, length: int, seed: int = 0) -> List[List[RecordedInteraction]]:
+    """Синтетические сеансы: клики, повороты и масштабирование с интервалом ~100 мс"""
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        timestamp = 0.0
+        interactions = []
+        for _ in range(length):
+            kind = rng.choice(('click', 'rotate', 'zoom'))
+            if kind == 'click':
+                data = {'x': rng.randint(0, 1920), 'y': rng.randint(0, 1080)}
+            elif kind == 'rotate':
+                data = {'angle': rng.randint(0, 359)}
+            else:
+                data = {'level': round(rng.uniform(0.5, 4.0), 2)}
+            timestamp += rng.expovariate(10.0)
+            interactions.append((kind, data, timestamp))
+        sessions.append(interactions)
+    return sessions
+
+
+# --- Измерение записи ---
+
+def _process_bytes_written() -> Optional[int]:
+    """Байты, записанные процессом (Linux /proc/self/io), или None"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _storage_size(paths: List[str]) -> int:
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# --- Воспроизведение ---
+
+class ReplayHarness:
+    """Воспроизведение сеансов против приложения через ASGI-транспорт"""
+
+    def __init__(self, app, concurrency: int, pacing: str, speed: float,
+                 interval: float, mode: str, batch_size: int):
+        self.app = app
+        self.concurrency = concurrency
+        self.pacing = pacing
+        self.speed = speed
+        self.interval = interval
+        self.mode = mode
+        self.batch_size = batch_size
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.interactions = 0
+
+    async def _request(self, client, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return response.json()
+
+    async def _pause(self, previous: Optional[float], current: float):
+        if self.pacing == 'recorded' and previous is not None:
+            await asyncio.sleep(max(0.0, current - previous) / self.speed)
+        elif self.pacing == 'fixed':
+            await asyncio.sleep(self.interval)
+
+    async def _replay_session(self, client, user_id: int, product_id: int,
+                              interactions: List[RecordedInteraction]):
+        created = await self._request(client, 'create-session', 'POST',
+                                      '/api/simulation/create-session',
+                                      json={'user_id': user_id, 'product_id': product_id})
+        if not created:
+            return
+        session_id = created['session_id']
+        await self._request(client, 'initialize', 'POST',
+                            f'/api/simulation/{session_id}/initialize')
+
+        previous = None
+        if self.batch_size > 1:
+            for start in range(0, len(interactions), self.batch_size):
+                chunk = interactions[start:start + self.batch_size]
+                await self._pause(previous, chunk[0][2])
+                previous = chunk[-1][2]
+                await self._request(
+                    client, 'interact/batch', 'POST',
+                    f'/api/simulation/{session_id}/interact/batch?mode={self.mode}',
+                    json={'interactions': [{'interaction_type': t, 'interaction_data': d}
+                                           for t, d, _ in chunk]})
+                self.interactions += len(chunk)
+        else:
+            for interaction_type, interaction_data, timestamp in interactions:
+                await self._pause(previous, timestamp)
+                previous = timestamp
+                await self._request(
+                    client, 'interact', 'POST',
+                    f'/api/simulation/{session_id}/interact?mode={self.mode}',
+                    json={'interaction_type': interaction_type,
+                          'interaction_data': interaction_data})
+                self.interactions += 1
+
+        await self._request(client, 'finalize', 'POST',
+                            f'/api/simulation/{session_id}/finalize')
+
+    async def run(self, sessions: List[List[RecordedInteraction]],
+                  user_id: int, product_id: int) -> float:
+        """Воспроизведение всех сеансов; возвращает длительность в секундах"""
+        import httpx
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        transport = httpx.ASGITransport(app=self.app)
+
+        async def worker(interactions):
+            async with semaphore:
+                await self._replay_session(client, user_id, product_id, interactions)
+
+        async with httpx.AsyncClient(transport=transport, base_url='http://replay') as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(interactions) for interactions in sessions))
+            return time.perf_counter() - started
+
+    def endpoint_report(self) -> Dict[str, Dict[str, Any]]:
+        report = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            report[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'p50_ms': _percentile(values, 0.50) * 1000,
+                'p95_ms': _percentile(values, 0.95) * 1000,
+                'p99_ms': _percentile(values, 0.99) * 1000,
+                'max_ms': values[-1] * 1000
+            }
+        return report
+
+
+async def _run(args, sessions: List[List[RecordedInteraction]], workdir: str) -> Dict[str, Any]:
+    import main
+
+    await main.app.router.startup()
+    try:
+        owner_id = main.db_repository.create_user(
+            f'replay_owner_{os.getpid()}', f'replay_owner_{os.getpid()}@replay', '', 'owner')
+        user_id = main.db_repository.create_user(
+            f'replay_user_{os.getpid()}', f'replay_user_{os.getpid()}@replay', '', 'end_user')
+        product_id = main.db_repository.create_product_with_details({
+            'owner_id': owner_id, 'name': 'Replay product', 'status': 'verified'})
+
+        storage_paths = [os.path.join(workdir, name) for name in
+                         ('replay.db', 'replay.db-wal', 'interaction_log')]
+        storage_before = _storage_size(storage_paths)
+        written_before = _process_bytes_written()
+
+        harness = ReplayHarness(main.app, args.concurrency, args.pacing, args.speed,
+                                args.interval, args.mode, args.batch)
+        duration = await harness.run(sessions, user_id, product_id)
+    finally:
+        # Остановка сбрасывает отложенные записи (кэш движков, журнал, очередь записи)
+        await main.app.router.shutdown()
+
+    written_after = _process_bytes_written()
+    storage_after = _storage_size(storage_paths)
+    interactions = harness.interactions
+    return {
+        'sessions': len(sessions),
+        'interactions': interactions,
+        'duration_s': duration,
+        'interactions_per_s': interactions / duration if duration else 0.0,
+        'endpoints': harness.endpoint_report(),
+        'bytes_written_per_interaction': (
+            (written_after - written_before) / interactions
+            if interactions and written_before is not None else None),
+        'storage_growth_per_interaction': (
+            (storage_after - storage_before) / interactions if interactions else None)
+    }
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"Сеансов: {report['sessions']}, взаимодействий: {report['interactions']}, "
+          f"время: {report['duration_s']:.2f} с, "
+          f"пропускная способность: {report['interactions_per_s']:.1f} взаимодействий/с")
+    print(f"{'эндпоинт':<16}{'запросы':>9}{'ошибки':>8}{'p50, мс':>10}{'p95, мс':>10}"
+          f"{'p99, мс':>10}{'max, мс':>10}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<16}{stats['requests']:>9}{stats['errors']:>8}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    if report['bytes_written_per_interaction'] is not None:
+        print(f"Записано байт на взаимодействие: {report['bytes_written_per_interaction']:.0f}")
+    if report['storage_growth_per_interaction'] is not None:
+        print(f"Рост хранилища на взаимодействие: {report['storage_growth_per_interaction']:.0f} байт")
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Воспроизведение взаимодействий против симуляции")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--database', help="база SQLite с таблицей interactions")
+    source.add_argument('--log-dir', help="каталог журнала взаимодействий")
+    source.add_argument('--synthetic', type=int, metavar='N', help="N синтетических сеансов")
+    parser.add_argument('--length', type=int, default=50,
+                        help="взаимодействий в синтетическом сеансе")
+    parser.add_argument('--sessions', type=int,
+                        help="число воспроизводимых сеансов (записанные повторяются по кругу)")
+    parser.add_argument('--concurrency', type=int, default=8, help="одновременных сеансов")
+    parser.add_argument('--pacing', choices=('none', 'recorded', 'fixed'), default='none',
+                        help="паузы между взаимодействиями")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="ускорение записанных пауз (для --pacing recorded)")
+    parser.add_argument('--interval', type=float, default=0.1,
+                        help="пауза, с (для --pacing fixed)")
+    parser.add_argument('--mode', choices=('full', 'delta'), default='full',
+                        help="формат ответа /interact")
+    parser.add_argument('--batch', type=int, default=1,
+                        help="размер пакета /interact/batch (1 - по одному запросу)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="вывод отчета в JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='replay-') as workdir:
+        # До импорта модулей приложения: config читает переменные при импорте
+        os.environ['DATABASE_PATH'] = os.path.join(workdir, 'replay.db')
+        os.environ['INTERACTION_LOG_DIR'] = os.path.join(workdir, 'interaction_log')
+
+        if args.database:
+            sessions = load_sessions_from_database(args.database)
+        elif args.log_dir:
+            sessions = load_sessions_from_log(args.log_dir)
+        else:
+            sessions = synthetic_sessions(args.synthetic, args.length, args.seed)
+        sessions = [s for s in sessions if s]
+        if not sessions:
+            parser.error("нет сеансов для воспроизведения")
+        if args.sessions:
+            sessions = [sessions[i % len(sessions)] for i in range(args.sessions)]
+
+        report = asyncio.run(_run(args, sessions, workdir))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+    return report
+
+
+if __name__ == '__main__':
+    main()
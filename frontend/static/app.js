@@ -405,22 +405,46 @@ async function runTesting() {
     
     // Последовательность тестовых взаимодействий
     const tests = [
-        { type: 'click', data: { x: 100, y: 100 }, delay: 500 },
-        { type: 'click', data: { x: 200, y: 200 }, delay: 500 },
-        { type: 'rotate', data: { angle: 90 }, delay: 500 },
-        { type: 'rotate', data: { angle: 180 }, delay: 500 },
-        { type: 'zoom', data: { level: 2.0 }, delay: 500 },
-        { type: 'zoom', data: { level: 1.0 }, delay: 500 },
+        { type: 'click', data: { x: 100, y: 100 } },
+        { type: 'click', data: { x: 200, y: 200 } },
+        { type: 'rotate', data: { angle: 90 } },
+        { type: 'rotate', data: { angle: 180 } },
+        { type: 'zoom', data: { level: 2.0 } },
+        { type: 'zoom', data: { level: 1.0 } },
     ];
 
-    for (let i = 0; i < tests.length; i++) {
-        const test = tests[i];
-        addLog(`Тест ${i + 1}/${tests.length}: ${test.type}`, 'info');
-        await processInteraction(test.type, test.data);
-        
-        if (i < tests.length - 1) {
-            await new Promise(resolve => setTimeout(resolve, test.delay));
+    // Весь сценарий отправляется одним пакетом
+    try {
+        const response = await fetch(`${API_BASE}/simulation/${currentSessionId}/interact/batch`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                interactions: tests.map(test => ({
+                    interaction_type: test.type,
+                    interaction_data: test.data
+                }))
+            })
+        });
+
+        if (!response.ok) {
+            const error = await response.json();
+            addLog(`Ошибка: ${error.detail}`, 'error');
+            return;
+        }
+
+        const result = await response.json();
+        if (!result.success) {
+            addLog(`Ошибка: ${result.error}`, 'error');
+            return;
         }
+        result.results.forEach((item, i) => {
+            addLog(`Тест ${i + 1}/${tests.length}: ${tests[i].type} - ${item.result.response}`, 'success');
+        });
+    } catch (error) {
+        addLog('Ошибка соединения с сервером', 'error');
+        return;
     }
 
     addLog('Автоматическое тестирование завершено', 'success');